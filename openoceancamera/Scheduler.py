@@ -1,69 +1,336 @@
-from datetime import date, datetime, timezone
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import clock
+
+DATETIME_FORMAT = "%Y-%m-%d-%H:%M:%S"
+# Longest single wait in wait_until. The wait itself runs on the monotonic
+# clock, so this bounds how late a wakeup can be if the wall clock is moved
+# (syncTime, RTC restore) while the camera thread is asleep.
+MAX_WAIT_SECONDS = 60
+# Slot settings for the optional capture modes. They are None when the
+# slot does not use the mode.
+#   burst: {"fps": 10, "duration": 5, "interval": 60} takes `duration`
+#          seconds of stills at `fps`, every `interval` seconds (back to
+#          back if 0) through the slot.
+#   segment_seconds, segment_mb: split a video slot into files of at most
+#          this many seconds / megabytes.
+#   trigger: {"pre_seconds": 10, "post_seconds": 20, "motion": 0.02,
+#          "luminosity_change": 50, "depth_change": 0.5} makes a video slot
+#          keep video in memory and save it only around motion in the
+#          picture (fraction of it changed) or jumps in the sensor readings.
+#   suppress: {"threshold": 0.01, "mode": "thumbnail", "max_skipped": 60}
+#          makes a timelapse slot store a thumbnail instead of (or, with
+#          "skip", nothing for) frames where less than `threshold` of the
+#          picture changed since the last full frame.
+#   raw: true makes a timelapse slot capture from the still port with the
+#          sensor's raw Bayer data appended to each JPEG (see tools/bayer.py).
+#   bracket: {"compensation": [-12, 0, 12]} or {"shutter_speeds": [2000,
+#          8000, 32000]} makes a timelapse slot take a bundle of frames
+#          back to back at these exposures instead of each photo, for
+#          merging with tools/hdr_merge.py.
+OPTIONAL_SETTINGS = ("burst", "segment_seconds", "segment_mb", "trigger", "suppress", "raw", "bracket")
+
+
+def parse_slot_settings(slot: Dict[str, Any]) -> Dict[str, Any]:
+    """Reads the camera settings of a schedule.json entry, filling in defaults."""
+    frame = {}
+    frame["iso"] = slot.get("iso", 0)
+    frame["frequency"] = slot.get("frequency", 10)
+    frame["shutter_speed"] = slot.get("shutter_speed", 0)
+    frame["video"] = slot.get("video")
+    frame["upload"] = slot.get("upload", False)
+    frame["light"] = slot.get("light", 0)
+    frame["wiper"] = slot.get("wiper", False)
+    frame["exposure_mode"] = slot.get("exposure_mode", "auto")
+    frame["exposure_compensation"] = slot.get("exposure_compensation", 0)
+    frame["framerate"] = slot.get("framerate", 0)
+    resolution = slot.get("resolution", {"x": 1920, "y": 1080})
+    frame["resolution"]= (resolution["x"], resolution["y"])
+    for key in OPTIONAL_SETTINGS:
+        frame[key] = slot.get(key)
+    return frame
+
+
+class RecurringSlot(object):
+    """A slot that repeats every `every` between `begin` and `end`, lasting `duration` each time.
+
+    This is the schedule.json equivalent of a WittyPi .wpi loop. In the
+    schedule it is written like a normal slot with an extra "repeat" entry,
+    where both values are in minutes:
+
+        {"start": "2021-08-01-00:00:00", "stop": "2022-08-01-00:00:00",
+         "repeat": {"every": 120, "duration": 10}, "frequency": 10}
+
+    Occurrences are computed on demand from their number, so a rule costs
+    the same to load and to query whatever the length of the deployment.
+    """
+
+    def __init__(self, settings: Dict[str, Any], begin: datetime, end: datetime,
+                 every: timedelta, duration: timedelta):
+        if every <= timedelta(0) or duration <= timedelta(0):
+            raise ValueError("Recurring slot 'every' and 'duration' must be positive")
+        if duration > every:
+            raise ValueError("Recurring slot 'duration' must not be longer than 'every'")
+        self.settings = settings
+        self.begin = begin
+        self.end = end
+        self.every = every
+        self.duration = duration
+
+    @classmethod
+    def from_json(cls, slot: Dict[str, Any]) -> "RecurringSlot":
+        repeat = slot["repeat"]
+        return cls(
+            settings=parse_slot_settings(slot),
+            begin=datetime.strptime(slot["start"], DATETIME_FORMAT),
+            end=datetime.strptime(slot["stop"], DATETIME_FORMAT),
+            every=timedelta(minutes=repeat["every"]),
+            duration=timedelta(minutes=repeat["duration"]),
+        )
+
+    def occurrence(self, number: int) -> Optional[Dict[str, Any]]:
+        """Returns occurrence `number` (counting from 0) as a slot, or None if it is past the end."""
+        start = self.begin + number * self.every
+        if number < 0 or start >= self.end:
+            return None
+        frame = self.settings.copy()
+        frame["start"] = start
+        frame["stop"] = min(start + self.duration, self.end)
+        return frame
+
+    def first_unfinished(self, now: datetime) -> int:
+        """Returns the number of the first occurrence that has not stopped by `now`."""
+        if now <= self.begin + self.duration:
+            return 0
+        # ceil((now - begin - duration) / every), using timedelta floor division
+        return -((self.begin + self.duration - now) // self.every)
+
+    def occurrences(self, now: datetime) -> Iterator[Dict[str, Any]]:
+        """Yields the occurrences that have not stopped by `now`, in order."""
+        number = self.first_unfinished(now)
+        frame = self.occurrence(number)
+        while frame is not None:
+            yield frame
+            number += 1
+            frame = self.occurrence(number)
 
 
 class Scheduler(object):
+    """Holds the camera schedule and answers "what runs when" queries.
+
+    The slots are kept sorted by start time together with a small index
+    (start times, stop times and the running maximum of the stop times),
+    built once whenever the schedule is loaded. Lookups use binary search
+    on that index, so the cost of the queries made by the camera thread
+    does not grow with the number of slots in the schedule.
+
+    Recurring slots are not expanded when the schedule is loaded. Each rule
+    keeps a cursor on its current occurrence, and only the running and the
+    upcoming occurrence of every rule are placed in schedule_data. The
+    window is moved forward as time passes.
+
+    Instead of polling, the camera thread can ask for the next slot
+    boundary and block in wait_until until then. Loading a new schedule, or
+    calling wake() from another thread, ends the wait early.
+    """
+
     def __init__(self):
         self.schedule_data  = []
+        self.recurring_slots = []
+        self._fixed_slots = []
+        self._cursors = []
+        self._window = []
+        self._starts = []
+        self._stops = []
+        # _reach[i] is the latest stop time of any slot in schedule_data[:i+1]
+        self._reach = []
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
 
-    def should_start(self):
-        for i in range(len(self.schedule_data)):
-            if (
-                self.schedule_data[i]["start"]
-                <= datetime.now()
-                <= self.schedule_data[i]["stop"]
-            ):
+    def _build_index(self) -> None:
+        self.schedule_data = self._fixed_slots + [
+            frame for frames in self._window for frame in frames
+        ]
+        self.schedule_data.sort(key=lambda x: x["start"])
+        self._starts = [slot["start"] for slot in self.schedule_data]
+        self._stops = [slot["stop"] for slot in self.schedule_data]
+        self._reach = []
+        reach = None
+        for stop in self._stops:
+            if reach is None or stop > reach:
+                reach = stop
+            self._reach.append(reach)
+
+    def _advance(self, now: datetime) -> None:
+        """Moves the recurring slot cursors to `now`, rebuilding the index if the window changed."""
+        changed = False
+        for i, rule in enumerate(self.recurring_slots):
+            number = rule.first_unfinished(now)
+            if number == self._cursors[i]:
+                continue
+            self._cursors[i] = number
+            # The first unfinished occurrence is either running or upcoming;
+            # in the first case the one after it is the upcoming one.
+            frames = []
+            for frame in (rule.occurrence(number), rule.occurrence(number + 1)):
+                if frame is not None:
+                    frames.append(frame)
+            self._window[i] = frames
+            changed = True
+        if changed:
+            self._build_index()
+
+    def active_slot_index(self, now: Optional[datetime] = None) -> int:
+        """Returns the index of the slot running at `now`, or -1 if there is none.
+
+        If slots overlap, the one that started most recently wins.
+        """
+        if now is None:
+            now = clock.now()
+        with self._lock:
+            self._advance(now)
+            i = bisect_right(self._starts, now) - 1
+            # Only slots that overlap one another need the backwards walk; for a
+            # schedule without overlaps this loop runs at most once.
+            while i >= 0 and self._reach[i] >= now:
+                if self._stops[i] >= now:
+                    return i
+                i -= 1
+            return -1
+
+    def next_slot_index(self, now: Optional[datetime] = None) -> int:
+        """Returns the index of the first slot starting at or after `now`, or -1."""
+        if now is None:
+            now = clock.now()
+        with self._lock:
+            self._advance(now)
+            i = bisect_left(self._starts, now)
+            if i < len(self._starts):
                 return i
-        return -1
+            return -1
+
+    def should_start(self, now: Optional[datetime] = None) -> int:
+        return self.active_slot_index(now)
 
     def get_slot(self, index):
         return self.schedule_data[index]
 
+    def active_slot(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Returns the slot running at `now`, or None.
+
+        Unlike should_start followed by get_slot, this cannot be split by a
+        schedule reload from another thread.
+        """
+        with self._lock:
+            index = self.active_slot_index(now)
+            if index >= 0:
+                return self.schedule_data[index]
+            return None
+
     def load_scheduler_data(self, data):
-        self.schedule_data = []
+        fixed_slots = []
+        recurring_slots = []
         for slot in data:
-            frame = {}
-            frame["start"] = datetime.strptime(slot["start"], "%Y-%m-%d-%H:%M:%S")
-            frame["stop"] = datetime.strptime(slot["stop"], "%Y-%m-%d-%H:%M:%S")
-            frame["iso"] = slot.get("iso", 0)
-            frame["frequency"] = slot.get("frequency", 10)
-            frame["shutter_speed"] = slot.get("shutter_speed", 0)
-            frame["video"] = slot.get("video")
-            frame["upload"] = slot.get("upload", False)
-            frame["light"] = slot.get("light", 0)
-            frame["wiper"] = slot.get("wiper", False)
-            frame["exposure_mode"] = slot.get("exposure_mode", "auto")
-            frame["exposure_compensation"] = slot.get("exposure_compensation", 0)
-            frame["framerate"] = slot.get("framerate", 0)
-            resolution = slot.get("resolution", {"x": 1920, "y": 1080})
-            frame["resolution"]= (resolution["x"], resolution["y"])
-            self.schedule_data.append(frame.copy())
-
-    def next_future_timeslot(self):
-        future_slots = []
-        # Get the future slots
-        for slot in self.schedule_data:
-            if slot["start"] >= datetime.now():
-                future_slots.append(slot)
-        # Sorts the slots in case they may not be
-        future_slots = sorted(future_slots, key=lambda x: x["start"])
-        if len(future_slots):
-            return future_slots[0]
-        else:
+            if slot.get("repeat"):
+                recurring_slots.append(RecurringSlot.from_json(slot))
+                continue
+            frame = parse_slot_settings(slot)
+            frame["start"] = datetime.strptime(slot["start"], DATETIME_FORMAT)
+            frame["stop"] = datetime.strptime(slot["stop"], DATETIME_FORMAT)
+            fixed_slots.append(frame)
+        self.load_slots(fixed_slots, recurring_slots)
+
+    def load_slots(self, fixed_slots: List[Dict[str, Any]], recurring_slots: List[RecurringSlot]) -> None:
+        """Replaces the schedule with already parsed slots, e.g. from a compiled schedule plan."""
+        fixed_slots = sorted(fixed_slots, key=lambda x: x["start"])
+        with self._lock:
+            self._fixed_slots = fixed_slots
+            self.recurring_slots = recurring_slots
+            self._cursors = [None] * len(self.recurring_slots)
+            self._window = [[] for _ in self.recurring_slots]
+            self._build_index()
+        self.wake()
+
+    def iter_slots(self, now: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """Yields every slot that has not stopped by `now`, in start order.
+
+        Recurring slots are expanded lazily, so this is safe to use on
+        schedules that span months.
+        """
+        if now is None:
+            now = clock.now()
+        fixed = (slot for slot in self._fixed_slots if slot["stop"] >= now)
+        streams = [fixed] + [rule.occurrences(now) for rule in self.recurring_slots]
+        return heapq.merge(*streams, key=lambda x: x["start"])
+
+    def next_future_timeslot(self, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            index = self.next_slot_index(now)
+            if index >= 0:
+                return self.schedule_data[index]
+            else:
+                return None
+
+    def next_boundary(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Returns the next time at which the running slot changes, or None if it never will.
+
+        This is the stop of the running slot or the start of the next one,
+        whichever comes first.
+        """
+        if now is None:
+            now = clock.now()
+        with self._lock:
+            boundaries = []
+            active = self.active_slot(now)
+            if active is not None and active["stop"] > now:
+                boundaries.append(active["stop"])
+            upcoming = self.next_future_timeslot(now)
+            if upcoming is not None:
+                boundaries.append(upcoming["start"])
+            if boundaries:
+                return min(boundaries)
             return None
-    
-    def time_to_nearest_schedule(self):
-        possible_slots = []
-        # Get the future slots
-        for slot in self.schedule_data:
-            if slot["start"] >= datetime.now():
-                possible_slots.append(slot)
-
-        # Sorts the slots in case they may not be
-        possible_slots = sorted(possible_slots, key=lambda x: x["start"])
+
+    def wake(self) -> None:
+        """Ends any wait_until in progress, e.g. after the schedule was changed."""
+        self._wakeup.set()
+
+    def wait_until(self, deadline: Optional[datetime]) -> bool:
+        """Blocks until `deadline` (forever if None) or until wake() is called.
+
+        Returns:
+            True if the wait was ended early by wake(), False otherwise.
+        """
+        while True:
+            if deadline is None:
+                timeout = MAX_WAIT_SECONDS
+            else:
+                remaining = (deadline - clock.now()).total_seconds()
+                if remaining <= 0:
+                    return False
+                timeout = min(remaining, MAX_WAIT_SECONDS)
+            if clock.wait(self._wakeup, timeout):
+                self._wakeup.clear()
+                return True
+
+    def wait_for_next_boundary(self) -> bool:
+        """Blocks until the next slot boundary. See wait_until."""
+        return self.wait_until(self.next_boundary())
+
+    def time_to_nearest_schedule(self, now: Optional[datetime] = None) -> int:
+        if now is None:
+            now = clock.now()
+        slot = self.next_future_timeslot(now)
+        if slot is None:
+            return -1
         # Take the difference between the most recent slot's start time and time now
-        delta = possible_slots[0]["start"] - datetime.now()
+        delta = slot["start"] - now
         return int(delta.total_seconds())
 
     def time_to_slot(self, slot):
-        delta = slot["start"] - datetime.now()
+        delta = slot["start"] - clock.now()
         return int(delta.total_seconds())
@@ -3,7 +3,6 @@ from os import path
 from flask import Flask, request, send_file, jsonify, Response
 from flask_cors import CORS
 from flask_socketio import SocketIO, send, emit
-from picamera import PiCamera
 import threading
 from time import sleep 
 import json
@@ -12,12 +11,16 @@ from datetime import datetime
 from uuid import uuid1
 
 from .StreamingOutput import StreamingOutput
-from constants import EXTERNAL_DRIVE
+from constants import EXTERNAL_DRIVE, PREVIEW_DIR
 from sensors import Sensor
 from subsealight import PWM
 from logger import logger
 from restart import restart_code
 from camera.utils import get_camera_name
+from camera import CameraBusyError, camera_schedule, camera_session, reload_schedule
+from schedule_plan import ScheduleValidationError, compile_schedule
+from power_plan import PLAN_HORIZON, PowerPlan
+from instrumentation import instrumentation
 from uploader import DropboxUploader
 
 app = Flask("OpenOceanCam")
@@ -25,6 +28,9 @@ app.config["CORS_HEADERS"] = "Content-Type"
 
 socketio = SocketIO(app, cors_allowed_origins="*", ping_timeout=5, ping_interval=5)
 
+# How long an API request waits for the camera before giving up, in seconds
+CAMERA_LEASE_TIMEOUT = 10
+
 @app.route("/setCameraName", methods=["POST"])
 def set_camera_name():
     if request.method == 'POST':
@@ -57,6 +63,7 @@ def clearSchedule():
     try:
         with open("/home/pi/openoceancamera/schedule.json", "w") as outfile:
             json.dump(json.loads("[]"), outfile)
+        reload_schedule(compile_schedule([]))
         clear_cmd = ('sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 10 6')
         os.system(clear_cmd)
         threading.Thread(target=restart_code).start()
@@ -69,8 +76,14 @@ def set_schedule():
     if request.method == "POST":
         print(request.get_json())
         camera_config = request.get_json()
+        try:
+            plan = compile_schedule(camera_config)
+        except ScheduleValidationError as err:
+            logger.error(f"Invalid schedule: {err}")
+            return str(err), 400
         with open("/home/pi/openoceancamera/schedule.json", "w") as outfile:
             json.dump(camera_config, outfile)
+        reload_schedule(plan)
         date_input = camera_config[0]["date"]
         timezone = camera_config[0]["timezone"]
         clear_cmd = ('sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 10 6') # convert to python function calls for wittyPi 
@@ -108,6 +121,45 @@ def returnConfig():
         except Exception as err:
             return str(err), 400
 
+@app.route("/powerPlan", methods=["GET"])
+def get_power_plan():
+    try:
+        power_plan = PowerPlan.from_scheduler(camera_schedule, horizon=PLAN_HORIZON)
+        return jsonify(power_plan.report()), 200
+    except Exception as err:
+        logger.error(err)
+        return str(err), 400
+
+@app.route("/instrumentation", methods=["GET"])
+def get_instrumentation():
+    return jsonify({
+        "current": instrumentation.snapshot(),
+        "last_slot": instrumentation.last_slot,
+    }), 200
+
+@app.route("/previews", methods=["GET"])
+def list_previews():
+    """Lists the preview JPEGs, oldest first, a page at a time (?offset=0&limit=100)."""
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", 100))
+        names = sorted(name for name in os.listdir(PREVIEW_DIR) if name.endswith(".jpg")) if path.isdir(PREVIEW_DIR) else []
+        return jsonify({"total": len(names), "previews": names[offset:offset + limit]}), 200
+    except ValueError as err:
+        return str(err), 400
+    except Exception as err:
+        logger.error(err)
+        return str(err), 400
+
+@app.route("/previews/<name>", methods=["GET"])
+def get_preview(name):
+    if name != path.basename(name) or not name.endswith(".jpg"):
+        return "Invalid preview name", 400
+    preview = path.join(PREVIEW_DIR, name)
+    if not path.isfile(preview):
+        return "No such preview", 404
+    return send_file(preview, mimetype="image/jpeg")
+
 @app.route("/getLogs", methods=["GET"])
 def getLogs():
     if request.method == "GET":
@@ -142,7 +194,7 @@ def sendTestPic():
             exposure_compensation = data[0].get("exposure_compensation", 0)
             slot_resolution = data[0].get("resolution", {"x": "1920", "y": "1080"})
             resolution = (int(slot_resolution["x"]), int(slot_resolution["y"]))
-            with PiCamera(resolution=resolution) as camera: 
+            with camera_session.lease(resolution=resolution, timeout=CAMERA_LEASE_TIMEOUT) as camera:
                 camera.iso = iso 
                 camera.shutter_speed = shutter_speed 
                 camera.exposure_mode = exposure_mode 
@@ -158,6 +210,9 @@ def sendTestPic():
                 }
                 PWM.switch_off()
                 return jsonify(response), 200
+        except CameraBusyError as err:
+            PWM.switch_off()
+            return str(err), 409
         except Exception as err:
             logger.error(err)
             PWM.switch_off()
@@ -178,22 +233,26 @@ def sendTestPicMem():
                 resolution = (1920,1080) 
                 framerate = 30 
                 try: 
-                    with PiCamera() as camera: 
+                    with camera_session.lease(timeout=CAMERA_LEASE_TIMEOUT) as camera: 
                         camera.iso = iso 
                         camera.shutter_speed = shutter_speed 
                         filename1 = EXTERNAL_DRIVE + "/" + str(uuid1()) + ".jpg"
                         camera.capture(filename1)
                         print("Written")
+                except CameraBusyError as err: 
+                    return str(err), 409
                 except Exception as err: 
                     return str(err) , 400
 
                 try:     
-                    with PiCamera(resolution=resolution, framerate=framerate) as camera: 
+                    with camera_session.lease(resolution=resolution, framerate=framerate, timeout=CAMERA_LEASE_TIMEOUT) as camera: 
                         filename2 = EXTERNAL_DRIVE + "/" + str(uuid1()) + ".h264"
                         camera.start_recording(filename2)
                         print("Started recording")
                         sleep(3)
                         camera.stop_recording() 
+                except CameraBusyError as err: 
+                    return str(err), 409
                 except Exception as err: 
                     return str(err), 400
             except Exception as err:
@@ -284,15 +343,20 @@ def livestream():
     if livestream_running:
         return
     try:
-        with PiCamera(resolution=(640, 480)) as camera:
+        livestream_running = True
+        with camera_session.lease(resolution=(640, 480), exclusive=False, timeout=CAMERA_LEASE_TIMEOUT) as camera:
             output = StreamingOutput()
             logger.debug("Starting livestream")
             camera.start_recording(output, format='mjpeg')
-            run_livestream = True
-            while run_livestream:
-                socketio.sleep(0)
-                if output.frame:
-                    emit("livestream_data", output.frame)
+            try:
+                run_livestream = True
+                # Give the camera up when a scheduled slot needs it
+                while run_livestream and not camera_session.contended:
+                    socketio.sleep(0)
+                    if output.frame:
+                        emit("livestream_data", output.frame)
+            finally:
+                camera.stop_recording()
     except Exception as err:
         emit("livestream_data", json.dumps({"error": err}))
         logger.error(err)
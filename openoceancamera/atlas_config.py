@@ -0,0 +1,29 @@
+"""The calibration and settings of the Atlas boards, kept across boots.
+
+Bringing up an Atlas board used to mean exporting its calibration, factory
+resetting it, importing the calibration again and enabling each of its
+outputs with a pause after every command: many seconds per board, and
+writes to its flash, on every wake. Now what a board was left with is
+stored, keyed by config_key(): the calibration strings it exported and its
+answers to "Cal,?" and "O,?". At the next bring-up those two cheap queries
+confirm that the board still has that configuration, and nothing is
+written to it:
+
+    cache = AtlasConfigCache(ATLAS_CONFIG_PATH)
+    entry = cache.get(config_key("EC", 100, "2.16"))
+
+A board that was swapped, reflashed or recalibrated answers differently
+and goes through the full bring-up again, which updates its entry.
+"""
+from json_cache import JSONCache
+
+
+def config_key(module: str, address: int, firmware: str) -> str:
+    """The key of a board's entry: its module type, I2C address and firmware version."""
+    return f"{module}@{address}/{firmware}"
+
+
+class AtlasConfigCache(JSONCache):
+    """The configuration of each Atlas board by config_key(), kept in a JSON file."""
+
+    description = "Atlas configurations"
@@ -0,0 +1,60 @@
+"""Benchmark for bringing up the Atlas boards at boot.
+
+Initialises the three boards on simulator.i2c's simulated bus, which has
+the EZO datasheets' processing times, at three boots: a first one with
+nothing cached, a second one with the configurations the first one saved,
+and one after the EC board has been recalibrated. Time is virtual, so the
+times are what the drivers' waits add up to on the Pi, one board after
+the other.
+
+Run from the openoceancamera directory:
+    python3 -m benchmarks.atlas_bringup
+"""
+import os
+import tempfile
+from datetime import datetime
+from typing import List, Tuple
+
+import clock
+from atlas_config import AtlasConfigCache
+from clock import VirtualClock
+from simulator import i2c
+
+
+def boot(sensors, bus, config_path: str) -> Tuple[List[float], int]:
+    """Brings up the Atlas boards as a new process would, and returns how long each took and the flash writes."""
+    # A new process reads the cache afresh
+    sensors.atlasI2C.config_cache = AtlasConfigCache(config_path)
+    writes = sum(getattr(device, "flash_writes", 0) for device in bus.devices.values())
+    times = []
+    for sensor_class in (sensors.EC_Sensor, sensors.DO_Sensor, sensors.PH_Sensor):
+        started = clock.monotonic()
+        sensor_class()
+        times.append(clock.monotonic() - started)
+    writes = sum(getattr(device, "flash_writes", 0) for device in bus.devices.values()) - writes
+    return times, writes
+
+
+def main() -> None:
+    bus = i2c.SimulatedBus.with_sensors()
+    installed = i2c.install(bus)
+    sensors = installed.sensors
+    previous_clock = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config_path = os.path.join(directory, "atlas_config.json")
+            print(f"{'boot':<16} {'EC':>8} {'DO':>8} {'pH':>8} {'total':>8} {'flash writes':>13}")
+            for name in ("cold", "cached", "EC recalibrated"):
+                if name == "EC recalibrated":
+                    bus.devices[100].calibration.append("0F1E2D3C4B5")
+                times, writes = boot(sensors, bus, config_path)
+                print(f"{name:<16} " + " ".join(f"{seconds:>7.1f}s" for seconds in times)
+                      + f" {sum(times):>7.1f}s {writes:>13}")
+    finally:
+        clock.set_clock(previous_clock)
+        installed.restore()
+
+
+if __name__ == "__main__":
+    main()
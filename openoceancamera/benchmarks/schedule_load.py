@@ -0,0 +1,61 @@
+"""Benchmark for loading the schedule at boot.
+
+Compares parsing schedule.json (json.load plus strptime on every slot) with
+reading the compiled schedule plan.
+
+Run from the openoceancamera directory:
+    python3 -m benchmarks.schedule_load
+"""
+import json
+import os
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+from Scheduler import Scheduler
+from schedule_plan import compile_schedule, read_plan, write_plan
+
+SLOT_COUNTS = (100, 1000, 10000)
+
+
+def build_schedule(count: int):
+    base = datetime(2021, 1, 1)
+    slots = []
+    for i in range(count):
+        start = base + timedelta(minutes=5 * i)
+        slots.append({
+            "start": start.strftime("%Y-%m-%d-%H:%M:%S"),
+            "stop": (start + timedelta(minutes=1)).strftime("%Y-%m-%d-%H:%M:%S"),
+            "iso": 100,
+            "frequency": 10,
+            "light": 20,
+        })
+    return slots
+
+
+def main() -> None:
+    print(f"{'slots':>8} {'schedule.json':>15} {'schedule.plan':>15} {'plan size':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in SLOT_COUNTS:
+            json_path = os.path.join(directory, "schedule.json")
+            plan_path = os.path.join(directory, "schedule.plan")
+            with open(json_path, "w") as f:
+                json.dump(build_schedule(count), f)
+            with open(json_path) as f:
+                write_plan(compile_schedule(json.load(f)), plan_path)
+
+            def from_json():
+                with open(json_path) as f:
+                    Scheduler().load_scheduler_data(json.load(f))
+
+            def from_plan():
+                read_plan(plan_path).load_into(Scheduler())
+
+            json_ms = min(timeit.repeat(from_json, number=1, repeat=5)) * 1000
+            plan_ms = min(timeit.repeat(from_plan, number=1, repeat=5)) * 1000
+            size = os.path.getsize(plan_path)
+            print(f"{count:>8} {json_ms:>12.1f} ms {plan_ms:>12.1f} ms {size:>9} B")
+
+
+if __name__ == "__main__":
+    main()
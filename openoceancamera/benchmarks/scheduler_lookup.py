@@ -0,0 +1,73 @@
+"""Benchmark for the Scheduler slot lookups.
+
+Times the queries the camera thread makes on every loop (active slot and
+next slot) against schedules of growing size. The cost per lookup should
+stay roughly flat as the number of slots grows.
+
+Run from the openoceancamera directory:
+    python3 -m benchmarks.scheduler_lookup
+"""
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from Scheduler import Scheduler
+
+SLOT_COUNTS = (10, 100, 1000, 10000, 100000)
+QUERIES = 2000
+
+
+def build_schedule(count: int) -> Scheduler:
+    """Builds a schedule of `count` one minute slots, one every five minutes."""
+    base = datetime(2021, 1, 1)
+    slots = []
+    for i in range(count):
+        start = base + timedelta(minutes=5 * i)
+        stop = start + timedelta(minutes=1)
+        slots.append({
+            "start": start.strftime("%Y-%m-%d-%H:%M:%S"),
+            "stop": stop.strftime("%Y-%m-%d-%H:%M:%S"),
+        })
+    random.shuffle(slots)
+    scheduler = Scheduler()
+    scheduler.load_scheduler_data(slots)
+    return scheduler
+
+
+def linear_should_start(scheduler: Scheduler, now: datetime) -> int:
+    """The previous implementation of should_start, kept for comparison."""
+    for i in range(len(scheduler.schedule_data)):
+        if scheduler.schedule_data[i]["start"] <= now <= scheduler.schedule_data[i]["stop"]:
+            return i
+    return -1
+
+
+def main() -> None:
+    print(f"{'slots':>8} {'should_start':>14} {'next_slot':>14} {'linear scan':>14}")
+    for count in SLOT_COUNTS:
+        scheduler = build_schedule(count)
+        first = scheduler.schedule_data[0]["start"]
+        last = scheduler.schedule_data[-1]["stop"]
+        span = (last - first).total_seconds()
+        instants = [first + timedelta(seconds=random.uniform(0, span)) for _ in range(QUERIES)]
+
+        def active():
+            for now in instants:
+                scheduler.should_start(now)
+
+        def upcoming():
+            for now in instants:
+                scheduler.next_future_timeslot(now)
+
+        def linear():
+            for now in instants[:20]:
+                linear_should_start(scheduler, now)
+
+        active_us = min(timeit.repeat(active, number=1, repeat=3)) / QUERIES * 1e6
+        upcoming_us = min(timeit.repeat(upcoming, number=1, repeat=3)) / QUERIES * 1e6
+        linear_us = min(timeit.repeat(linear, number=1, repeat=3)) / 20 * 1e6
+        print(f"{count:>8} {active_us:>11.2f} us {upcoming_us:>11.2f} us {linear_us:>11.2f} us")
+
+
+if __name__ == "__main__":
+    main()
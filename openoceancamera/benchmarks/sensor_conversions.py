@@ -0,0 +1,62 @@
+"""Benchmark for a sampling cycle of the sensors.
+
+Reads every sensor on simulator.i2c's simulated bus, which has the
+datasheet conversion times: the way read_sensor_data used to (each reading
+on its own, and the MS5837 converting once per value), with the
+conversions run one after the other, and with them overlapped. Time is
+virtual, so the cycle times are what the drivers' waits and the bus
+transfers add up to on the Pi rather than how long the benchmark takes.
+
+Run from the openoceancamera directory:
+    python3 -m benchmarks.sensor_conversions
+"""
+from datetime import datetime
+
+import clock
+from clock import VirtualClock
+from conversions import run_conversions
+from simulator import i2c
+
+
+def separate_reads(sensor) -> None:
+    """The reads of read_sensor_data before its conversions were overlapped."""
+    sensor.luminosity_sensor.lux()
+    sensor.luminosity_sensor.lux()
+    sensor.gps.update()
+    sensor.pressure_sensor.absolute_pressure()
+    sensor.pressure_sensor.temperature()
+    sensor.pressure_sensor.depth()
+    sensor.temperature_sensor.temperature()
+    for atlas_sensor in (sensor.ec_sensor, sensor.do_sensor, sensor.ph_sensor):
+        atlas_sensor.read_all()
+
+
+def main() -> None:
+    bus = i2c.SimulatedBus.with_sensors()
+    installed = i2c.install(bus)
+    sensors = installed.sensors
+    previous_clock = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    try:
+        sensor = sensors.Sensor()
+        sensors.sensor_registry.devices()
+        cycles = (
+            ("separate reads", lambda: separate_reads(sensor)),
+            ("serial conversions", lambda: run_conversions(sensor._conversions(), overlap=False)),
+            ("overlapped", lambda: run_conversions(sensor._conversions())),
+        )
+        print(f"{'cycle':<20} {'time':>10} {'transfers':>10} {'early reads':>12}")
+        for name, cycle in cycles:
+            started = clock.monotonic()
+            transfers = bus.transfers
+            early_reads = bus.early_reads
+            cycle()
+            milliseconds = (clock.monotonic() - started) * 1000
+            print(f"{name:<20} {milliseconds:>7.1f} ms {bus.transfers - transfers:>10} {bus.early_reads - early_reads:>12}")
+    finally:
+        clock.set_clock(previous_clock)
+        installed.restore()
+
+
+if __name__ == "__main__":
+    main()
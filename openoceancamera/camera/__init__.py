@@ -1,2 +1,3 @@
 # from .capture import start_capture
-from .camera_thread import camera_thread
+from .camera_thread import camera_thread, camera_schedule, reload_schedule
+from .session import CameraBusyError, camera_session
@@ -1,32 +1,86 @@
+from datetime import timedelta
 from Scheduler import Scheduler
 from subsealight import PWM
-import json 
 from .capture import start_capture
+from .session import KEEP_OPEN, camera_session
 from .upload import start_upload
-from datetime import datetime, timedelta
-import os
+from sensors import sensor_sampler
+from media_writer import media_writer
+import clock
+from constants import POWER_PLAN_REPORT_PATH, SCHEDULE_FILE_PATH, SCHEDULE_PLAN_PATH
 from logger import logger
-from time import sleep
+from restart import set_shutdown_time, set_startup_time
+from power_plan import BOOT_LEAD, PLAN_HORIZON, SHUTDOWN_DELAY, PowerPlan, should_power_off
+from schedule_plan import SchedulePlan, load_schedule, write_plan
 
-def camera_thread():
+# A step past a slot's stop, to look for a slot that is still running
+# then. Slot times are whole seconds, so none starts in between.
+RESOLUTION = timedelta(microseconds=1)
+
+# Shared with the API server so that a schedule change wakes the camera thread.
+camera_schedule = Scheduler()
+
+
+def slot_due() -> bool:
+    """Whether a slot is running or starts within KEEP_OPEN, so the camera should stay open between leases."""
+    now = clock.now()
+    if camera_schedule.active_slot(now) is not None:
+        return True
+    next_slot = camera_schedule.next_future_timeslot(now)
+    return next_slot is not None and next_slot["start"] - now <= KEEP_OPEN
+
+
+camera_session.keep_open = slot_due
+
+
+def reload_schedule(plan: SchedulePlan) -> None:
+    """Saves a compiled schedule for the next boot and loads it into the running camera thread."""
+    try:
+        write_plan(plan, SCHEDULE_PLAN_PATH)
+    except OSError as err:
+        logger.error(f"Could not write the schedule plan: {err}")
+    plan.load_into(camera_schedule)
+    # This runs on the API server's request thread, so only the next
+    # PLAN_HORIZON is planned
+    power_plan = PowerPlan.from_scheduler(camera_schedule, horizon=PLAN_HORIZON)
+    logger.info(f"Power plan: {power_plan.report()}")
+    try:
+        # For reviewing only; it is kept out of wittypi/schedules so that
+        # it is not installed over the shutdowns and startups camera_thread() sets
+        power_plan.write_wpi(POWER_PLAN_REPORT_PATH)
+    except OSError as err:
+        logger.error(f"Could not write the power plan: {err}")
+
+
+def camera_thread(schedule_path: str = SCHEDULE_FILE_PATH, plan_path: str = SCHEDULE_PLAN_PATH):
     # load the schedule from the schedule json
-    camera_schedule = Scheduler()
     PWM.switch_off()
 
     try:
-        with open("/home/pi/openoceancamera/schedule.json") as f:
-                data = json.load(f)    
-                camera_schedule.load_scheduler_data(data)
-    except:
-        return
+        load_schedule(camera_schedule, schedule_path, plan_path)
+    except Exception as err:
+        # Carry on without slots: the loop then sleeps until a new schedule
+        # from the API wakes it (see reload_schedule).
+        logger.error(f"Could not load the schedule: {err}")
 
     logger.debug("In Camera thread")
+    last_slot = None
     while True:
         # check if a schedule slot needs to run
-        slot_index = camera_schedule.should_start()
+        slot = camera_schedule.active_slot()
+        if slot is not None and last_slot is not None and (slot["start"], slot["stop"]) == (last_slot["start"], last_slot["stop"]):
+            # The slot has already run. If it returned early (e.g. the upload
+            # finished), sleep out the rest of it.
+            if clock.now() < slot["stop"]:
+                camera_schedule.wait_until(slot["stop"])
+                continue
+            # It stopped just now. A slot overlapping it may still be
+            # running, and active_slot() can return the one that stopped
+            # when both started at the same time: check past its stop.
+            slot = camera_schedule.active_slot(slot["stop"] + RESOLUTION)
         # if it needs to run, call the correct function to start the slot (photo/video)
-        if (slot_index >= 0):
-            slot = camera_schedule.get_slot(slot_index)
+        if slot is not None:
+            last_slot = slot
             if(slot["upload"]):
                 try:
                     start_upload(slot)
@@ -34,27 +88,26 @@ def camera_thread():
                     logger.error(err)
             else:
                 start_capture(slot)
+            continue
         # else check when the next schedule is
         next_slot = camera_schedule.next_future_timeslot()
-        slot_index = camera_schedule.should_start()
-        if slot_index == -1 and next_slot is not None:
-            # if the camera needs to shutdown, do wittypi stuff to shutdown the camera and set restart time and stop this loop
-            mins_to_next_slot = int(camera_schedule.time_to_slot(next_slot) / 60)
-            if mins_to_next_slot > 10:
-                shutdown_time = datetime.now() + timedelta(minutes=2)
-                shutdown_time = shutdown_time.strftime("%d %H:%M")
-                reboot_time = next_slot["start"] - timedelta(minutes=2)
-                reboot_time = reboot_time.strftime("%d %H:%M:%S")
-                reboot_cmd = (
-                    'sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 5 "' + reboot_time + '"'
-                )
-
-                os.system(reboot_cmd)
+        if next_slot is None or next_slot["start"] - clock.now() > KEEP_OPEN:
+            # Keep the camera open and the sensors sampling between
+            # back-to-back slots, stop them otherwise. Everything written
+            # so far is synced to the drive before a possible power off.
+            camera_session.close()
+            sensor_sampler.stop()
+            media_writer.flush()
+        if next_slot is not None:
+            # if the camera needs to shutdown, do wittypi stuff to shutdown the camera and set restart time and stop this loop.
+            # Shutting down is only worth it if the gap pays back the cost of a reboot (see power_plan.py)
+            if should_power_off(clock.now(), next_slot["start"]):
+                shutdown_time = clock.now() + SHUTDOWN_DELAY
+                reboot_time = next_slot["start"] - BOOT_LEAD
+                set_startup_time(reboot_time)
                 logger.info(f"The reboot time has been set to {reboot_time}")
-                shutdown_cmd = (
-                    'sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 4 "' + shutdown_time + '"'
-                )
-                os.system(shutdown_cmd)
+                set_shutdown_time(shutdown_time)
                 logger.info(f"The camera will shut down at {shutdown_time}")
                 break
-        sleep(1)
\ No newline at end of file
+        # sleep until the next slot starts, or until the schedule is changed
+        camera_schedule.wait_for_next_boundary()
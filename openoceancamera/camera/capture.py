@@ -1,15 +1,51 @@
-from picamera import PiCamera 
-from datetime import datetime
-from time import sleep 
-from constants import EXTERNAL_DRIVE
+import io
+import json
+import os
+
+from picamera import PiCameraCircularIO
+
+import clock
+from constants import EXPOSURE_PRESETS_PATH, EXTERNAL_DRIVE, PREVIEW_DIR
+from media_writer import media_writer
 # from .sensors import readSensorData, writeSensorData
-from sensors import Sensor
+from sensors import sensor_sampler
 from logger import logger
 from subsealight import PWM
 from restart import reboot_camera
+from pacing import FramePacer
+from triggers import DETECTOR_RESOLUTION, TRIGGER_BITRATE, LumaMonitor, parse_trigger
+from frame_filter import THUMBNAIL_RESOLUTION, RedundantFrameFilter
+from quality import QUALITY_RESOLUTION, QUALITY_SUFFIX, frame_quality
+from instrumentation import instrumentation, stage_timer
+from exposure_presets import ExposurePresetCache, prepare_exposure, preset_key, uses_auto_exposure
+from .session import DEFAULT_FRAMERATE, camera_session
 from .utils import get_camera_name
 from wiper import run_wiper
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+# How often a triggered slot checks the detectors, in seconds
+TRIGGER_POLL_SECONDS = 0.2
+# How long a timelapse frame waits for a fresh small frame to compare, in seconds
+FRESH_FRAME_TIMEOUT = 0.2
+# Previews are captured from this splitter port, scaled down by the GPU's resizer
+PREVIEW_SPLITTER_PORT = 3
+PREVIEW_RESOLUTION = (320, 240)
+# Seconds of video between two previews
+VIDEO_PREVIEW_SECONDS = 10
+# How long settle_exposure waits for the first sensor reading, in seconds.
+# A full read takes up to about 5 s with every sensor attached.
+FIRST_SAMPLE_TIMEOUT = 8
+# Seconds between sensor readings while recording video. A full read takes
+# longer, so the readings follow each other back to back.
+VIDEO_SAMPLE_PERIOD = 1
+# The light is switched on this many seconds before each timelapse frame,
+# or half the frame period if that is shorter, so that it is at full
+# brightness when the photo is taken.
+LIGHT_LEAD_SECONDS = 1
+
+# Converged exposure settings, reused by later slots under the same conditions
+preset_cache = ExposurePresetCache(EXPOSURE_PRESETS_PATH)
 
 # TODO: Add docstrings for these functions. 20/07/2021
 # It'd probably be quite handy the next time an intern or new dev
@@ -28,7 +64,8 @@ def annotate_text_string(sensor_data: Dict[str, str]) -> str:
     """Generates a string of all data to be written to logs and photo
 
     Args:
-        sensor_data (Dict): Raw sensor data from the Sensors.get_sensor_data().
+        sensor_data (Dict): Raw sensor data from the Sensors.get_sensor_data()
+            or SensorSampler.latest_data().
 
     Returns:
         str: A string of data which will be annotated to the photo.
@@ -63,7 +100,171 @@ def annotate_text_string(sensor_data: Dict[str, str]) -> str:
     return result
 
 
-def capture_video(slot: Dict[str, Any]) -> None:
+def append_index(index_path: str, entry: Dict[str, Any]) -> None:
+    """Adds an entry to a JSON lines index, e.g. of the segments of a segmented recording."""
+    media_writer.append(index_path, (json.dumps(entry) + "\n").encode("utf-8"))
+
+
+def save_still(camera, filename: str, timeout: Optional[float], **options) -> bool:
+    """Captures a JPEG from the video port into memory and queues it to be written to `filename`.
+
+    Returns:
+        False if the media writer had to drop it.
+    """
+    stream = io.BytesIO()
+    with stage_timer("capture.jpeg"):
+        camera.capture(stream, format="jpeg", use_video_port=True, **options)
+    with stage_timer("writer.queue"):
+        return media_writer.write(filename, stream.getvalue(), timeout=timeout)
+
+
+def save_raw(camera, filename: str, timeout: Optional[float]) -> bool:
+    """Captures a JPEG with the raw Bayer data appended from the still port and queues it to be written.
+
+    Returns:
+        False if the media writer had to drop it.
+    """
+    stream = io.BytesIO()
+    with stage_timer("capture.raw"):
+        camera.capture(stream, format="jpeg", bayer=True)
+    with stage_timer("writer.queue"):
+        return media_writer.write(filename, stream.getvalue(), timeout=timeout)
+
+
+def bracket_settings(camera, bracket: Dict[str, Any]) -> List[Dict[str, int]]:
+    """The camera settings for each frame of an exposure bracket (see OPTIONAL_SETTINGS in Scheduler.py)."""
+    if "shutter_speeds" in bracket:
+        return [{"shutter_speed": shutter_speed} for shutter_speed in bracket["shutter_speeds"]]
+    if camera.exposure_mode == "off":
+        # A locked exposure ignores compensation, so its steps of 1/6 stop
+        # are applied to the locked shutter speed instead.
+        base = camera.exposure_speed
+        return [{"shutter_speed": int(round(base * 2 ** (steps / 6)))} for steps in bracket["compensation"]]
+    return [{"exposure_compensation": steps} for steps in bracket["compensation"]]
+
+
+def save_bracket(camera, filename: str, bracket: Dict[str, Any], timeout: Optional[float]) -> List[str]:
+    """Takes an exposure bracket back to back from the video port and queues it to be written as a bundle.
+
+    The frames are captured with one capture_sequence call, changing the
+    exposure between frames, so they are only a frame or two apart. They
+    are written to <filename>_<n>.jpg, with a <filename>.bracket.json
+    manifest of each frame's settings and the exposure time the camera
+    reported for it (new settings can take a frame to reach the sensor).
+
+    Returns:
+        The paths of the frames queued, leaving out any the media writer had to drop.
+    """
+    base = os.path.splitext(filename)[0]
+    settings = bracket_settings(camera, bracket)
+    paths = [f"{base}_{n}.jpg" for n in range(len(settings))]
+    restore = {name: getattr(camera, name) for name in settings[0]}
+    streams = []
+    frames = []
+
+    def outputs():
+        for n, setting in enumerate(settings):
+            for name, value in setting.items():
+                setattr(camera, name, value)
+            stream = io.BytesIO()
+            streams.append(stream)
+            yield stream
+            frame = {"file": os.path.basename(paths[n]), "exposure_speed": camera.exposure_speed}
+            frame.update(setting)
+            frames.append(frame)
+
+    try:
+        with stage_timer("capture.bracket"):
+            camera.capture_sequence(outputs(), format="jpeg", use_video_port=True)
+    finally:
+        for name, value in restore.items():
+            setattr(camera, name, value)
+    written = []
+    with stage_timer("writer.queue"):
+        for path, frame, stream in zip(paths, frames, streams):
+            frame["dropped"] = not media_writer.write(path, stream.getvalue(), timeout=timeout)
+            if not frame["dropped"]:
+                written.append(path)
+        manifest = json.dumps({"frames": frames}, separators=(",", ":")).encode("utf-8")
+        media_writer.write(f"{base}.bracket.json", manifest, timeout=timeout)
+    return written
+
+
+def make_preview_dir() -> None:
+    try:
+        os.makedirs(PREVIEW_DIR, exist_ok=True)
+    except OSError as err:
+        logger.error(f"Could not create {PREVIEW_DIR}: {err}")
+
+
+def preview_path(media_path: str, suffix: str = "") -> str:
+    """Names the preview of a photo or video in the preview directory, e.g. previews/<photo>.jpg."""
+    name = os.path.splitext(os.path.basename(media_path))[0]
+    return f"{PREVIEW_DIR}/{name}{suffix}.jpg"
+
+
+def save_preview(camera, path: str) -> bool:
+    """Captures a small JPEG through the resizer, alongside any recording, and queues it to be written to `path`.
+
+    Returns:
+        False if the media writer dropped it; previews are never worth waiting for.
+    """
+    stream = io.BytesIO()
+    with stage_timer("capture.preview"):
+        camera.capture(stream, format="jpeg", use_video_port=True,
+                       resize=PREVIEW_RESOLUTION, splitter_port=PREVIEW_SPLITTER_PORT)
+    return media_writer.write(path, stream.getvalue(), timeout=0)
+
+
+def settle_exposure(camera, slot: Dict[str, Any]) -> Dict[str, Any]:
+    """Gets the exposure ready for the first frame, from a learned preset if possible.
+
+    Call it with the slot's light on. Slots with manual exposure settings are left alone.
+
+    Returns:
+        How the exposure was set and how long it took (see exposure_presets.prepare_exposure),
+        empty for manual exposure.
+    """
+    if not uses_auto_exposure(slot):
+        return {}
+    # The preset is picked by depth and ambient light, so it needs a
+    # reading: right after the sampler starts there may be none yet.
+    sample = sensor_sampler.wait_for_sample(FIRST_SAMPLE_TIMEOUT)
+    key = preset_key(sample.data, slot["light"]) if sample is not None else None
+    with stage_timer("exposure.settle"):
+        exposure = prepare_exposure(camera, key, preset_cache)
+    logger.debug(f"Exposure for {key}: {exposure}")
+    return exposure
+
+
+def _dropped_since(stats: Dict[str, Any]) -> int:
+    return media_writer.stats()["dropped"] - stats["dropped"]
+
+
+def _wipe() -> None:
+    with stage_timer("wiper"):
+        run_wiper(3)
+
+
+def dump_stage_timings(slot: Dict[str, Any]) -> None:
+    """Writes the stage timings of the slot that just ended to <slot>.timings.json and starts afresh."""
+    slot_name = f"{slot['start'].strftime('%Y-%m-%d_%H-%M-%S')}_{slot['stop'].strftime('%Y-%m-%d_%H-%M-%S')}"
+    base_name = f"{EXTERNAL_DRIVE}/{get_camera_name()}_{slot_name}"
+    timings = instrumentation.end_slot(slot_name)
+    try:
+        media_writer.write(f"{base_name}.timings.json", json.dumps(timings, separators=(",", ":")).encode("utf-8"), timeout=None)
+    except Exception as err:
+        logger.error(f"Could not save the stage timings: {err}")
+
+
+def capture_video(slot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Records H.264 video until the end of the slot, in segments if the slot asks for them.
+
+    A small preview frame is saved to PREVIEW_DIR every VIDEO_PREVIEW_SECONDS.
+
+    Returns:
+        How the exposure was set, or None if the slot failed.
+    """
     resolution = slot["resolution"]
     framerate = slot["framerate"]
     iso = slot["iso"]
@@ -71,41 +272,205 @@ def capture_video(slot: Dict[str, Any]) -> None:
     exposure_compensation = slot["exposure_compensation"]
     light = slot["light"]
     shutter_speed = slot["shutter_speed"]
-    try: 
-        sensor = Sensor()
-    except Exception as err: 
-        logger.error(err)
+    # Split the recording into files of at most segment_seconds / segment_mb
+    segment_seconds = slot.get("segment_seconds")
+    segment_bytes = slot["segment_mb"] * 1000000 if slot.get("segment_mb") else None
+    segmented = bool(segment_seconds or segment_bytes)
+    # Logs the sensors while recording
+    sensor_sampler.start(VIDEO_SAMPLE_PERIOD)
     camera_name = get_camera_name()
     wiper_status = slot["wiper"]
     if wiper_status:
-        run_wiper(3)
+        _wipe()
     try:
-        with PiCamera(resolution=resolution, framerate=framerate) as camera:
+        with camera_session.lease(resolution=resolution, framerate=framerate) as camera:
             camera.iso = iso 
             camera.exposure_mode = exposure_mode 
             camera.exposure_compensation = exposure_compensation
             camera.shutter_speed = shutter_speed
-            slot_name = f"{slot['start'].strftime('%Y-%m-%d_%H-%M-%S')}_{slot['stop'].strftime('%Y-%m-%d_%H-%M-%S')}.h264"
-            filename = f"{EXTERNAL_DRIVE}/{camera_name}_{slot_name}"
+            slot_name = f"{slot['start'].strftime('%Y-%m-%d_%H-%M-%S')}_{slot['stop'].strftime('%Y-%m-%d_%H-%M-%S')}"
+            base_name = f"{EXTERNAL_DRIVE}/{camera_name}_{slot_name}"
+            index_path = f"{base_name}.index.jsonl"
+            segment = 0
+            if segmented:
+                output = media_writer.open_stream(f"{base_name}_{segment:04d}.h264")
+            else:
+                output = media_writer.open_stream(f"{base_name}.h264")
             PWM.switch_on(light)
-            camera.start_recording(filename, format="h264")
-            current_time = datetime.now() 
-            sensors = Sensor()
-            sensors.write_sensor_data() 
+            exposure = settle_exposure(camera, slot)
+            make_preview_dir()
+            camera.start_recording(output, format="h264")
+            recording_started = clock.monotonic()
+            next_preview = recording_started
+            segment_start = clock.now()
+            segment_started = clock.monotonic()
+
+            def finish_segment():
+                append_index(index_path, {
+                    "segment": segment,
+                    "file": os.path.basename(output.name),
+                    "start": segment_start.isoformat(),
+                    "seconds": round(clock.monotonic() - segment_started, 3),
+                    "bytes": output.bytes_written,
+                })
+
+            current_time = clock.now() 
             while current_time < slot["stop"]: 
-                camera.annotate_text = f"{current_time.strftime('%Y-%m-%d %H:%M:%S')} @ {slot['framerate']} fps"
-                sensors.write_sensor_data() 
-                sleep(1)
-                current_time = datetime.now() 
-            camera.stop_recording() 
+                if clock.monotonic() >= next_preview:
+                    offset = int(clock.monotonic() - recording_started)
+                    save_preview(camera, preview_path(base_name, f"_{offset:06d}s"))
+                    next_preview += VIDEO_PREVIEW_SECONDS
+                with stage_timer("annotate"):
+                    camera.annotate_text = f"{current_time.strftime('%Y-%m-%d %H:%M:%S')} @ {slot['framerate']} fps"
+                clock.sleep(1)
+                current_time = clock.now() 
+                if segmented and current_time < slot["stop"] and (
+                        (segment_seconds and clock.monotonic() - segment_started >= segment_seconds)
+                        or (segment_bytes and output.bytes_written >= segment_bytes)):
+                    # The encoder switches files at the next keyframe, so no
+                    # frames are lost between segments.
+                    next_output = media_writer.open_stream(f"{base_name}_{segment + 1:04d}.h264")
+                    with stage_timer("video.split"):
+                        camera.split_recording(next_output)
+                    output.close()
+                    finish_segment()
+                    segment += 1
+                    output = next_output
+                    segment_start = clock.now()
+                    segment_started = clock.monotonic()
+            with stage_timer("video.stop"):
+                camera.stop_recording() 
+            output.close()
+            if segmented:
+                finish_segment()
             PWM.switch_off()
+            return exposure
     except Exception as err: 
         PWM.switch_off() 
         logger.error(err)
         reboot_camera()
+    return None
+
+
+def capture_triggered(slot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Records video into memory and only saves it around events.
+
+    The last trigger["pre_seconds"] of video are kept in a circular buffer.
+    When the motion detector or the sensor trigger fires, the buffer is
+    saved and recording continues to a file until trigger["post_seconds"]
+    after the last event. Each event is added to <slot>.events.jsonl.
+
+    Returns:
+        The number of events and what triggered them, or None if the slot
+        failed before recording.
+    """
+    trigger = slot["trigger"]
+    pre_seconds = trigger["pre_seconds"]
+    post_seconds = trigger["post_seconds"]
+    detector, sensor_trigger = parse_trigger(trigger)
+    camera_name = get_camera_name()
+    if slot["wiper"]:
+        _wipe()
+    sensor_sampler.start()
+    events = []
+    try:
+        with camera_session.lease(resolution=slot["resolution"], framerate=slot["framerate"]) as camera:
+            camera.iso = slot["iso"]
+            camera.exposure_mode = slot["exposure_mode"]
+            camera.exposure_compensation = slot["exposure_compensation"]
+            camera.shutter_speed = slot["shutter_speed"]
+            slot_name = f"{slot['start'].strftime('%Y-%m-%d_%H-%M-%S')}_{slot['stop'].strftime('%Y-%m-%d_%H-%M-%S')}"
+            base_name = f"{EXTERNAL_DRIVE}/{camera_name}_{slot_name}"
+            PWM.switch_on(slot["light"])
+            exposure = settle_exposure(camera, slot)
+            # The buffer is sized by seconds at a bitrate, so the recording must use the same one
+            ring = PiCameraCircularIO(camera, seconds=pre_seconds, bitrate=TRIGGER_BITRATE, splitter_port=1)
+            camera.start_recording(ring, format="h264", bitrate=TRIGGER_BITRATE, splitter_port=1)
+            if detector is not None:
+                camera.start_recording(detector, format="yuv", resize=DETECTOR_RESOLUTION, splitter_port=2)
+
+            def fired() -> Optional[str]:
+                if detector is not None and detector.fired():
+                    return "motion"
+                return sensor_trigger.check(sensor_sampler.latest())
+
+            try:
+                while clock.now() < slot["stop"]:
+                    camera.wait_recording(TRIGGER_POLL_SECONDS, splitter_port=1)
+                    reason = fired()
+                    if reason is None:
+                        continue
+                    triggered = clock.now()
+                    name = f"{base_name}_event{len(events):03d}"
+                    logger.info(f"Recording triggered by {reason}")
+                    # New frames go to the file while the buffered ones are saved
+                    after = media_writer.open_stream(f"{name}_after.h264")
+                    camera.split_recording(after, splitter_port=1)
+                    before = media_writer.open_stream(f"{name}_before.h264")
+                    ring.copy_to(before, seconds=pre_seconds)
+                    before.close()
+                    ring.clear()
+                    last_event = clock.monotonic()
+                    while clock.now() < slot["stop"] and clock.monotonic() - last_event < post_seconds:
+                        camera.wait_recording(TRIGGER_POLL_SECONDS, splitter_port=1)
+                        if fired() is not None:
+                            last_event = clock.monotonic()
+                    camera.split_recording(ring, splitter_port=1)
+                    after.close()
+                    event = {
+                        "event": len(events),
+                        "reason": reason,
+                        "triggered": triggered.isoformat(),
+                        "before": os.path.basename(f"{name}_before.h264"),
+                        "after": os.path.basename(f"{name}_after.h264"),
+                        "seconds": round((clock.now() - triggered).total_seconds(), 3),
+                    }
+                    events.append(event)
+                    append_index(f"{base_name}.events.jsonl", event)
+            finally:
+                if detector is not None:
+                    camera.stop_recording(splitter_port=2)
+                camera.stop_recording(splitter_port=1)
+                PWM.switch_off()
+    except Exception as err:
+        PWM.switch_off()
+        logger.error(err)
+        reboot_camera()
+        return None
+    reasons = {}
+    for event in events:
+        reasons[event["reason"]] = reasons.get(event["reason"], 0) + 1
+    logger.info(f"Triggered recording: {len(events)} events {reasons}")
+    result = {"events": len(events), "reasons": reasons}
+    result.update(exposure)
+    return result
+
+
+def image_filename(camera_name: str, timestamp: datetime, period: float, kind: str = "img") -> str:
+    """Names a timelapse frame after the time it was taken, to the millisecond for sub-second periods."""
+    name = timestamp.strftime("%Y-%m-%d-%H-%M-%S")
+    if period < 1:
+        name += f"-{timestamp.microsecond // 1000:03d}"
+    return f"{EXTERNAL_DRIVE}/{camera_name}_{kind}{name}.jpg"
+
 
+def capture_images(slot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Takes a photo every slot["frequency"] seconds until the end of the slot.
 
-def capture_images(slot: Dict[str, Any]) -> None:
+    With slot["suppress"] set, frames that look the same as the last one
+    kept are replaced by thumbnails or skipped (see frame_filter.py).
+    With slot["raw"] set, photos are taken from the still port with the
+    raw Bayer data appended, for developing with tools/demosaic.py.
+    With slot["bracket"] set, each photo is a bundle of frames at different
+    exposures, for merging with tools/hdr_merge.py.
+    Every photo kept gets a small preview in PREVIEW_DIR, and quality scores
+    (see quality.py) in <slot>.quality.jsonl.
+
+    Returns:
+        The FramePacer report of how closely the frames kept to the
+        period, with the numbers of kept and suppressed frames if
+        suppressing, or None if the slot failed before capturing.
+    """
     try:
         logger.debug("Going to set camera config")
         resolution = slot["resolution"]
@@ -118,47 +483,209 @@ def capture_images(slot: Dict[str, Any]) -> None:
         camera_name = get_camera_name()
         wiper_status = slot.get("wiper", False)
         if wiper_status:
-            run_wiper(3)
+            _wipe()
         logger.debug(f"Assigning camera config to {camera_name}")
+        suppress = slot.get("suppress")
+        raw = bool(slot.get("raw"))
+        bracket = slot.get("bracket")
+        framerate = DEFAULT_FRAMERATE
+        if bracket and "shutter_speeds" in bracket:
+            # The video port cannot expose a frame for longer than the frame lasts
+            framerate = min(DEFAULT_FRAMERATE, 1000000 / max(bracket["shutter_speeds"]))
+        writer_stats = media_writer.stats()
+        exposure = {}
+        pacer = None
+        frame_filter = None
+        # The sensors are read and logged in the background, at least once
+        # per frame; frames are annotated with the newest reading. Started
+        # before the camera opens so that the first reading is ready for
+        # settle_exposure.
+        sensor_sampler.start(frequency)
         try: 
-            with PiCamera(resolution=resolution) as camera:
+            with camera_session.lease(resolution=resolution, framerate=framerate) as camera:
                 camera.iso = iso 
                 camera.exposure_mode = exposure_mode 
                 camera.exposure_compensation = exposure_compensation 
                 camera.shutter_speed = shutter_speed
                 camera.annotate_text_size = 10
-                PWM.switch_on(light)
                 logger.debug("Entering continuous capture")
 
-                sensors = Sensor()
-                sensor_data = sensors.get_sensor_data()
+                sensor_data = sensor_sampler.latest_data()
                 sensor_data["camera_name"] = camera_name
                 camera.annotate_text =  annotate_text_string(sensor_data)
-                for f in camera.capture_continuous(f'{EXTERNAL_DRIVE}/{camera_name}_'+'img{timestamp:%Y-%m-%d-%H-%M-%S}.jpg', use_video_port=True):
-                    PWM.switch_off()
-                    currenttime = datetime.now()
-                    if currenttime < slot["stop"]:
-                        sleep(frequency-1)
-                        sensors.write_sensor_data()
-                        sensor_data = sensors.get_sensor_data()
-                        sensor_data["camera_name"] = camera_name
-                        camera.annotate_text = annotate_text_string(sensor_data)
+                slot_name = f"{slot['start'].strftime('%Y-%m-%d_%H-%M-%S')}_{slot['stop'].strftime('%Y-%m-%d_%H-%M-%S')}"
+                quality_log = f"{EXTERNAL_DRIVE}/{camera_name}_{slot_name}{QUALITY_SUFFIX}"
+                # Small frames to score and compare, from a port the photos do not use
+                monitor = LumaMonitor(QUALITY_RESOLUTION)
+                camera.start_recording(monitor, format="yuv", resize=QUALITY_RESOLUTION, splitter_port=2)
+                if suppress:
+                    frame_filter = RedundantFrameFilter(suppress["threshold"], suppress["max_skipped"])
+                    skipped_log = f"{EXTERNAL_DRIVE}/{camera_name}_{slot_name}.skipped.jsonl"
+                try:
+                    # The light goes off between frames, so the exposure is
+                    # settled for the light once and then kept.
+                    PWM.switch_on(light)
+                    exposure = settle_exposure(camera, slot)
+                    make_preview_dir()
+                    # The slot's end on the monotonic clock, which the frame deadlines use
+                    end = clock.monotonic() + (slot["stop"] - clock.now()).total_seconds()
+                    pacer = FramePacer(frequency)
+                    lead = min(LIGHT_LEAD_SECONDS, frequency / 2)
+                    while True:
+                        deadline = pacer.wait(end, lead)
+                        if deadline is None:
+                            break
                         PWM.switch_on(light)
-                    else:
+                        clock.sleep(deadline - clock.monotonic())
+                        taken = clock.now()
+                        # Scored and compared under the same light as the photo
+                        luma = monitor.next_frame(FRESH_FRAME_TIMEOUT)
+                        keep = True
+                        if frame_filter is not None:
+                            with stage_timer("frame_filter"):
+                                keep = frame_filter.keep(luma)
+                        if keep:
+                            if raw:
+                                filename = image_filename(camera_name, taken, frequency, kind="raw")
+                                save_raw(camera, filename, frequency / 2)
+                                files = [filename]
+                            elif bracket:
+                                filename = image_filename(camera_name, taken, frequency, kind="hdr")
+                                files = save_bracket(camera, filename, bracket, frequency / 2)
+                            else:
+                                filename = image_filename(camera_name, taken, frequency)
+                                save_still(camera, filename, frequency / 2)
+                                files = [filename]
+                            save_preview(camera, preview_path(filename))
+                            if luma is not None:
+                                with stage_timer("quality"):
+                                    scores = frame_quality(luma)
+                                for path in files:
+                                    entry = {"file": os.path.basename(path), "time": taken.isoformat()}
+                                    entry.update(scores)
+                                    append_index(quality_log, entry)
+                        else:
+                            thumbnail = None
+                            if suppress["mode"] == "thumbnail":
+                                thumbnail = image_filename(camera_name, taken, frequency, kind="thumb")
+                                save_still(camera, thumbnail, frequency / 2, resize=THUMBNAIL_RESOLUTION)
+                            append_index(skipped_log, {
+                                "time": taken.isoformat(),
+                                "score": round(frame_filter.last_score, 5),
+                                "thumbnail": thumbnail and os.path.basename(thumbnail),
+                            })
                         PWM.switch_off()
-                        break
+                        with stage_timer("annotate"):
+                            sensor_data = sensor_sampler.latest_data()
+                            sensor_data["camera_name"] = camera_name
+                            camera.annotate_text = annotate_text_string(sensor_data)
+                finally:
+                    camera.stop_recording(splitter_port=2)
         except Exception as err:
             PWM.switch_off() 
             logger.error(err)
             reboot_camera()
+        if pacer is not None:
+            timing = pacer.report()
+            timing["dropped"] = _dropped_since(writer_stats)
+            timing.update(exposure)
+            if frame_filter is not None:
+                timing.update(frame_filter.report())
+            logger.info(f"Timelapse timing: {timing}")
+            if timing["missed_deadlines"]:
+                logger.warning(f"Missed {timing['missed_deadlines']} frame deadlines, the period of {frequency} s is too short")
+            return timing
     except Exception as err: 
         PWM.switch_off()
         logger.error(err)
+    return None
+
 
+def capture_burst(slot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Takes bursts of stills as set by slot["burst"] until the end of the slot.
 
-def start_capture(slot: Dict[str, Any]) -> None:
+    Frames are captured from the video port into memory and written to
+    the drive by the media writer, so the burst rate does not depend on how
+    fast the drive is. If the drive falls behind, frames are dropped.
+
+    Returns:
+        The frame timing and the number of dropped frames, or None if the slot failed
+        before capturing.
+    """
+    burst = slot["burst"]
+    fps = burst["fps"]
+    period = 1 / fps
+    light = slot["light"]
+    camera_name = get_camera_name()
+    if slot.get("wiper", False):
+        _wipe()
+    sensor_sampler.start()
+    writer_stats = media_writer.stats()
+    exposure = {}
+    frames = None
+    try:
+        with camera_session.lease(resolution=slot["resolution"], framerate=max(fps, DEFAULT_FRAMERATE)) as camera:
+            camera.iso = slot["iso"]
+            camera.exposure_mode = slot["exposure_mode"]
+            camera.exposure_compensation = slot["exposure_compensation"]
+            camera.shutter_speed = slot["shutter_speed"]
+            camera.annotate_text_size = 10
+            PWM.switch_on(light)
+            exposure = settle_exposure(camera, slot)
+            end = clock.monotonic() + (slot["stop"] - clock.now()).total_seconds()
+            bursts = FramePacer(burst["interval"] or burst["duration"])
+            frames = FramePacer(period)
+            stream = io.BytesIO()
+            while True:
+                burst_start = bursts.wait(end)
+                if burst_start is None:
+                    break
+                frames.restart(burst_start)
+                with stage_timer("annotate"):
+                    sensor_data = sensor_sampler.latest_data()
+                    sensor_data["camera_name"] = camera_name
+                    camera.annotate_text = annotate_text_string(sensor_data)
+                PWM.switch_on(light)
+                captures = camera.capture_continuous(stream, format="jpeg", use_video_port=True)
+                try:
+                    # Deadlines up to, not including, the end of the burst
+                    while frames.wait(min(burst_start + burst["duration"] - period / 2, end)) is not None:
+                        taken = clock.now()
+                        with stage_timer("capture.jpeg"):
+                            next(captures)
+                        # Waiting longer than a frame for the writer would only
+                        # make the next frame late as well.
+                        with stage_timer("writer.queue"):
+                            media_writer.write(image_filename(camera_name, taken, period), stream.getvalue(), timeout=period / 2)
+                        stream.seek(0)
+                        stream.truncate()
+                finally:
+                    captures.close()
+                    PWM.switch_off()
+    except Exception as err:
+        PWM.switch_off()
+        logger.error(err)
+        reboot_camera()
+    if frames is None:
+        return None
+    timing = frames.report()
+    timing["dropped"] = _dropped_since(writer_stats)
+    timing.update(exposure)
+    logger.info(f"Burst timing: {timing}")
+    if timing["dropped"]:
+        logger.warning(f"Dropped {timing['dropped']} burst frames, the drive could not keep up")
+    return timing
+
+
+def start_capture(slot: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     logger.debug("Going to capture")
-    if slot["video"]:
-        capture_video(slot)
-    else:
-        capture_images(slot)
\ No newline at end of file
+    try:
+        if slot["video"]:
+            if slot.get("trigger"):
+                return capture_triggered(slot)
+            return capture_video(slot)
+        if slot.get("burst"):
+            return capture_burst(slot)
+        return capture_images(slot)
+    finally:
+        dump_stage_timings(slot)
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""Process-wide owner of the PiCamera.
+
+Opening a PiCamera powers up the sensor and has to wait for auto exposure
+and white balance to settle, and only one PiCamera can be open at a time.
+Instead of every user opening its own, the capture code, the test photo
+endpoints and the livestream all borrow the one long-lived camera held by
+camera_session:
+
+    with camera_session.lease(resolution=(1920, 1080)) as camera:
+        camera.capture(filename)
+
+An exclusive lease gives the holder the camera to itself, resets the
+exposure settings and reconfigures resolution and framerate in place when
+they differ from the last lease. A
+shared lease can be held by several users at once (e.g. the livestream
+and a preview on another splitter port). Shared users take the camera as
+it is configured; only the first of them can change it, and the others
+wait until it has.
+
+When the last lease ends the camera is closed, unless keep_open() says it
+will be needed again soon. The camera thread sets that to keep the camera
+open while a slot runs or is about to start; a test photo or livestream
+with no slot due powers the camera down afterwards.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Callable, Optional, Tuple
+
+from picamera import PiCamera
+from instrumentation import timed
+from logger import logger
+
+# The camera thread leaves the camera open between slots that are at most
+# this far apart, and closes it when idle for longer.
+KEEP_OPEN = timedelta(seconds=60)
+
+# picamera's defaults. Every exclusive lease starts from these, so settings
+# left behind by the previous holder do not leak into the next capture.
+DEFAULT_FRAMERATE = 30
+DEFAULT_SETTINGS = {
+    "iso": 0,
+    "shutter_speed": 0,
+    "exposure_mode": "auto",
+    "exposure_compensation": 0,
+    "awb_mode": "auto",
+    "annotate_text": "",
+    "annotate_text_size": 32,
+}
+
+
+class CameraBusyError(Exception):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+
+class CameraSession(object):
+    def __init__(self, keep_open: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            keep_open: Whether to leave the camera open when nobody is using
+                it. By default it is closed when the last lease ends.
+        """
+        self.keep_open = keep_open or (lambda: False)
+        self._camera = None
+        self._condition = threading.Condition()
+        self._exclusive = False
+        self._shared = 0
+        self._waiting = 0
+        # Whether a shared user is configuring the camera, which the other
+        # shared users must wait for
+        self._configuring = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._camera is not None and not self._camera.closed
+
+    @property
+    def in_use(self) -> bool:
+        return self._exclusive or self._shared > 0
+
+    @property
+    def contended(self) -> bool:
+        """Whether someone is waiting for an exclusive lease.
+
+        Long-running shared users such as the livestream should give the
+        camera up when this becomes True.
+        """
+        return self._waiting > 0
+
+    def _acquire(self, exclusive: bool, timeout: Optional[float]) -> bool:
+        """Waits for the lease. Returns True if the caller may reconfigure the camera.
+
+        A shared caller that may reconfigure it must call _configured() when done.
+        """
+        def available():
+            if exclusive:
+                return not self.in_use
+            return not self._exclusive and not self._configuring
+
+        with self._condition:
+            if exclusive:
+                self._waiting += 1
+            try:
+                acquired = self._condition.wait_for(available, timeout)
+            finally:
+                if exclusive:
+                    self._waiting -= 1
+            if not acquired:
+                raise CameraBusyError("The camera is in use")
+            if exclusive:
+                self._exclusive = True
+                return True
+            self._shared += 1
+            # The first shared user configures the camera, as does a later
+            # one if the first could not open it
+            if self._shared == 1 or not self.is_open:
+                self._configuring = True
+                return True
+            return False
+
+    def _configured(self) -> None:
+        with self._condition:
+            self._configuring = False
+            self._condition.notify_all()
+
+    def _release(self, exclusive: bool) -> None:
+        with self._condition:
+            if exclusive:
+                self._exclusive = False
+            else:
+                self._shared -= 1
+            if not self.in_use and not self.contended and not self.keep_open():
+                self._close_camera()
+            self._condition.notify_all()
+
+    @timed("camera.configure")
+    def _configure(self, resolution: Optional[Tuple[int, int]], framerate: Optional[float]) -> PiCamera:
+        if not self.is_open:
+            kwargs = {}
+            if resolution is not None:
+                kwargs["resolution"] = resolution
+            if framerate is not None:
+                kwargs["framerate"] = framerate
+            logger.debug(f"Opening the camera with {kwargs}")
+            self._camera = PiCamera(**kwargs)
+            return self._camera
+        camera = self._camera
+        try:
+            for name, value in DEFAULT_SETTINGS.items():
+                setattr(camera, name, value)
+            if resolution is not None and tuple(camera.resolution) != tuple(resolution):
+                camera.resolution = resolution
+            if framerate is not None and camera.framerate != framerate:
+                camera.framerate = framerate
+        except Exception as err:
+            # Some changes (e.g. while a port is still busy) need a fresh camera.
+            logger.warning(f"Reopening the camera to reconfigure it: {err}")
+            self._close_camera()
+            return self._configure(resolution, framerate)
+        return camera
+
+    def _close_camera(self) -> None:
+        if self._camera is not None:
+            try:
+                self._camera.close()
+            except Exception as err:
+                logger.error(f"Error closing the camera: {err}")
+            self._camera = None
+
+    @contextmanager
+    def lease(self,
+              resolution: Optional[Tuple[int, int]] = None,
+              framerate: Optional[float] = None,
+              exclusive: bool = True,
+              timeout: Optional[float] = None):
+        """Lends the camera to the caller for the duration of the with block.
+
+        Args:
+            resolution: The resolution the caller needs, None to keep the current one.
+            framerate: The framerate the caller needs, None to keep the current one.
+            exclusive: Whether other users must be kept off the camera.
+            timeout: How long to wait for the camera, in seconds. None waits forever.
+
+        Raises:
+            CameraBusyError: if the camera did not become free within `timeout`.
+        """
+        may_configure = self._acquire(exclusive, timeout)
+        try:
+            if may_configure:
+                try:
+                    camera = self._configure(resolution, framerate)
+                finally:
+                    if not exclusive:
+                        self._configured()
+            else:
+                camera = self._camera
+            yield camera
+        except BaseException:
+            # The camera may be left recording or half configured; start
+            # afresh on the next lease.
+            if exclusive:
+                self._close_camera()
+            raise
+        finally:
+            self._release(exclusive)
+
+    def close(self) -> bool:
+        """Closes the camera if nobody is using it. Returns True if it is closed."""
+        with self._condition:
+            if self.in_use:
+                return False
+            self._close_camera()
+            return True
+
+
+camera_session = CameraSession()
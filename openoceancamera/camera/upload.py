@@ -1,47 +1,119 @@
 import os
-import json
 import zipfile
-from datetime import datetime, timedelta
-from time import sleep
-from constants import EXTERNAL_DRIVE
+import clock
+from constants import EXTERNAL_DRIVE, PREVIEW_DIR
+from instrumentation import stage_timer
+from quality import load_scores, upload_order
 from uploader import S3Uploader
 import logging
-from typing import Dict, Any
+from typing import Any, Dict, Iterable, Iterator, List, Set
 
 logging.basicConfig(filename="system_logs.txt", format="%(asctime)s - %(levelname)s - %(message)s", level=logging.INFO)
 logger = logging.getLogger('main')
 logger.setLevel(logging.DEBUG)
 
+# The files already uploaded, one path relative to the drive per line
+UPLOADS_MANIFEST = "uploads.txt"
+
 try:
-    if not os.path.exists(os.path.join(EXTERNAL_DRIVE, "uploads.txt")):
-        with open(os.path.join(EXTERNAL_DRIVE, "uploads.txt"), 'w') as uploads:
+    if not os.path.exists(os.path.join(EXTERNAL_DRIVE, UPLOADS_MANIFEST)):
+        with open(os.path.join(EXTERNAL_DRIVE, UPLOADS_MANIFEST), 'w') as uploads:
             pass
 except:
     logger.error("There is no USB connected")
 
+# The media are zipped and uploaded in batches of about this size, in
+# upload_order, so the best photos reach S3 first. Each batch is added to
+# the manifest once it is uploaded; what is left when the upload slot
+# ends waits for the next one.
+UPLOAD_BATCH_BYTES = 32 * 1024 * 1024
+
+
+def read_manifest(directory: str) -> Set[str]:
+    """Returns the paths, relative to `directory`, that its manifest lists as uploaded."""
+    try:
+        with open(os.path.join(directory, UPLOADS_MANIFEST)) as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+    except OSError:
+        return set()
+
+
+def record_uploads(directory: str, paths: Iterable[str]) -> None:
+    """Adds `paths` to the manifest in `directory`."""
+    with open(os.path.join(directory, UPLOADS_MANIFEST), "a") as f:
+        f.writelines(os.path.relpath(path, directory) + "\n" for path in paths)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def upload_batches(paths: List[str], max_bytes: int) -> Iterator[List[str]]:
+    """Splits `paths`, in order, into batches of at most `max_bytes`. A larger file gets a batch of its own."""
+    batch = []
+    size = 0
+    for path in paths:
+        try:
+            file_size = os.path.getsize(path)
+        except OSError:
+            continue
+        if batch and size + file_size > max_bytes:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(path)
+        size += file_size
+    if batch:
+        yield batch
+
 
 def start_upload(slot: Dict[str, Any]) -> None:
     logger.info("Starting upload slot")
     upload_handler = S3Uploader()
-    zipname = os.path.join(EXTERNAL_DRIVE, datetime.now().strftime('%Y-%m-%d_%H-%M-%S')) + ".zip"
+    zipprefix = os.path.join(EXTERNAL_DRIVE, clock.now().strftime('%Y-%m-%d_%H-%M-%S'))
     try:
-        zipfh = zipfile.ZipFile(zipname, 'w', zipfile.ZIP_DEFLATED)
+        media = []
         for root, dirs, files in os.walk(EXTERNAL_DRIVE):
+            # The previews are only for browsing the camera over WiFi
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != PREVIEW_DIR]
             for f in filter(lambda x: str(x).endswith(".jpg") or str(x).endswith(".h264"), files):
-                zipfh.write(os.path.join(root, f), os.path.relpath(os.path.join(root, f), os.path.join(EXTERNAL_DRIVE, '..')))
-        logger.info("Created ZIP file")
-        upload_handler.upload_file(zipname)
-        logger.info("Cleaning up after upload")
-        os.remove(zipname)
-        currenttime = datetime.now()
-        if currenttime < slot["stop"]:
-            logger.info("Uploaded. Going to wait for the slot to finish")
-            while currenttime < slot["stop"]:
-                currenttime = datetime.now()
-                sleep(1)
+                media.append(os.path.join(root, f))
+        uploaded_before = read_manifest(EXTERNAL_DRIVE)
+        media = [path for path in media if os.path.relpath(path, EXTERNAL_DRIVE) not in uploaded_before]
+        # Photos scored unusable (black, blown out, blurred) are left on
+        # the drive; the rest go best first.
+        media, unusable = upload_order(media, load_scores(EXTERNAL_DRIVE), EXTERNAL_DRIVE)
     except Exception as err:
         logger.error(f"USB Not connected. Error message: {err}")
+        return
+    if unusable:
+        logger.info(f"Not uploading {len(unusable)} unusable photos")
+    uploaded = 0
+    for number, batch in enumerate(upload_batches(media, UPLOAD_BATCH_BYTES)):
+        if clock.now() >= slot["stop"]:
+            logger.info(f"The upload slot is over, {len(media) - uploaded} files were not uploaded")
+            break
+        zipname = f"{zipprefix}_{number:03d}.zip"
         try:
-            os.remove(zipname)
-        except:
-            pass
+            with stage_timer("upload.zip"):
+                with zipfile.ZipFile(zipname, 'w', zipfile.ZIP_DEFLATED) as zipfh:
+                    for path in batch:
+                        zipfh.write(path, os.path.relpath(path, os.path.join(EXTERNAL_DRIVE, '..')))
+            logger.info(f"Created ZIP file {zipname}")
+            with stage_timer("upload.transfer"):
+                upload_handler.upload_file(zipname)
+            uploaded += len(batch)
+        except Exception as err:
+            logger.error(f"Upload failed. Error message: {err}")
+            break
+        finally:
+            try:
+                os.remove(zipname)
+            except OSError:
+                pass
+        try:
+            record_uploads(EXTERNAL_DRIVE, batch)
+        except OSError as err:
+            # The batch is sent again by the next upload slot
+            logger.error(f"Could not record the uploaded files: {err}")
+    # The camera thread sleeps out the rest of the slot, so there is no
+    # need to wait for slot["stop"] here.
+    logger.info(f"Uploaded {uploaded} files")
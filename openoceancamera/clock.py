@@ -0,0 +1,110 @@
+"""The time source used by the scheduling and capture code.
+
+Code that needs the current time or has to wait calls clock.now(),
+clock.sleep() and friends instead of datetime.now() and time.sleep(). On the
+camera these go to the system clock. The deployment simulator swaps in a
+VirtualClock with set_clock(), so a month-long schedule can be replayed in
+seconds.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class SystemClock(object):
+    """The real wall clock and monotonic clock."""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        return event.wait(timeout)
+
+
+class VirtualClockExpired(BaseException):
+    # Derives from BaseException, like SystemExit, so that the many
+    # `except Exception` blocks in the capture code do not swallow it.
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+
+class VirtualClock(object):
+    """A clock that only moves when someone sleeps on it.
+
+    Sleeping returns immediately after moving the clock forward, so code
+    that paces itself with sleep() runs as fast as the CPU allows. Once the
+    clock passes `end`, sleeping raises VirtualClockExpired so that loops
+    which would otherwise wait forever come to an end.
+    """
+
+    def __init__(self, start: datetime, end: Optional[datetime] = None):
+        self._now = start
+        self._monotonic = 0.0
+        self.end = end
+
+    def now(self) -> datetime:
+        return self._now
+
+    def monotonic(self) -> float:
+        return self._monotonic
+
+    def advance(self, seconds: float) -> None:
+        self._now += timedelta(seconds=seconds)
+        self._monotonic += seconds
+
+    def set(self, when: datetime) -> None:
+        """Moves the wall clock to `when`, e.g. to the next WittyPi wake."""
+        if when > self._now:
+            self._monotonic += (when - self._now).total_seconds()
+        self._now = when
+
+    def sleep(self, seconds: float) -> None:
+        if self.end is not None and self._now >= self.end:
+            raise VirtualClockExpired(f"Simulation ended at {self.end}")
+        if seconds > 0:
+            self.advance(seconds)
+
+    def wait(self, event: threading.Event, timeout: Optional[float]) -> bool:
+        # Nothing else runs while the simulation waits, so the event can only
+        # be set already or never.
+        if event.is_set():
+            return True
+        self.sleep(timeout or 0)
+        return event.is_set()
+
+
+_clock = SystemClock()
+
+
+def set_clock(clock) -> None:
+    global _clock
+    _clock = clock
+
+
+def get_clock():
+    return _clock
+
+
+def now() -> datetime:
+    return _clock.now()
+
+
+def monotonic() -> float:
+    return _clock.monotonic()
+
+
+def sleep(seconds: float) -> None:
+    _clock.sleep(seconds)
+
+
+def wait(event: threading.Event, timeout: Optional[float]) -> bool:
+    """Waits for `event` for at most `timeout` seconds. Returns event.is_set()."""
+    return _clock.wait(event, timeout)
@@ -3,5 +3,18 @@ import os
 SCHEDULE_FILE_PATH = os.path.join(
     os.path.dirname(os.path.abspath(__file__)), "schedule.json"
 )
+SCHEDULE_PLAN_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "schedule.plan"
+)
+POWER_PLAN_REPORT_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "power_plan_report.wpi"
+)
+EXPOSURE_PRESETS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "exposure_presets.json"
+)
+ATLAS_CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "atlas_config.json"
+)
 EXTERNAL_DRIVE = "/media/pi/OPENOCEANCA"
 LOG_FILE = f"{EXTERNAL_DRIVE}/log.txt"
+PREVIEW_DIR = f"{EXTERNAL_DRIVE}/previews"
@@ -0,0 +1,91 @@
+"""Overlapped readings of the "start conversion, wait, read" sensors.
+
+Most sensors on the I2C bus measure in the background: the driver sends a
+command, waits for the conversion time in the datasheet and then reads the
+result. Read one after the other, a sampling cycle costs the sum of those
+waits, 4.5 s for the three Atlas boards alone. Instead each reading is
+written as a generator, a conversion, which sends its command, yields the
+seconds until the result is ready and then reads and returns it:
+
+    def conversion(self):
+        self._bus.write_byte(ADDRESS, CONVERT)
+        yield 0.01
+        return self._read_result()
+
+run_conversions starts every conversion of a cycle, then resumes each one
+once its wait is over, earliest first, so the cycle takes about as long as
+the slowest device. A conversion may wait more than once; the MS5837
+converts pressure and then temperature. Reads that cannot be split, such as
+a library call that sleeps inside, are wrapped with blocking() and run
+while the other devices are converting.
+"""
+import heapq
+from typing import Any, Callable, Dict, Generator
+
+import clock
+from instrumentation import instrumentation
+
+# A generator that yields the seconds to wait before resuming it and returns the reading
+Conversion = Generator[float, None, Any]
+
+
+def blocking(read: Callable[[], Any]) -> Conversion:
+    """Wraps a read that cannot be split as a conversion that does all of it when started."""
+    return read()
+    yield  # Makes this a generator.
+
+
+def run_serially(conversion: Conversion) -> Any:
+    """Runs a single conversion, sleeping through its waits, and returns its reading."""
+    try:
+        while True:
+            clock.sleep(next(conversion))
+    except StopIteration as done:
+        return done.value
+
+
+def run_conversions(conversions: Dict[str, Conversion], overlap: bool = True) -> Dict[str, Any]:
+    """Runs the conversions of a sampling cycle with their waits overlapped.
+
+    The conversions are started in the order of `conversions`, so the
+    slowest should come first and blocking reads last. The time each one
+    takes from its start to its reading is recorded as the stage
+    "sensors.<name>".
+
+    Args:
+        conversions: The conversions to run, by name.
+        overlap: False runs them one after the other, like the plain drivers.
+
+    Returns:
+        The reading of each conversion by name, or the exception it raised.
+    """
+    results = {}
+    started = {}
+    # (deadline, order, name, conversion) of the conversions that are waiting
+    waiting = []
+
+    def resume(order: int, name: str, conversion: Conversion) -> None:
+        try:
+            wait = next(conversion)
+        except StopIteration as done:
+            results[name] = done.value
+        except Exception as err:
+            results[name] = err
+        else:
+            heapq.heappush(waiting, (clock.monotonic() + wait, order, name, conversion))
+            return
+        instrumentation.record(f"sensors.{name}", clock.monotonic() - started[name])
+
+    def collect() -> None:
+        deadline, order, name, conversion = heapq.heappop(waiting)
+        clock.sleep(max(deadline - clock.monotonic(), 0))
+        resume(order, name, conversion)
+
+    for order, (name, conversion) in enumerate(conversions.items()):
+        started[name] = clock.monotonic()
+        resume(order, name, conversion)
+        while waiting and not overlap:
+            collect()
+    while waiting:
+        collect()
+    return {name: results[name] for name in conversions}
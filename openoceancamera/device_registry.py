@@ -0,0 +1,65 @@
+"""Devices that are detected and initialised once per process.
+
+Bringing up the sensors takes many seconds: each Atlas board exports,
+resets and reimports its calibration, and every driver probes the bus.
+A DeviceRegistry does it on first use, for all the devices at once on a
+thread each, and keeps the devices for the life of the process:
+
+    registry = DeviceRegistry({"gps": ("GPS", GPS), ...})
+    gps = registry.devices().get("gps")    # None if it is not connected
+
+sensors.sensor_registry is the registry of the camera's sensors, which
+every Sensor() shares.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from logger import logger
+from instrumentation import stage_timer
+
+
+class DeviceRegistry(object):
+    def __init__(self, factories: Dict[str, Tuple[str, Callable[[], Any]]], stage: str = "sensors.initialise"):
+        """
+        Args:
+            factories: The label for log messages and the constructor of
+                each device, by name. A constructor that raises means the
+                device is not connected.
+            stage: The instrumentation stage that times the initialisation.
+        """
+        self._factories = factories
+        self._stage = stage
+        self._devices = None
+        self._lock = threading.Lock()
+        # Held for each use of the devices that must not overlap another,
+        # such as a sampling cycle
+        self.use_lock = threading.RLock()
+
+    @property
+    def initialised(self) -> bool:
+        return self._devices is not None
+
+    def devices(self) -> Dict[str, Any]:
+        """The connected devices by name, detected and initialised on the first call."""
+        with self._lock:
+            if self._devices is None:
+                self._devices = self._initialise()
+            return self._devices
+
+    def reset(self) -> None:
+        """Forgets the devices, so the next use detects them again."""
+        with self._lock:
+            self._devices = None
+
+    def _initialise(self) -> Dict[str, Any]:
+        devices = {}
+        with stage_timer(self._stage), \
+                ThreadPoolExecutor(max_workers=max(len(self._factories), 1), thread_name_prefix="device-init") as pool:
+            futures = {name: pool.submit(factory) for name, (_, factory) in self._factories.items()}
+            for name, future in futures.items():
+                try:
+                    devices[name] = future.result()
+                except Exception as err:
+                    logger.error(f"{self._factories[name][0]}: {err}")
+        return devices
@@ -0,0 +1,163 @@
+"""Learned exposure and white balance, so slots do not wait for auto-settling.
+
+With exposure_mode "auto" the camera starts every slot at whatever gains
+it was left with and takes a second or more, with the subsea light
+already on, to converge on the scene. Most slots of a deployment see the
+same few scenes: the same depth, the same light setting and similar
+ambient light. So once auto exposure has converged, the shutter speed, the
+analog and digital gains and the white balance gains are stored, keyed by
+depth band, light level and luminosity band. The next slot under the same
+conditions starts from those values and locks them straight away:
+
+    presets = ExposurePresetCache(EXPOSURE_PRESETS_PATH)
+    key = preset_key(sensor_sampler.wait_for_sample(timeout).data, slot["light"])
+    timing = prepare_exposure(camera, key, presets)
+
+Only slots that leave exposure to the camera (see uses_auto_exposure) are
+touched; manual ISO, shutter speed or exposure modes win.
+"""
+import math
+from typing import Any, Dict, Optional
+
+import clock
+from json_cache import JSONCache
+from logger import logger
+
+# Readings in the same band share a preset
+DEPTH_BAND_METRES = 5.0
+LIGHT_BAND = 10
+# Luminosity bands are a factor of LUMINOSITY_BAND_RATIO wide
+LUMINOSITY_BAND_RATIO = 2.0
+# How long auto exposure may take to converge, in seconds
+SETTLE_TIMEOUT = 4.0
+# How often the gains are read while waiting for them
+SETTLE_POLL_SECONDS = 0.1
+# Gains that change by less than this fraction between polls have converged
+SETTLE_TOLERANCE = 0.02
+# Before picamera 1.14, how long the gains may move towards a preset's ISO
+# before they are frozen, in seconds
+ISO_LOCK_SECONDS = 0.3
+
+
+def _band(value: Any, width: float) -> str:
+    if value is None or value == -1:
+        return "unknown"
+    return str(int(math.floor(float(value) / width)))
+
+
+def preset_key(sensor_data: Dict[str, Any], light: float) -> str:
+    """Returns the preset key for a sensor reading and a light setting (0-100)."""
+    luminosity = sensor_data.get("luminosity", -1)
+    if luminosity is None or luminosity == -1:
+        luminosity_band = "unknown"
+    else:
+        luminosity_band = str(int(math.floor(math.log(max(float(luminosity), 0) + 1, LUMINOSITY_BAND_RATIO))))
+    return "depth={}/light={}/lux={}".format(
+        _band(sensor_data.get("depth", -1), DEPTH_BAND_METRES),
+        int(light // LIGHT_BAND) * LIGHT_BAND,
+        luminosity_band,
+    )
+
+
+def uses_auto_exposure(slot: Dict[str, Any]) -> bool:
+    """Whether the slot leaves exposure and white balance to the camera."""
+    return (slot.get("exposure_mode", "auto") == "auto"
+            and not slot.get("iso")
+            and not slot.get("shutter_speed")
+            and not slot.get("exposure_compensation"))
+
+
+def read_preset(camera) -> Dict[str, Any]:
+    """Reads the exposure and white balance the camera is using."""
+    red, blue = camera.awb_gains
+    return {
+        "shutter_speed": int(camera.exposure_speed),
+        "analog_gain": float(camera.analog_gain),
+        "digital_gain": float(camera.digital_gain),
+        "awb_gains": [float(red), float(blue)],
+    }
+
+
+def _gains(camera):
+    return float(camera.analog_gain), float(camera.digital_gain), float(camera.exposure_speed)
+
+
+def _close(previous, current, tolerance: float) -> bool:
+    return all(abs(a - b) <= tolerance * max(abs(a), abs(b), 1e-6) for a, b in zip(previous, current))
+
+
+def wait_until_settled(camera, timeout: float = SETTLE_TIMEOUT) -> bool:
+    """Waits for the gains and exposure time to stop changing.
+
+    Returns:
+        False if they were still changing after `timeout` seconds.
+    """
+    deadline = clock.monotonic() + timeout
+    previous = _gains(camera)
+    while clock.monotonic() < deadline:
+        clock.sleep(SETTLE_POLL_SECONDS)
+        current = _gains(camera)
+        if _close(previous, current, SETTLE_TOLERANCE):
+            return True
+        previous = current
+    return False
+
+
+def apply_preset(camera, preset: Dict[str, Any]) -> None:
+    """Locks the camera's exposure and white balance to `preset`.
+
+    Before picamera 1.14 only the shutter speed and white balance are the
+    preset's: the gains are frozen wherever auto exposure has taken them.
+    """
+    camera.shutter_speed = preset["shutter_speed"]
+    camera.awb_mode = "off"
+    camera.awb_gains = tuple(preset["awb_gains"])
+    try:
+        camera.analog_gain = preset["analog_gain"]
+        camera.digital_gain = preset["digital_gain"]
+    except AttributeError:
+        # The gains are read-only before picamera 1.14. Aim auto exposure
+        # at them through the ISO instead (ISO 100 is a gain of about 1),
+        # but do not wait for it to get there.
+        camera.iso = int(min(max(round(preset["analog_gain"] * 100), 100), 800))
+        clock.sleep(ISO_LOCK_SECONDS)
+    camera.exposure_mode = "off"
+
+
+class ExposurePresetCache(JSONCache):
+    """Converged exposure settings by preset_key(), kept in a JSON file."""
+
+    description = "exposure presets"
+
+
+def prepare_exposure(camera, key: Optional[str], presets: ExposurePresetCache,
+                     timeout: float = SETTLE_TIMEOUT) -> Dict[str, Any]:
+    """Gets the camera's exposure ready for the first frame of a slot.
+
+    Locks the exposure to the preset for `key` if there is one. Otherwise
+    waits for auto exposure to converge, stores the result as the preset
+    and locks that. With no `key`, e.g. without a sensor reading to pick
+    it by, it only waits for auto exposure.
+
+    Returns:
+        "exposure": "preset" or "auto", and "settle_seconds", the time until
+        the first usable frame.
+    """
+    started = clock.monotonic()
+    preset = presets.get(key) if key is not None else None
+    if preset is not None:
+        try:
+            apply_preset(camera, preset)
+            return {"exposure": "preset", "settle_seconds": round(clock.monotonic() - started, 3)}
+        except Exception as err:
+            logger.warning(f"Could not apply the exposure preset {key}: {err}")
+            camera.exposure_mode = "auto"
+            camera.awb_mode = "auto"
+    if wait_until_settled(camera, timeout):
+        if key is not None:
+            preset = read_preset(camera)
+            presets.put(key, preset)
+            apply_preset(camera, preset)
+    else:
+        logger.info(f"Auto exposure did not settle within {timeout}s; no preset stored for {key}")
+    return {"exposure": "auto", "settle_seconds": round(clock.monotonic() - started, 3)}
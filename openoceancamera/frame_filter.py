@@ -0,0 +1,60 @@
+"""Skipping timelapse frames that show nothing new.
+
+A timelapse of a static deep-water scene is thousands of nearly identical
+photos. When a slot sets "suppress", the capture loop looks at a small
+YUV frame from a spare splitter port (see triggers.LumaMonitor) before
+each photo. It compares it with the small frame of the last photo it kept.
+If too little has changed, the full resolution photo is replaced by a
+thumbnail, or skipped altogether, and the skip is logged to a sidecar file.
+"""
+from typing import Any, Dict, Optional
+
+from triggers import PIXEL_THRESHOLD, changed_fraction
+
+# Size of the thumbnails stored instead of redundant frames
+THUMBNAIL_RESOLUTION = (320, 240)
+# A full resolution frame is kept at least this often, however static the scene
+MAX_SKIPPED = 60
+
+SUPPRESS_MODES = ("thumbnail", "skip")
+
+
+class RedundantFrameFilter(object):
+    def __init__(self, threshold: float, max_skipped: int = MAX_SKIPPED, pixel_threshold: int = PIXEL_THRESHOLD):
+        """
+        Args:
+            threshold: Frames where less than this fraction of the picture
+                changed since the last kept frame are redundant.
+            max_skipped: Keep a frame after this many redundant ones in a row.
+            pixel_threshold: How much a pixel must change to count as changed.
+        """
+        self.threshold = threshold
+        self.max_skipped = max_skipped
+        self.pixel_threshold = pixel_threshold
+        self._last_kept = None
+        self._skipped_in_a_row = 0
+        self.last_score = None
+        self.kept = 0
+        self.skipped = 0
+
+    def keep(self, luma: Optional[bytes]) -> bool:
+        """Decides whether to keep the frame whose small Y plane is `luma`.
+
+        Frames are always kept when there is nothing to compare them with.
+        """
+        if luma is None or self._last_kept is None:
+            self.last_score = None
+        else:
+            self.last_score = changed_fraction(self._last_kept, luma, self.pixel_threshold)
+            if self.last_score < self.threshold and self._skipped_in_a_row < self.max_skipped:
+                self._skipped_in_a_row += 1
+                self.skipped += 1
+                return False
+        if luma is not None:
+            self._last_kept = luma
+        self._skipped_in_a_row = 0
+        self.kept += 1
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        return {"kept": self.kept, "suppressed": self.skipped}
@@ -0,0 +1,119 @@
+"""One shared handle per I2C bus for all of the sensor drivers.
+
+The drivers used to open the bus themselves: two /dev/i2c-1 files per Atlas
+board, an SMBus each for the MS5837 and TSYS01, and board.I2C() for the
+GPS, all opened again with every Sensor(). Now they all ask for the bus:
+
+    bus = get_bus(1)
+    bus.write_byte(0x77, 0x48)
+    adc = bus.read_i2c_block_data(0x77, 0x00, 3)
+
+The bus is opened on first use and kept for the life of the process. Its
+handle (smbus2) only switches the slave address with an ioctl when it
+changes. Each call is one transaction under the bus's lock, so the API
+and camera threads can read sensors at the same time without their
+transfers interleaving. Hold `bus.lock` around several calls that must not
+be interleaved. set_bus() puts another bus in place of a real one, e.g.
+simulator.i2c's simulated bus.
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    from smbus2 import SMBus, i2c_msg
+except ImportError:
+    SMBus = i2c_msg = None
+
+
+class I2CBus(object):
+    def __init__(self, number: int = 1):
+        """Opens /dev/i2c-<number>.
+
+        Raises:
+            OSError: if the bus does not exist.
+        """
+        if SMBus is None:
+            raise RuntimeError("The I2C bus needs smbus2: pip install smbus2")
+        self.number = number
+        self.lock = threading.RLock()
+        self._smbus = SMBus(number)
+
+    def write_byte(self, address: int, value: int) -> None:
+        with self.lock:
+            self._smbus.write_byte(address, value)
+
+    def read_word_data(self, address: int, register: int) -> int:
+        with self.lock:
+            return self._smbus.read_word_data(address, register)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int) -> List[int]:
+        with self.lock:
+            return self._smbus.read_i2c_block_data(address, register, length)
+
+    def write(self, address: int, data: bytes) -> None:
+        """Writes `data` as a plain I2C message, e.g. an Atlas command."""
+        with self.lock:
+            self._smbus.i2c_rdwr(i2c_msg.write(address, data))
+
+    def read(self, address: int, length: int) -> bytes:
+        """Reads `length` bytes as a plain I2C message, e.g. an Atlas response."""
+        message = i2c_msg.read(address, length)
+        with self.lock:
+            self._smbus.i2c_rdwr(message)
+        return bytes(message)
+
+    def close(self) -> None:
+        with self.lock:
+            self._smbus.close()
+
+
+class BusioI2C(object):
+    """Presents a bus as busio.I2C does, for Adafruit drivers such as adafruit_gps.
+
+    The drivers lock the bus with try_lock() around each of their
+    transactions, which here holds the bus's lock.
+    """
+
+    def __init__(self, bus):
+        self._bus = bus
+
+    def try_lock(self) -> bool:
+        # Waits for the lock rather than have the caller spin on it
+        return self._bus.lock.acquire()
+
+    def unlock(self) -> None:
+        self._bus.lock.release()
+
+    def writeto(self, address: int, buffer, *, start: int = 0, end: Optional[int] = None) -> None:
+        self._bus.write(address, bytes(buffer[start:end]))
+
+    def readfrom_into(self, address: int, buffer, *, start: int = 0, end: Optional[int] = None) -> None:
+        end = len(buffer) if end is None else end
+        buffer[start:end] = self._bus.read(address, end - start)
+
+    def writeto_then_readfrom(self, address: int, buffer_out, buffer_in, *,
+                              out_start: int = 0, out_end: Optional[int] = None, in_start: int = 0, in_end: Optional[int] = None) -> None:
+        with self._bus.lock:
+            self.writeto(address, buffer_out, start=out_start, end=out_end)
+            self.readfrom_into(address, buffer_in, start=in_start, end=in_end)
+
+    def deinit(self) -> None:
+        pass
+
+
+_buses: Dict[int, Any] = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(number: int = 1):
+    """The shared bus /dev/i2c-<number>, opened on first use."""
+    with _buses_lock:
+        if number not in _buses:
+            _buses[number] = I2CBus(number)
+        return _buses[number]
+
+
+def set_bus(number: int, bus) -> None:
+    """Makes `bus` the shared bus `number`, in place of the real one."""
+    with _buses_lock:
+        _buses[number] = bus
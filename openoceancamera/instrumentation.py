@@ -0,0 +1,147 @@
+"""Where the time goes inside a capture cycle.
+
+The capture code, the sensors and the uploader time their stages with the
+process-wide `instrumentation`:
+
+    with stage_timer("capture.jpeg"):
+        camera.capture(stream, format="jpeg", use_video_port=True)
+
+    @timed("sensors.read")
+    def read_sensor_data(self): ...
+
+Each stage's durations go into a histogram with logarithmic buckets, so
+recording costs a lock and a few comparisons whatever the number of
+frames. At the end of a slot the capture code dumps the histograms to a
+small JSON file next to the slot's media and starts afresh. The last
+slot's histograms and those of the slot in progress are served by the
+API at /instrumentation.
+"""
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import clock
+
+# Upper bounds of the histogram buckets, in milliseconds. Durations above
+# the last bound go into an extra overflow bucket.
+BUCKET_BOUNDS_MS = (
+    0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000,
+)
+
+
+class Histogram(object):
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, milliseconds: float) -> None:
+        self.buckets[bisect_left(self.bounds, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.min = milliseconds if self.min is None else min(self.min, milliseconds)
+        self.max = milliseconds if self.max is None else max(self.max, milliseconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Estimates a percentile as the upper bound of the bucket it falls in, capped by the maximum."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                if index < len(self.bounds):
+                    return min(self.bounds[index], self.max)
+                break
+        return self.max
+
+    def report(self) -> Dict[str, Any]:
+        """A compact summary: buckets are listed as [upper bound, count], empty ones left out."""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "min_ms": None if self.min is None else round(self.min, 3),
+            "max_ms": None if self.max is None else round(self.max, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "buckets": [
+                [self.bounds[index] if index < len(self.bounds) else None, count]
+                for index, count in enumerate(self.buckets) if count
+            ],
+        }
+
+
+class Instrumentation(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._since = clock.now()
+        self.last_slot = None
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.add(seconds * 1000)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """Times the with block as `stage`, whether it returns or raises."""
+        started = clock.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, clock.monotonic() - started)
+
+    def stages(self) -> List[str]:
+        with self._lock:
+            return sorted(self._histograms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Returns the histograms recorded since the last end_slot(), by stage."""
+        with self._lock:
+            return {
+                "since": self._since.isoformat(),
+                "stages": {stage: histogram.report() for stage, histogram in sorted(self._histograms.items())},
+            }
+
+    def end_slot(self, name: str) -> Dict[str, Any]:
+        """Takes the histograms recorded for the slot `name` and starts new ones.
+
+        Returns:
+            The slot's histograms, which are also kept as last_slot.
+        """
+        snapshot = self.snapshot()
+        snapshot["slot"] = name
+        snapshot["until"] = clock.now().isoformat()
+        with self._lock:
+            self._histograms = {}
+            self._since = clock.now()
+            self.last_slot = snapshot
+        return snapshot
+
+
+instrumentation = Instrumentation()
+
+
+def stage_timer(stage: str):
+    """Times a with block as `stage` in the process-wide instrumentation."""
+    return instrumentation.timer(stage)
+
+
+def timed(stage: str) -> Callable:
+    """Decorates a function so each call is timed as `stage`."""
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with instrumentation.timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+"""A small dictionary of JSON objects kept in a file across boots.
+
+The file is read on first use and written out atomically on every put(),
+so a power cut leaves either the old or the new contents. A file that
+cannot be read is ignored and replaced at the next put().
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from logger import logger
+
+
+class JSONCache(object):
+    """Entries by key, kept in a JSON file."""
+
+    # What the entries are, for the log messages
+    description = "cached entries"
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: The file the entries are kept in, None to keep them in memory only.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path is not None and os.path.exists(self.path):
+                try:
+                    with open(self.path) as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as err:
+                    logger.warning(f"Ignoring the {self.description} in {self.path}: {err}")
+        return self._entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._load().get(key)
+            return dict(entry) if entry is not None else None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Stores `entry` under `key` and writes the entries out."""
+        with self._lock:
+            self._load()[key] = dict(entry)
+            if self.path is None:
+                return
+            temp_path = f"{self.path}.tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump(self._entries, f, indent=1, sort_keys=True)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except OSError as err:
+                logger.error(f"Could not save the {self.description}: {err}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
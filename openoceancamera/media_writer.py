@@ -0,0 +1,339 @@
+"""Write-behind for everything the camera stores on the external drive.
+
+The exFAT USB drive is mounted through FUSE, and a write or an fsync can
+stall for tens or hundreds of milliseconds. That is longer than a frame at
+burst rates and longer than the encoder's buffers last. So capture code
+and the sensor sampler do not write to the drive themselves. They hand
+their data to the process-wide `media_writer`, which keeps it in a bounded
+queue and writes it out on a thread of its own:
+
+    media_writer.write(path, jpeg_bytes, timeout=0.5)    # a whole file
+    media_writer.append(LOG_FILE, line)                  # e.g. a log record
+    stream = media_writer.open_stream(path)              # for picamera recordings
+
+The writer thread takes everything queued at once. Appends to the same file
+are coalesced into one write and files that are appended to stay open.
+Whole files are not preallocated: on the FUSE-mounted drive glibc emulates
+posix_fallocate by writing a byte per block, which only adds round trips
+before the file is written in full anyway. Instead of syncing every write, it fsyncs everything written since the last sync
+once every `sync_interval` seconds, or when flush() is called (e.g. before
+the camera shuts down).
+
+When the drive cannot keep up and the queue is full, write() waits up to
+its timeout and then drops the file, counting it. append() waits for room,
+as dropping part of a log or a video would corrupt it.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from instrumentation import stage_timer
+from logger import logger
+
+# Bytes held in memory at most. A 1920x1080 JPEG is around 0.5-1 MB and a
+# second of H.264 about 2 MB.
+MAX_QUEUED_BYTES = 64 * 1024 * 1024
+# Seconds between fsyncs, i.e. how much may be lost if the power goes
+SYNC_INTERVAL = 5.0
+# Whole files written since the last sync are kept open until it, up to this many
+MAX_UNSYNCED_FILES = 128
+
+_WRITE, _APPEND, _CLOSE, _FLUSH = range(4)
+
+
+class MediaStream(object):
+    """A file-like object that appends what is written to it through a MediaWriter.
+
+    Pass it to picamera instead of a filename:
+
+        stream = media_writer.open_stream(path)
+        camera.start_recording(stream, format="h264")
+    """
+
+    def __init__(self, writer: "MediaWriter", path: str):
+        self.writer = writer
+        self.name = path
+        self.bytes_written = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.writer.append(self.name, data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if not self.closed:
+            self.writer.close_file(self.name)
+            self.closed = True
+
+
+class MediaWriter(object):
+    def __init__(self,
+                 max_queued_bytes: int = MAX_QUEUED_BYTES,
+                 sync_interval: float = SYNC_INTERVAL,
+                 name: str = "media-writer"):
+        """
+        Args:
+            max_queued_bytes: Bytes held in memory at most.
+            sync_interval: Seconds between fsyncs.
+            name: Name of the writer thread.
+        """
+        self.max_queued_bytes = max_queued_bytes
+        self.sync_interval = sync_interval
+        self._name = name
+        self._thread = None
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._condition = threading.Condition()
+        self._appending = {}
+        self._unsynced = []
+        self._last_sync = time.monotonic()
+        self.written = 0
+        self.appended = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.syncs = 0
+        self.max_depth = 0
+        self.max_queued = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_count = 0
+        self._sync_max = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> "MediaWriter":
+        with self._condition:
+            if not self.running:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+        return self
+
+    def __enter__(self) -> "MediaWriter":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _put(self, item: List, timeout: Optional[float], may_drop: bool) -> bool:
+        size = len(item[2]) if item[2] else 0
+        if not self.running:
+            self.start()
+        with self._condition:
+            def has_room():
+                # A single item larger than the whole queue goes in on its own.
+                return self._queued_bytes == 0 or self._queued_bytes + size <= self.max_queued_bytes
+            if not has_room():
+                if not may_drop:
+                    timeout = None
+                if timeout == 0 or not self._condition.wait_for(has_room, timeout):
+                    self.dropped += 1
+                    return False
+            self._queue.append(item)
+            self._queued_bytes += size
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self.max_queued = max(self.max_queued, self._queued_bytes)
+            self._condition.notify_all()
+        return True
+
+    def write(self, path: str, data: bytes, timeout: Optional[float] = 0) -> bool:
+        """Queues `data` to be written to `path`, replacing the file.
+
+        Args:
+            path: The file to write.
+            data: Its contents.
+            timeout: How long to wait for room in the queue, in seconds. 0 drops
+                the data straight away if the queue is full, None waits forever.
+
+        Returns:
+            True if the data was queued, False if it was dropped.
+        """
+        return self._put([_WRITE, path, data, time.monotonic()], timeout, may_drop=True)
+
+    def append(self, path: str, data: bytes) -> bool:
+        """Queues `data` to be appended to `path`, waiting for room if the queue is full."""
+        return self._put([_APPEND, path, data, time.monotonic()], None, may_drop=False)
+
+    def close_file(self, path: str) -> None:
+        """Closes `path` after the appends queued for it, e.g. at the end of a video segment."""
+        self._put([_CLOSE, path, None, time.monotonic()], None, may_drop=False)
+
+    def open_stream(self, path: str) -> MediaStream:
+        return MediaStream(self, path)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until everything queued so far is written and synced.
+
+        Returns:
+            False if that did not happen within `timeout` seconds.
+        """
+        done = threading.Event()
+        self._put([_FLUSH, None, None, done], None, may_drop=False)
+        return done.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Writes and syncs everything queued, then stops the writer thread."""
+        if not self.running:
+            return
+        self.flush(timeout)
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._condition.notify_all()
+        thread.join(timeout)
+
+    def _take_batch(self) -> Tuple[List[List], int]:
+        """Waits for work, up to the next sync, then takes everything queued, coalescing appends.
+
+        Returns:
+            The batch and its size in bytes, which stays counted in the
+            queued bytes until _release() once the batch is written.
+        """
+        with self._condition:
+            if not self._queue and self._thread is threading.current_thread():
+                self._condition.wait(max(self.sync_interval - (time.monotonic() - self._last_sync), 0.01))
+            items = list(self._queue)
+            self._queue.clear()
+        size = sum(len(item[2]) for item in items if item[2])
+        batch = []
+        open_appends = {}
+        for item in items:
+            kind, path = item[0], item[1]
+            if kind == _APPEND and path in open_appends:
+                # Keeps the time of the oldest part for the latency figures
+                open_appends[path][2] += item[2]
+                continue
+            if kind == _APPEND:
+                item = [kind, path, bytearray(item[2]), item[3]]
+                open_appends[path] = item
+            elif path in open_appends:
+                del open_appends[path]
+            batch.append(item)
+        return batch, size
+
+    def _release(self, size: int) -> None:
+        with self._condition:
+            self._queued_bytes -= size
+            self._condition.notify_all()
+
+    def _write_file(self, path: str, data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except BaseException:
+            os.close(fd)
+            raise
+        self._unsynced.append(fd)
+        if len(self._unsynced) >= MAX_UNSYNCED_FILES:
+            self._sync()
+
+    def _append(self, path: str, data: bytes) -> None:
+        handle = self._appending.get(path)
+        if handle is None:
+            handle = self._appending[path] = open(path, "ab", buffering=0)
+        view = memoryview(data)
+        while view:
+            view = view[handle.write(view):]
+
+    def _close_file(self, path: str) -> None:
+        handle = self._appending.pop(path, None)
+        if handle is not None:
+            os.fsync(handle.fileno())
+            handle.close()
+
+    def _sync(self) -> None:
+        started = time.monotonic()
+        unsynced, self._unsynced = self._unsynced, []
+        for fd in unsynced:
+            try:
+                os.fsync(fd)
+            except OSError as err:
+                logger.error(f"Could not sync a media file: {err}")
+            finally:
+                os.close(fd)
+        for path, handle in list(self._appending.items()):
+            try:
+                os.fsync(handle.fileno())
+            except OSError as err:
+                logger.error(f"Could not sync {path}: {err}")
+        self._last_sync = time.monotonic()
+        self.syncs += 1
+        self._sync_max = max(self._sync_max, self._last_sync - started)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                stopping = self._thread is not threading.current_thread()
+            batch, size = self._take_batch()
+            flushes = []
+            for kind, path, data, queued in batch:
+                if kind == _FLUSH:
+                    flushes.append(queued)
+                    continue
+                try:
+                    if kind == _WRITE:
+                        with stage_timer("writer.write"):
+                            self._write_file(path, data)
+                        self.written += 1
+                    elif kind == _APPEND:
+                        with stage_timer("writer.append"):
+                            self._append(path, data)
+                        self.appended += 1
+                    else:
+                        self._close_file(path)
+                        continue
+                    self.bytes_written += len(data)
+                    latency = time.monotonic() - queued
+                    self._latency_total += latency
+                    self._latency_count += 1
+                    self._latency_max = max(self._latency_max, latency)
+                except Exception as err:
+                    self.failed += 1
+                    logger.error(f"Could not write {path}: {err}")
+            # Only now is the memory of the batch free again
+            self._release(size)
+            if flushes or stopping or time.monotonic() - self._last_sync >= self.sync_interval:
+                try:
+                    with stage_timer("writer.sync"):
+                        self._sync()
+                except Exception as err:
+                    logger.error(f"Could not sync the media files: {err}")
+            for done in flushes:
+                done.set()
+            if stopping:
+                for path in list(self._appending):
+                    self._appending.pop(path).close()
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, counters, and write latency (queued to written) and fsync time in ms."""
+        with self._condition:
+            mean = self._latency_total / self._latency_count if self._latency_count else 0.0
+            return {
+                "queued": len(self._queue),
+                "queued_bytes": self._queued_bytes,
+                "max_queue_depth": self.max_depth,
+                "max_queued_bytes": self.max_queued,
+                "written": self.written,
+                "appended": self.appended,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "bytes_written": self.bytes_written,
+                "syncs": self.syncs,
+                "mean_latency_ms": round(mean * 1000, 3),
+                "max_latency_ms": round(self._latency_max * 1000, 3),
+                "max_sync_ms": round(self._sync_max * 1000, 3),
+            }
+
+
+media_writer = MediaWriter()
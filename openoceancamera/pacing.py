@@ -0,0 +1,82 @@
+"""Frame pacing for timelapse slots.
+
+Frames are scheduled on a fixed grid of deadlines, start + n * period, on
+the monotonic clock. Time spent capturing, reading the sensors and updating
+the annotation comes out of the wait for the next deadline instead of
+adding to it, so the interval between frames does not drift. A frame that
+is more than a whole period late is skipped rather than bunched up with
+the next one, and counted as a missed deadline.
+
+A frame that needs getting ready for, such as switching the light on a
+moment before the photo, asks wait() for a lead and sleeps out the rest
+until the deadline itself, so the lead also comes out of the wait.
+"""
+from typing import Any, Dict, Optional
+
+import clock
+
+
+class FramePacer(object):
+    def __init__(self, period: float, start: Optional[float] = None):
+        """
+        Args:
+            period: Seconds between frames, may be less than a second.
+            start: Monotonic time of the first deadline, defaults to now.
+        """
+        if period <= 0:
+            raise ValueError("The frame period must be positive")
+        self.period = period
+        self.start = clock.monotonic() if start is None else start
+        self._next = 0
+        self.frames = 0
+        self.missed = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+
+    def restart(self, start: Optional[float] = None) -> None:
+        """Starts a new grid of deadlines at `start`, defaulting to now, keeping the statistics."""
+        self.start = clock.monotonic() if start is None else start
+        self._next = 0
+
+    @property
+    def next_deadline(self) -> float:
+        return self.start + self._next * self.period
+
+    def wait(self, end: Optional[float] = None, lead: float = 0.0) -> Optional[float]:
+        """Sleeps until the next deadline that can still be met.
+
+        Args:
+            end: Monotonic time after which no more frames are due.
+            lead: Return this many seconds before the deadline, at most a
+                period; the caller sleeps until the deadline itself.
+
+        Returns:
+            The deadline, in monotonic seconds, or None if it would be after `end`.
+        """
+        now = clock.monotonic()
+        behind = now - self.next_deadline
+        if behind >= self.period:
+            skipped = int(behind // self.period)
+            self.missed += skipped
+            self._next += skipped
+        deadline = self.next_deadline
+        if end is not None and deadline > end:
+            return None
+        clock.sleep(deadline - min(lead, self.period) - now)
+        lateness = max(clock.monotonic() - deadline, 0.0)
+        self.frames += 1
+        self._lateness_total += lateness
+        self._lateness_max = max(self._lateness_max, lateness)
+        self._next += 1
+        return deadline
+
+    def report(self) -> Dict[str, Any]:
+        """Timing of the frames so far. Jitter is how late frames were started, in ms."""
+        mean = self._lateness_total / self.frames if self.frames else 0.0
+        return {
+            "period": self.period,
+            "frames": self.frames,
+            "missed_deadlines": self.missed,
+            "mean_jitter_ms": round(mean * 1000, 3),
+            "max_jitter_ms": round(self._lateness_max * 1000, 3),
+        }
@@ -0,0 +1,154 @@
+"""Plans when the Raspberry Pi is powered on for the whole deployment.
+
+The camera is powered through a WittyPi, and every boot and shutdown costs
+energy. Switching off is only worth it when the Pi stays off long enough to
+save more than that cost. This module walks the whole schedule, merges the
+slots that are too close together to be worth a power cycle into a single
+ON window, and reports how many hours the Pi is expected to be powered on.
+
+The plan can also be written as a WittyPi .wpi schedule script, for
+reviewing a deployment. It is not installed as the WittyPi's schedule:
+the camera thread sets the next shutdown and startup itself, gap by gap,
+and a script run by runScript.sh would override them.
+
+Usage (from the openoceancamera directory):
+    python3 power_plan.py schedule.json [output.wpi]
+"""
+import itertools
+import json
+import sys
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import clock
+from Scheduler import Scheduler
+
+# The Pi is woken up this long before a slot starts...
+BOOT_LEAD = timedelta(minutes=2)
+# ...and shuts down this long after the last slot of a window stops.
+SHUTDOWN_DELAY = timedelta(minutes=2)
+# Staying on for this long uses as much energy as a shutdown and a boot.
+# An OFF period shorter than this costs more than it saves.
+BOOT_COST = timedelta(minutes=6)
+# How far ahead the camera thread and the API plan. Recurring slots are
+# expanded one occurrence at a time, so the whole deployment is only
+# planned from the command line.
+PLAN_HORIZON = timedelta(days=30)
+
+PowerWindow = namedtuple("PowerWindow", ["on", "off"])
+
+
+def power_windows(slots: Iterable[Dict[str, Any]],
+                  boot_lead: timedelta = BOOT_LEAD,
+                  shutdown_delay: timedelta = SHUTDOWN_DELAY,
+                  boot_cost: timedelta = BOOT_COST) -> Iterator[PowerWindow]:
+    """Yields the ON windows for slots given in start order.
+
+    Slots whose OFF period in between would be shorter than `boot_cost`
+    share one window, so the Pi stays up between them.
+    """
+    on = off = None
+    for slot in slots:
+        slot_on = slot["start"] - boot_lead
+        slot_off = slot["stop"] + shutdown_delay
+        if on is None:
+            on, off = slot_on, slot_off
+        elif slot_on - off > boot_cost:
+            yield PowerWindow(on, off)
+            on, off = slot_on, slot_off
+        else:
+            off = max(off, slot_off)
+    if on is not None:
+        yield PowerWindow(on, off)
+
+
+def should_power_off(now: datetime, next_start: datetime,
+                     boot_lead: timedelta = BOOT_LEAD,
+                     shutdown_delay: timedelta = SHUTDOWN_DELAY,
+                     boot_cost: timedelta = BOOT_COST) -> bool:
+    """Returns True if shutting down now and waking for `next_start` saves energy."""
+    return (next_start - boot_lead) - (now + shutdown_delay) > boot_cost
+
+
+def _wpi_duration(duration: timedelta) -> str:
+    """Formats a duration the way .wpi scripts expect it, e.g. "D1 H2 M3 S10"."""
+    seconds = int(duration.total_seconds())
+    parts = []
+    for unit, size in (("D", 86400), ("H", 3600), ("M", 60), ("S", 1)):
+        if seconds >= size:
+            parts.append(f"{unit}{seconds // size}")
+            seconds %= size
+    return " ".join(parts) or "S0"
+
+
+class PowerPlan(object):
+    """The ON windows for a whole deployment."""
+
+    def __init__(self, windows: List[PowerWindow]):
+        self.windows = windows
+
+    @classmethod
+    def from_scheduler(cls, scheduler: Scheduler, now: Optional[datetime] = None,
+                       horizon: Optional[timedelta] = None, **kwargs) -> "PowerPlan":
+        """Plans the slots in `scheduler` that have not stopped by `now`.
+
+        Args:
+            horizon: Only plan the slots that start within this long of
+                `now`, or all of them if None.
+        """
+        slots = scheduler.iter_slots(now)
+        if horizon is not None:
+            until = (now or clock.now()) + horizon
+            slots = itertools.takewhile(lambda slot: slot["start"] < until, slots)
+        return cls(list(power_windows(slots, **kwargs)))
+
+    def powered_on(self) -> timedelta:
+        return sum((window.off - window.on for window in self.windows), timedelta(0))
+
+    def report(self) -> Dict[str, Any]:
+        """Summarises the plan: boots, powered-on hours and duty cycle."""
+        if not self.windows:
+            return {"boots": 0, "powered_on_hours": 0.0, "deployment_hours": 0.0, "duty_cycle": 0.0}
+        powered_on = self.powered_on().total_seconds() / 3600
+        deployment = (self.windows[-1].off - self.windows[0].on).total_seconds() / 3600
+        return {
+            "begin": self.windows[0].on.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": self.windows[-1].off.strftime("%Y-%m-%d %H:%M:%S"),
+            "boots": len(self.windows),
+            "powered_on_hours": round(powered_on, 2),
+            "deployment_hours": round(deployment, 2),
+            "duty_cycle": round(powered_on / deployment, 4) if deployment else 1.0,
+        }
+
+    def to_wpi(self) -> str:
+        """Returns the plan as a WittyPi schedule script."""
+        if not self.windows:
+            return ""
+        lines = [
+            "# Generated from schedule.json by power_plan.py",
+            "",
+            f"BEGIN\t{self.windows[0].on.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"END\t{self.windows[-1].off.strftime('%Y-%m-%d %H:%M:%S')}",
+        ]
+        for i, window in enumerate(self.windows):
+            lines.append(f"ON\t{_wpi_duration(window.off - window.on)}")
+            if i + 1 < len(self.windows):
+                lines.append(f"OFF\t{_wpi_duration(self.windows[i + 1].on - window.off)}")
+        return "\n".join(lines) + "\n"
+
+    def write_wpi(self, path: str) -> None:
+        with open(path, "w") as f:
+            f.write(self.to_wpi())
+
+
+if __name__ == "__main__":
+    from schedule_plan import compile_schedule
+
+    with open(sys.argv[1]) as f:
+        schedule = Scheduler()
+        compile_schedule(json.load(f)).load_into(schedule)
+    plan = PowerPlan.from_scheduler(schedule, now=datetime.min)
+    print(json.dumps(plan.report(), indent=2))
+    if len(sys.argv) > 2:
+        plan.write_wpi(sys.argv[2])
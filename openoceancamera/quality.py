@@ -0,0 +1,150 @@
+"""Cheap image quality scores for timelapse frames.
+
+Before each photo the capture loop takes the newest small YUV frame from
+a spare splitter port (see triggers.LumaMonitor) and scores its brightness
+(Y) plane. There are three measures:
+
+- brightness: the mean level, 0-255
+- clipped: the fraction of pixels that are black or blown out
+- sharpness: the variance of the Laplacian, which is low for blurry,
+  hazy or sediment-filled pictures and for empty dark water
+
+A frame is unusable if it is too dark, too bright, mostly clipped or too
+flat. The scores are added to the slot's <slot>.quality.jsonl sidecar,
+which the upload slot reads to skip unusable frames and send the best
+ones first.
+
+numpy, which is in requirements.txt, does the scoring. The pure Python
+fallback is only for machines without it, e.g. to run the tests, and is
+tens of times slower.
+"""
+import json
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Resolution of the frames that are scored, with no padding in picamera's YUV output
+QUALITY_RESOLUTION = (128, 96)
+# Y levels at or beyond these count as clipped (picamera's YUV is BT.601,
+# where black is 16 and white 235)
+CLIP_LOW = 16
+CLIP_HIGH = 235
+# What a usable frame must have
+MIN_BRIGHTNESS = 24
+MAX_BRIGHTNESS = 230
+MAX_CLIPPED = 0.5
+MIN_SHARPNESS = 4.0
+# Sharpness at which a frame gets half the sharpness part of its score
+HALF_SCORE_SHARPNESS = 50.0
+
+QUALITY_SUFFIX = ".quality.jsonl"
+
+
+def _luma_plane(luma: bytes, resolution: Tuple[int, int]) -> Tuple[int, int, int]:
+    """Returns the row stride of a Y plane as picamera pads it, and the width and height to use."""
+    width, height = resolution
+    stride = (width + 31) // 32 * 32
+    return stride, width, min(height, len(luma) // stride)
+
+
+def frame_quality(luma: bytes, resolution: Tuple[int, int] = QUALITY_RESOLUTION) -> Dict[str, Any]:
+    """Scores the Y plane of a small frame.
+
+    Returns:
+        "brightness", "clipped", "sharpness", a "score" from 0 to 1 for
+        ranking frames, and whether the frame is "usable".
+    """
+    stride, width, height = _luma_plane(luma, resolution)
+    if height < 3 or width < 3:
+        raise ValueError(f"Frame too small to score: {len(luma)} bytes")
+    if numpy is not None:
+        y = numpy.frombuffer(luma, dtype=numpy.uint8, count=stride * height).reshape(height, stride)[:, :width]
+        clipped = float(numpy.count_nonzero((y <= CLIP_LOW) | (y >= CLIP_HIGH))) / y.size
+        y = y.astype(numpy.float32)
+        brightness = float(y.mean())
+        laplacian = y[:-2, 1:-1] + y[2:, 1:-1] + y[1:-1, :-2] + y[1:-1, 2:] - 4 * y[1:-1, 1:-1]
+        sharpness = float(laplacian.var())
+    else:
+        rows = [luma[row * stride:row * stride + width] for row in range(height)]
+        total = sum(sum(row) for row in rows)
+        brightness = total / (width * height)
+        clipped = sum(1 for row in rows for value in row if value <= CLIP_LOW or value >= CLIP_HIGH) / (width * height)
+        values = []
+        for row in range(1, height - 1):
+            above, here, below = rows[row - 1], rows[row], rows[row + 1]
+            values.extend(above[x] + below[x] + here[x - 1] + here[x + 1] - 4 * here[x] for x in range(1, width - 1))
+        mean = sum(values) / len(values)
+        sharpness = sum((value - mean) ** 2 for value in values) / len(values)
+    usable = (MIN_BRIGHTNESS <= brightness <= MAX_BRIGHTNESS
+              and clipped <= MAX_CLIPPED
+              and sharpness >= MIN_SHARPNESS)
+    exposure = max(1 - abs(brightness - 128) / 128, 0.0)
+    score = exposure * (1 - clipped) * sharpness / (sharpness + HALF_SCORE_SHARPNESS)
+    return {
+        "brightness": round(brightness, 1),
+        "clipped": round(clipped, 4),
+        "sharpness": round(sharpness, 2),
+        "score": round(score, 4),
+        "usable": usable,
+    }
+
+
+def load_scores(directory: str) -> Dict[str, Dict[str, Any]]:
+    """Reads the quality sidecars in `directory` and below, by the path of each frame relative to `directory`.
+
+    Lines that cannot be read, e.g. the last one of a slot cut short by a
+    power loss, are skipped.
+    """
+    scores = {}
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(QUALITY_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(root, name)) as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            scores[os.path.relpath(os.path.join(root, entry["file"]), directory)] = entry
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            except OSError:
+                continue
+    return scores
+
+
+def upload_order(paths: Sequence[str], scores: Dict[str, Dict[str, Any]], directory: str) -> Tuple[List[str], List[str]]:
+    """Orders files for upload: usable photos best first, then unscored photos, then videos.
+
+    Unscored photos are the raw and bracketed captures and photos taken
+    before scoring. Videos go last as they are the largest, so an upload
+    slot that ends early has sent the best photos.
+
+    Args:
+        paths: The files in `directory` and below.
+        scores: The scores from load_scores(directory).
+        directory: The directory the scores were loaded from.
+
+    Returns:
+        The files to upload, in order, and the unusable photos left out.
+    """
+    unscored = []
+    scored = []
+    skipped = []
+    for path in paths:
+        entry = scores.get(os.path.relpath(path, directory))
+        if entry is None:
+            unscored.append(path)
+        elif entry.get("usable", True):
+            scored.append((-entry.get("score", 0), path))
+        else:
+            skipped.append(path)
+    scored.sort()
+    # Stable, so the unscored files keep their order within each group
+    unscored.sort(key=lambda path: path.endswith(".h264"))
+    return [path for _, path in scored] + unscored, skipped
+
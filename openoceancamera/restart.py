@@ -1,4 +1,5 @@
 import os 
+from datetime import datetime
 from time import sleep 
 
 def restart_code():
@@ -7,4 +8,15 @@ def restart_code():
 
 def reboot_camera():
     sleep(300)
-    os.system("sudo reboot")
\ No newline at end of file
+    os.system("sudo reboot")
+
+def set_startup_time(when: datetime) -> None:
+    """Tells the WittyPi to power the Pi on at `when` (day of month, hour, minute, second)."""
+    startup_time = when.strftime("%d %H:%M:%S")
+    os.system(f'sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 5 "{startup_time}"')
+
+
+def set_shutdown_time(when: datetime) -> None:
+    """Tells the WittyPi to shut the Pi down at `when` (day of month, hour, minute)."""
+    shutdown_time = when.strftime("%d %H:%M")
+    os.system(f'sudo sh /home/pi/openoceancamera/wittypi/wittycam.sh 4 "{shutdown_time}"')
@@ -0,0 +1,551 @@
+"""Compiles schedule.json into a binary schedule plan that loads quickly at boot.
+
+The schedule is compiled once, when /setSchedule receives it. Compiling
+validates every slot, fills in the defaults, merges overlapping slots,
+rejects recurring slots that overlap any other slot and sorts them. The
+result is written next to schedule.json as a small, versioned binary file.
+At every WittyPi wake the camera thread memory-maps that file instead of
+re-reading and re-parsing the JSON.
+
+File layout (little endian):
+    header:  magic b"OOCP", format version, slot count, rule count,
+             size of the extras blob
+    records: one fixed-size record per slot or recurring rule (see _RECORD)
+    extras:  UTF-8 JSON objects holding any slot settings that do not have
+             a column in the record, referenced by (offset, length)
+"""
+import json
+import math
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from frame_filter import MAX_SKIPPED, SUPPRESS_MODES
+from logger import logger
+from Scheduler import DATETIME_FORMAT, OPTIONAL_SETTINGS, RecurringSlot, Scheduler, parse_slot_settings
+
+PLAN_MAGIC = b"OOCP"
+PLAN_VERSION = 1
+
+# magic, version, reserved, slot count, rule count, extras size
+_HEADER = struct.Struct("<4sHHIII")
+# start, stop, every, duration (both 0 for a plain slot), iso, frequency,
+# shutter_speed, video, upload, wiper, exposure mode, light,
+# exposure_compensation, framerate, resolution x, resolution y,
+# extras offset, extras length
+_RECORD = struct.Struct("<qqIIIdIbBBBdhdHHII")
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_VIDEO_UNSET = -1
+
+# The exposure modes supported by picamera.
+EXPOSURE_MODES = (
+    "off", "auto", "night", "nightpreview", "backlight", "spotlight", "sports",
+    "snow", "beach", "verylong", "fixedfps", "antishake", "fireworks",
+)
+
+# The highest rate the video port can deliver full-frame JPEGs at.
+MAX_BURST_FPS = 30
+
+# Seconds between raw frames at least: a still port capture takes most of a
+# second and its 6-10 MB of raw data take as long again to write out.
+MIN_RAW_PERIOD = 2
+
+# How a bracket varies the exposure between its frames: by exposure
+# compensation steps of 1/6 stop, or by shutter speeds in microseconds
+BRACKET_KINDS = ("compensation", "shutter_speeds")
+MAX_BRACKET_FRAMES = 9
+# The video port exposes for at most a frame, so the longest shutter speed
+# sets the framerate; below 1 fps the sequence would take too long.
+MAX_BRACKET_SHUTTER = 1000000
+
+# The longest pre-trigger buffer. It is held in memory: at
+# triggers.TRIGGER_BITRATE, 30 s of video take about 15 MB.
+MAX_PRE_TRIGGER_SECONDS = 30
+
+# Settings that have a column in _RECORD. Everything else returned by
+# parse_slot_settings is kept in the extras blob, apart from
+# OPTIONAL_SETTINGS that are None, which are left out.
+_RECORD_SETTINGS = (
+    "iso", "frequency", "shutter_speed", "video", "upload", "wiper", "exposure_mode",
+    "light", "exposure_compensation", "framerate", "resolution",
+)
+
+
+class ScheduleValidationError(ValueError):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+
+class SchedulePlanError(Exception):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+
+class SchedulePlan(object):
+    """A validated, sorted schedule: plain slots plus recurring rules."""
+
+    def __init__(self, slots: List[Dict[str, Any]], rules: List[RecurringSlot]):
+        self.slots = slots
+        self.rules = rules
+
+    def load_into(self, scheduler: Scheduler) -> None:
+        scheduler.load_slots(self.slots, self.rules)
+
+
+def _to_seconds(value: datetime) -> int:
+    return int((value - _EPOCH).total_seconds())
+
+
+def _from_seconds(value: int) -> datetime:
+    return _EPOCH + timedelta(seconds=value)
+
+
+def _parse_time(slot: Dict[str, Any], key: str, number: int) -> datetime:
+    try:
+        return datetime.strptime(slot[key], DATETIME_FORMAT)
+    except KeyError:
+        raise ScheduleValidationError(f"Slot {number}: missing '{key}'")
+    except (TypeError, ValueError):
+        raise ScheduleValidationError(f"Slot {number}: '{key}' must look like 2021-08-01-12:00:00")
+
+
+def _number(value: Any) -> Any:
+    """Converts numbers sent as strings by the app, e.g. "100", to int or float."""
+    if isinstance(value, str):
+        value = float(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TypeError(value)
+    if not math.isfinite(value):
+        raise ValueError(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _validate_settings(settings: Dict[str, Any], number: int) -> None:
+    """Checks the settings of one slot, normalising numbers in place."""
+    numeric = ("iso", "frequency", "shutter_speed", "light", "exposure_compensation", "framerate")
+    for key in numeric:
+        try:
+            settings[key] = _number(settings[key])
+        except (TypeError, ValueError):
+            raise ScheduleValidationError(f"Slot {number}: '{key}' must be a number")
+        if settings[key] < 0 and key != "exposure_compensation":
+            raise ScheduleValidationError(f"Slot {number}: '{key}' must not be negative")
+    # picamera takes these as integers, and the plan stores them as such
+    for key in ("iso", "shutter_speed", "exposure_compensation"):
+        if not isinstance(settings[key], int):
+            raise ScheduleValidationError(f"Slot {number}: '{key}' must be a whole number")
+    if settings["frequency"] <= 0:
+        raise ScheduleValidationError(f"Slot {number}: 'frequency' must be positive")
+    if not 0 <= settings["light"] <= 100:
+        raise ScheduleValidationError(f"Slot {number}: 'light' must be between 0 and 100")
+    if not -25 <= settings["exposure_compensation"] <= 25:
+        raise ScheduleValidationError(f"Slot {number}: 'exposure_compensation' must be between -25 and 25")
+    if settings["exposure_mode"] not in EXPOSURE_MODES:
+        raise ScheduleValidationError(f"Slot {number}: unknown exposure mode '{settings['exposure_mode']}'")
+    try:
+        x, y = (int(value) for value in settings["resolution"])
+    except (TypeError, ValueError):
+        raise ScheduleValidationError(f"Slot {number}: invalid resolution {settings['resolution']}")
+    if not (0 < x <= 0xFFFF and 0 < y <= 0xFFFF):
+        raise ScheduleValidationError(f"Slot {number}: invalid resolution {settings['resolution']}")
+    settings["resolution"] = (x, y)
+    if settings["burst"] is not None:
+        settings["burst"] = _validate_burst(settings["burst"], number)
+        if settings["video"]:
+            raise ScheduleValidationError(f"Slot {number}: a slot cannot be both 'video' and 'burst'")
+    for key in ("segment_seconds", "segment_mb"):
+        if settings[key] is None:
+            continue
+        try:
+            settings[key] = _number(settings[key])
+        except (TypeError, ValueError):
+            raise ScheduleValidationError(f"Slot {number}: '{key}' must be a number")
+        if settings[key] <= 0:
+            raise ScheduleValidationError(f"Slot {number}: '{key}' must be positive")
+        if not settings["video"]:
+            raise ScheduleValidationError(f"Slot {number}: '{key}' only applies to video slots")
+    if settings["trigger"] is not None:
+        settings["trigger"] = _validate_trigger(settings["trigger"], number)
+        if not settings["video"]:
+            raise ScheduleValidationError(f"Slot {number}: 'trigger' only applies to video slots")
+        if settings["segment_seconds"] or settings["segment_mb"]:
+            raise ScheduleValidationError(f"Slot {number}: a triggered slot cannot be segmented")
+    if settings["suppress"] is not None:
+        settings["suppress"] = _validate_suppress(settings["suppress"], number)
+        if settings["video"] or settings["burst"] is not None:
+            raise ScheduleValidationError(f"Slot {number}: 'suppress' only applies to timelapse slots")
+    if settings["raw"] is not None:
+        if not isinstance(settings["raw"], bool):
+            raise ScheduleValidationError(f"Slot {number}: 'raw' must be true or false")
+        if settings["raw"] and (settings["video"] or settings["burst"] is not None):
+            raise ScheduleValidationError(f"Slot {number}: 'raw' only applies to timelapse slots")
+        if settings["raw"] and settings["frequency"] < MIN_RAW_PERIOD:
+            raise ScheduleValidationError(f"Slot {number}: raw frames can be taken every {MIN_RAW_PERIOD} s at most")
+    if settings["bracket"] is not None:
+        settings["bracket"] = _validate_bracket(settings["bracket"], number)
+        if settings["video"] or settings["burst"] is not None or settings["raw"]:
+            raise ScheduleValidationError(f"Slot {number}: 'bracket' only applies to timelapse slots without 'raw'")
+
+
+def _validate_suppress(suppress: Any, number: int) -> Dict[str, Any]:
+    if not isinstance(suppress, dict):
+        raise ScheduleValidationError(f"Slot {number}: 'suppress' must be an object")
+    result = {"mode": suppress.get("mode", "thumbnail")}
+    if result["mode"] not in SUPPRESS_MODES:
+        raise ScheduleValidationError(f"Slot {number}: suppress 'mode' must be one of {', '.join(SUPPRESS_MODES)}")
+    for key, default in (("threshold", None), ("max_skipped", MAX_SKIPPED)):
+        try:
+            result[key] = _number(suppress[key] if default is None else suppress.get(key, default))
+        except KeyError:
+            raise ScheduleValidationError(f"Slot {number}: 'suppress' is missing '{key}'")
+        except (TypeError, ValueError):
+            raise ScheduleValidationError(f"Slot {number}: suppress '{key}' must be a number")
+    if not 0 < result["threshold"] < 1:
+        raise ScheduleValidationError(f"Slot {number}: suppress 'threshold' must be a fraction between 0 and 1")
+    if result["max_skipped"] < 0 or not isinstance(result["max_skipped"], int):
+        raise ScheduleValidationError(f"Slot {number}: suppress 'max_skipped' must be a whole number")
+    return result
+
+
+def _validate_bracket(bracket: Any, number: int) -> Dict[str, Any]:
+    if not isinstance(bracket, dict):
+        raise ScheduleValidationError(f"Slot {number}: 'bracket' must be an object")
+    kinds = [kind for kind in BRACKET_KINDS if kind in bracket]
+    if len(kinds) != 1:
+        raise ScheduleValidationError(f"Slot {number}: 'bracket' needs either 'compensation' or 'shutter_speeds'")
+    kind = kinds[0]
+    values = bracket[kind]
+    if not isinstance(values, list) or not 2 <= len(values) <= MAX_BRACKET_FRAMES:
+        raise ScheduleValidationError(f"Slot {number}: bracket '{kind}' must be a list of 2 to {MAX_BRACKET_FRAMES} values")
+    try:
+        values = [_number(value) for value in values]
+    except (TypeError, ValueError):
+        raise ScheduleValidationError(f"Slot {number}: bracket '{kind}' must be numbers")
+    if kind == "compensation" and not all(isinstance(value, int) and -25 <= value <= 25 for value in values):
+        raise ScheduleValidationError(f"Slot {number}: bracket 'compensation' must be whole numbers between -25 and 25")
+    if kind == "shutter_speeds" and not all(isinstance(value, int) and 0 < value <= MAX_BRACKET_SHUTTER for value in values):
+        raise ScheduleValidationError(f"Slot {number}: bracket 'shutter_speeds' must be whole numbers of microseconds up to {MAX_BRACKET_SHUTTER}")
+    return {kind: values}
+
+
+def _validate_burst(burst: Any, number: int) -> Dict[str, Any]:
+    if not isinstance(burst, dict):
+        raise ScheduleValidationError(f"Slot {number}: 'burst' must be an object")
+    result = {}
+    for key, default in (("fps", None), ("duration", None), ("interval", 0)):
+        try:
+            result[key] = _number(burst[key] if default is None else burst.get(key, default))
+        except KeyError:
+            raise ScheduleValidationError(f"Slot {number}: 'burst' is missing '{key}'")
+        except (TypeError, ValueError):
+            raise ScheduleValidationError(f"Slot {number}: burst '{key}' must be a number")
+    if not 0 < result["fps"] <= MAX_BURST_FPS:
+        raise ScheduleValidationError(f"Slot {number}: burst 'fps' must be between 0 and {MAX_BURST_FPS}")
+    if result["duration"] <= 0:
+        raise ScheduleValidationError(f"Slot {number}: burst 'duration' must be positive")
+    if result["interval"] and result["interval"] < result["duration"]:
+        raise ScheduleValidationError(f"Slot {number}: burst 'interval' must not be shorter than its 'duration'")
+    return result
+
+
+def _validate_trigger(trigger: Any, number: int) -> Dict[str, Any]:
+    if not isinstance(trigger, dict):
+        raise ScheduleValidationError(f"Slot {number}: 'trigger' must be an object")
+    result = {}
+    defaults = (("pre_seconds", 10), ("post_seconds", 10), ("motion", None),
+                ("luminosity_change", None), ("depth_change", None))
+    for key, default in defaults:
+        value = trigger.get(key, default)
+        if value is None:
+            result[key] = None
+            continue
+        try:
+            result[key] = _number(value)
+        except (TypeError, ValueError):
+            raise ScheduleValidationError(f"Slot {number}: trigger '{key}' must be a number")
+        if result[key] < 0:
+            raise ScheduleValidationError(f"Slot {number}: trigger '{key}' must not be negative")
+    if not 0 < result["pre_seconds"] <= MAX_PRE_TRIGGER_SECONDS:
+        raise ScheduleValidationError(f"Slot {number}: trigger 'pre_seconds' must be between 0 and {MAX_PRE_TRIGGER_SECONDS}")
+    if result["motion"] is not None and not 0 < result["motion"] < 1:
+        raise ScheduleValidationError(f"Slot {number}: trigger 'motion' must be a fraction between 0 and 1")
+    if not (result["motion"] or result["luminosity_change"] or result["depth_change"]):
+        raise ScheduleValidationError(f"Slot {number}: 'trigger' needs 'motion', 'luminosity_change' or 'depth_change'")
+    return result
+
+
+def _merge_overlaps(slots: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merges overlapping slots, which must already be sorted by start time.
+
+    Overlapping slots with the same settings become one slot. Otherwise the
+    earlier slot keeps its settings and the later one is shortened to start
+    when the earlier one stops, or dropped if it is covered entirely.
+    """
+    merged = []
+    for slot in slots:
+        if merged and slot["start"] <= merged[-1]["stop"]:
+            previous = merged[-1]
+            same_settings = all(
+                slot[key] == previous[key] for key in slot if key not in ("start", "stop")
+            )
+            if same_settings:
+                previous["stop"] = max(previous["stop"], slot["stop"])
+                continue
+            logger.warning(
+                f"Slot starting {slot['start']} overlaps the slot starting {previous['start']}"
+            )
+            if slot["stop"] <= previous["stop"]:
+                continue
+            slot["start"] = previous["stop"] + timedelta(seconds=1)
+            if slot["start"] >= slot["stop"]:
+                continue
+        merged.append(slot)
+    return merged
+
+
+def _rule_overlap(rule: RecurringSlot, start: datetime, stop: datetime) -> Optional[datetime]:
+    """Returns the start of the first occurrence of `rule` that overlaps `start` to `stop`, or None."""
+    number = rule.first_unfinished(start)
+    for frame in (rule.occurrence(number), rule.occurrence(number + 1)):
+        # The first unfinished occurrence may stop exactly at `start`
+        if frame is not None and frame["stop"] > start:
+            return frame["start"] if frame["start"] < stop else None
+    return None
+
+
+def _rules_overlap(first: RecurringSlot, second: RecurringSlot) -> Optional[datetime]:
+    """Returns the start of the first occurrence of `first` that overlaps one of `second`, or None.
+
+    Only the occurrences in one period of both rules together are checked:
+    after that the two line up the same way again.
+    """
+    begin = max(first.begin, second.begin)
+    end = min(first.end, second.end)
+    first_every = first.every // _MICROSECOND
+    second_every = second.every // _MICROSECOND
+    period = first_every * second_every // math.gcd(first_every, second_every)
+    number = first.first_unfinished(begin)
+    # Plus one for an occurrence that `begin` cuts into
+    for number in range(number, number + period // first_every + 1):
+        frame = first.occurrence(number)
+        if frame is None or frame["start"] >= end:
+            break
+        overlap = _rule_overlap(second, frame["start"], frame["stop"])
+        if overlap is not None:
+            return max(frame["start"], overlap)
+    return None
+
+
+def _check_rule_overlaps(slots: List[Dict[str, Any]], rules: List[RecurringSlot]) -> None:
+    """Rejects recurring slots that overlap a plain slot or another recurring slot.
+
+    Unlike plain slots, these cannot be merged: the camera thread would
+    run one and then treat both as done.
+    """
+    for i, rule in enumerate(rules):
+        for slot in slots:
+            overlap = _rule_overlap(rule, slot["start"], slot["stop"])
+            if overlap is not None:
+                raise ScheduleValidationError(
+                    f"The recurring slot starting {rule.begin} overlaps the slot starting {slot['start']}"
+                )
+        for other in rules[i + 1:]:
+            # Walking the rule that repeats less often takes fewer steps
+            sparse, dense = (rule, other) if rule.every >= other.every else (other, rule)
+            overlap = _rules_overlap(sparse, dense)
+            if overlap is not None:
+                raise ScheduleValidationError(
+                    f"The recurring slots starting {rule.begin} and {other.begin} overlap at {overlap}"
+                )
+
+
+def compile_schedule(data: List[Dict[str, Any]]) -> SchedulePlan:
+    """Validates a schedule.json document and turns it into a SchedulePlan.
+
+    Raises:
+        ScheduleValidationError: if any slot is malformed, or a recurring
+            slot overlaps another slot.
+    """
+    if not isinstance(data, list):
+        raise ScheduleValidationError("The schedule must be a list of slots")
+    slots = []
+    rules = []
+    for number, slot in enumerate(data):
+        if not isinstance(slot, dict):
+            raise ScheduleValidationError(f"Slot {number}: must be an object")
+        start = _parse_time(slot, "start", number)
+        stop = _parse_time(slot, "stop", number)
+        if stop <= start:
+            raise ScheduleValidationError(f"Slot {number}: 'stop' must be after 'start'")
+        try:
+            settings = parse_slot_settings(slot)
+        except (KeyError, TypeError) as err:
+            raise ScheduleValidationError(f"Slot {number}: {err}")
+        _validate_settings(settings, number)
+        if slot.get("repeat"):
+            try:
+                rule = RecurringSlot(
+                    settings, start, stop,
+                    every=timedelta(minutes=slot["repeat"]["every"]),
+                    duration=timedelta(minutes=slot["repeat"]["duration"]),
+                )
+            except (KeyError, TypeError, ValueError) as err:
+                raise ScheduleValidationError(f"Slot {number}: invalid 'repeat': {err}")
+            rules.append(rule)
+        else:
+            settings["start"] = start
+            settings["stop"] = stop
+            slots.append(settings)
+    slots.sort(key=lambda x: x["start"])
+    rules.sort(key=lambda x: x.begin)
+    slots = _merge_overlaps(slots)
+    _check_rule_overlaps(slots, rules)
+    return SchedulePlan(slots, rules)
+
+
+def _pack_record(settings: Dict[str, Any], start: datetime, stop: datetime,
+                 every: timedelta, duration: timedelta, extras: bytearray) -> bytes:
+    leftover = {key: value for key, value in settings.items()
+                if key not in _RECORD_SETTINGS and key not in ("start", "stop")
+                and not (key in OPTIONAL_SETTINGS and value is None)}
+    extras_offset = len(extras)
+    extras_length = 0
+    if leftover:
+        blob = json.dumps(leftover, separators=(",", ":")).encode("utf-8")
+        extras += blob
+        extras_length = len(blob)
+    video = _VIDEO_UNSET if settings["video"] is None else int(bool(settings["video"]))
+    return _RECORD.pack(
+        _to_seconds(start), _to_seconds(stop),
+        int(every.total_seconds()), int(duration.total_seconds()),
+        int(settings["iso"]), float(settings["frequency"]), int(settings["shutter_speed"]),
+        video, int(bool(settings["upload"])), int(bool(settings["wiper"])),
+        EXPOSURE_MODES.index(settings["exposure_mode"]),
+        float(settings["light"]), int(settings["exposure_compensation"]), float(settings["framerate"]),
+        settings["resolution"][0], settings["resolution"][1],
+        extras_offset, extras_length,
+    )
+
+
+def write_plan(plan: SchedulePlan, path: str) -> None:
+    """Writes the plan to `path`, replacing any previous plan atomically."""
+    records = []
+    extras = bytearray()
+    for slot in plan.slots:
+        records.append(_pack_record(slot, slot["start"], slot["stop"], timedelta(0), timedelta(0), extras))
+    for rule in plan.rules:
+        records.append(_pack_record(rule.settings, rule.begin, rule.end, rule.every, rule.duration, extras))
+    header = _HEADER.pack(PLAN_MAGIC, PLAN_VERSION, 0, len(plan.slots), len(plan.rules), len(extras))
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(b"".join(records))
+        f.write(extras)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def _unpack_record(record: Tuple, extras: memoryview) -> Tuple[Dict[str, Any], int, int, int, int]:
+    (start, stop, every, duration, iso, frequency, shutter_speed, video, upload, wiper,
+     exposure_mode, light, exposure_compensation, framerate, res_x, res_y,
+     extras_offset, extras_length) = record
+    settings = {
+        "iso": iso,
+        "frequency": int(frequency) if frequency.is_integer() else frequency,
+        "shutter_speed": shutter_speed,
+        "video": None if video == _VIDEO_UNSET else bool(video),
+        "upload": bool(upload),
+        "light": int(light) if light.is_integer() else light,
+        "wiper": bool(wiper),
+        "exposure_mode": EXPOSURE_MODES[exposure_mode],
+        "exposure_compensation": exposure_compensation,
+        "framerate": int(framerate) if framerate.is_integer() else framerate,
+        "resolution": (res_x, res_y),
+    }
+    if extras_length:
+        blob = bytes(extras[extras_offset:extras_offset + extras_length])
+        settings.update(json.loads(blob.decode("utf-8")))
+    for key in OPTIONAL_SETTINGS:
+        settings.setdefault(key, None)
+    return settings, start, stop, every, duration
+
+
+def read_plan(path: str) -> SchedulePlan:
+    """Memory-maps a plan written by write_plan and decodes it.
+
+    Raises:
+        SchedulePlanError: if the file is not a plan of the current version.
+    """
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise SchedulePlanError(f"{path} is empty")
+    with mapped:
+        view = memoryview(mapped)
+        try:
+            if len(view) < _HEADER.size:
+                raise SchedulePlanError(f"{path} is truncated")
+            magic, version, _, slot_count, rule_count, extras_size = _HEADER.unpack_from(view)
+            if magic != PLAN_MAGIC:
+                raise SchedulePlanError(f"{path} is not a schedule plan")
+            if version != PLAN_VERSION:
+                raise SchedulePlanError(f"{path} has plan version {version}, expected {PLAN_VERSION}")
+            records_end = _HEADER.size + (slot_count + rule_count) * _RECORD.size
+            if len(view) != records_end + extras_size:
+                raise SchedulePlanError(f"{path} is truncated")
+            # Every view must be released before the mmap is closed
+            records = view[_HEADER.size:records_end]
+            extras = view[records_end:]
+            slots = []
+            rules = []
+            try:
+                for number, record in enumerate(_RECORD.iter_unpack(records)):
+                    settings, start, stop, every, duration = _unpack_record(record, extras)
+                    if number < slot_count:
+                        settings["start"] = _from_seconds(start)
+                        settings["stop"] = _from_seconds(stop)
+                        slots.append(settings)
+                    else:
+                        rules.append(RecurringSlot(
+                            settings, _from_seconds(start), _from_seconds(stop),
+                            timedelta(seconds=every), timedelta(seconds=duration),
+                        ))
+            except (ValueError, TypeError, IndexError, OverflowError) as err:
+                # Includes the JSON and UTF-8 errors of a corrupt extras blob
+                raise SchedulePlanError(f"{path} has a corrupt record: {err}")
+            finally:
+                records.release()
+                extras.release()
+        finally:
+            view.release()
+    return SchedulePlan(slots, rules)
+
+
+def load_schedule(scheduler: Scheduler, schedule_path: str, plan_path: str) -> None:
+    """Loads the schedule into `scheduler`, from the compiled plan when it is up to date.
+
+    If the plan is missing, older than schedule.json or unreadable, the
+    JSON is compiled again and a fresh plan is written for the next boot.
+    """
+    plan = None
+    try:
+        if os.path.getmtime(plan_path) >= os.path.getmtime(schedule_path):
+            plan = read_plan(plan_path)
+    except (OSError, SchedulePlanError) as err:
+        logger.info(f"Schedule plan not used: {err}")
+    if plan is None:
+        with open(schedule_path) as f:
+            plan = compile_schedule(json.load(f))
+        try:
+            write_plan(plan, plan_path)
+        except OSError as err:
+            logger.error(f"Could not write the schedule plan: {err}")
+    plan.load_into(scheduler)
@@ -2,8 +2,13 @@ from .sensors import PressureSensor
 from .sensors import LuminositySensor
 from .sensors import TemperatureSensor
 from .sensors import Sensor
+from .sensors import sensor_registry
+from .sensors import AtlasReadings
+from .sampler import SensorSampler, sensor_sampler
 from .atlas_sensors import EC_Sensor
 from .atlas_sensors import DO_Sensor
 from .atlas_sensors import PH_Sensor
+from .atlas_sensors import ECReading, DOReading, PHReading
+from .atlasI2C import AtlasReadError
 
 # TODO: Check if Atlas sensors need to be added here
\ No newline at end of file
@@ -11,12 +11,25 @@ Note:
     https://github.com/google/styleguide/blob/gh-pages/pyguide.md#doc-function-args
 """
 from abc import abstractmethod, ABC
-import io
+from collections import namedtuple
 import sys
-import fcntl
 import time
 import copy
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from atlas_config import AtlasConfigCache, config_key
+from constants import ATLAS_CONFIG_PATH
+from conversions import run_serially
+from i2c_bus import get_bus
+
+# What each board was configured with, so bring-up can skip reconfiguring it
+config_cache = AtlasConfigCache(ATLAS_CONFIG_PATH)
+
+
+class AtlasReadError(Exception):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
 
 class AtlasI2C(ABC):
     """An abstract, parent/super class for Atlas Sensors.
@@ -32,9 +45,11 @@ class AtlasI2C(ABC):
     
     Public Methods:
         query: Writes and reads from device, returns response.
+        read_all: Takes one reading and returns all its parameters as a record.
+        conversion: read_all as a conversion, to overlap with other sensors' readings.
         sleep: Puts device to sleep.
         get_device_info: Gets basic info of sensor (see method docstring for more).
-        close: Closes IO streams.
+        close: Kept for compatibility; the shared bus stays open.
         factory_reset: Resets the device to factory settings.
         list_i2c_devices: Lists addresses of all devices connected to I2C bus.
     
@@ -42,6 +57,12 @@ class AtlasI2C(ABC):
         def ChildClassForSpecificSensor(AtlasI2C):
             ...
     """
+    # The record read_all returns, with a field per parameter in the order
+    # the device reports them. Set by each subclass.
+    READING = namedtuple('Reading', [])
+    # The outputs to enable, for sensors that report several parameters.
+    # Set by each such subclass.
+    _PARAMS = []
     _LONG_TIMEOUT = 1.5
     _SHORT_TIMEOUT = .3
     _LONG_TIMEOUT_COMMANDS = ('R', 'CAL')
@@ -52,29 +73,20 @@ class AtlasI2C(ABC):
                  moduletype: str = '', 
                  name: str = '', 
                  bus: int = 1):
-        """Initialises sensor with main attributes, and opens read/write file streams.
+        """Initialises sensor with main attributes on the shared I2C bus.
 
         Assigns an I2C address, I2C bus, name, and moduletype to the sensor.
 
-        It opens two file streams, one for reading and one for writing.
         The specific I2C channel is selected with bus. It is usually 1,
-        except for older versions where its 0. wb and rb indicate binary
-        read and write.
+        except for older versions where its 0. The bus is shared with the
+        other sensors, see i2c_bus.py.
         """
         self._address = address
         self._bus = bus
         self._long_timeout = self._LONG_TIMEOUT
         self._short_timeout = self._SHORT_TIMEOUT
 
-        # Opens two IO file streams to read/write to the device with I2C.
-        self._file_read = io.open(file=f'/dev/i2c-{self._bus}', 
-                                 mode='rb', 
-                                 buffering=0)
-        self._file_write = io.open(file=f'/dev/i2c-{self._bus}',
-                                  mode='wb', 
-                                  buffering=0)
-
-        self._set_i2c_address(self._address)    # Sets the I2C address.
+        self._i2c = get_bus(self._bus)
         self.name = name
         self.module = moduletype
         print(self.initialise_sensor())
@@ -95,39 +107,29 @@ class AtlasI2C(ABC):
     def moduletype(self):
         return self.module
     
-    def __del__(self):
-        try:
-            self._file_read.close()
-            self._file_write.close()
-        except Exception:
-            pass
-        
     def _set_i2c_address(self, addr: int) -> bool:
         """Sets the I2C address for communications with the slave sensor.
 
-        The commands for I2C dev using the IOCTL functions are 
-        specified in the i2c-dev.h file from i2c-tools.
+        The shared bus addresses each transfer, so this only changes
+        the address used for the next ones.
         """
-        I2C_SLAVE = 0x703
-        fcntl.ioctl(self._file_read, I2C_SLAVE, addr)
-        fcntl.ioctl(self._file_write, I2C_SLAVE, addr)
         self._address = addr
         return True
 
     def _write(self, command: str):   
         """Appends the null character to the command and sends the string over I2C."""
         command += '\00'
-        self._file_write.write(command.encode('latin-1'))
+        self._i2c.write(self._address, command.encode('latin-1'))
     
     def _read(self, num_of_bytes: int = 31) -> str:
         """Reads a specified number of bytes from I2C and parses and displays the result."""
-        raw_data = self._file_read.read(num_of_bytes)
+        raw_data = self._i2c.read(self._address, num_of_bytes)
         response = self._get_response(raw_data=raw_data)
         is_valid, error_code = self._response_valid(response=response)
 
         if is_valid:
             char_list = self._handle_raspi_glitch(response[1:])
-            result = str(''.join(char_list))
+            result = str(''.join(char_list)).rstrip('\x00')    # The response is padded with nulls.
         else:
             result = error_code
         return result
@@ -207,7 +209,8 @@ class AtlasI2C(ABC):
     def _get_command_timeout(self, command: str) -> Optional[float]:
         """Gets correct timeout for the command that is being sent."""
         timeout = None
-        if command.upper().startswith(self._LONG_TIMEOUT_COMMANDS):
+        # Queries such as 'Cal,?' are answered at once, unlike the commands
+        if command.upper().startswith(self._LONG_TIMEOUT_COMMANDS) and not command.endswith('?'):
             timeout = self._long_timeout
         elif not command.upper().startswith(self._SLEEP_COMMANDS):
             timeout = self._short_timeout
@@ -267,6 +270,68 @@ class AtlasI2C(ABC):
             print('Error: Calibration data has not been saved yet\n')
             return False
             
+    def _read_values(self) -> List[float]:
+        """Reads the response to an R command and parses every value of the reading.
+
+        Raises:
+            AtlasReadError: if the device reports an error or is still busy,
+                or the response is not a list of numbers.
+        """
+        response = self._get_response(self._i2c.read(self._address, 31))
+        is_valid, error_code = self._response_valid(response=response)
+        if not is_valid:
+            raise AtlasReadError(f'{self.module} at {self.address}: response code {error_code}')
+        text = ''.join(self._handle_raspi_glitch(response[1:])).rstrip('\x00')
+        try:
+            return [float(value) for value in text.split(',')]
+        except ValueError:
+            raise AtlasReadError(f'{self.module} at {self.address}: unexpected reading {text!r}')
+
+    def conversion(self):
+        """Takes one reading as a conversion, see conversions.py.
+
+        Sends a single R command, yields the long timeout and then reads all
+        of the reading's parameters.
+
+        Returns:
+            A READING record. Parameters missing from the response are -1.
+
+        Raises:
+            AtlasReadError: if the reading failed.
+        """
+        self._write('R')
+        yield self._long_timeout
+        values = self._read_values()
+        fields = len(self.READING._fields)
+        return self.READING(*(values + [-1] * fields)[:fields])
+
+    def read_all(self):
+        """Takes one reading and returns all of its parameters.
+
+        This is one R command and one long timeout, however many parameters
+        the sensor measures.
+
+        Returns:
+            A READING record. Parameters missing from the response are -1.
+
+        Raises:
+            AtlasReadError: if the reading failed.
+        """
+        return run_serially(self.conversion())
+
+    @classmethod
+    def no_reading(cls):
+        """A READING record with every parameter unread (-1)."""
+        return cls.READING(*[-1] * len(cls.READING._fields))
+
+    def _read_parameter(self, field: str) -> float:
+        """Takes a whole reading and returns one of its parameters, or -1 if it failed."""
+        try:
+            return getattr(self.read_all(), field)
+        except Exception as err:
+            print(f'{field} read error: {err}')
+            return -1
+
     def get_data(self) -> List[str]:
         """Gets the data measurements from the sensor.
 
@@ -295,9 +360,7 @@ class AtlasI2C(ABC):
             return False
     
     def close(self) -> bool:
-        """Closes the I2C IO streams for reading/writing to the sensor."""
-        self._file_read.close()
-        self._file_write.close()
+        """Does nothing: the sensor's I2C bus is shared and stays open."""
         return True
 
     def _handle_raspi_glitch(self, response):
@@ -331,15 +394,52 @@ class AtlasI2C(ABC):
         return valid, error_code
 
     def initialise_sensor(self) -> bool:
-        """Initialise sensor by factory resetting it and calibrating.
+        """Initialise sensor: calibrate it and enable all of its outputs.
+
+        The full bring-up exports the calibration, factory resets the
+        sensor, imports the calibration again and enables the outputs.
+        It is skipped when a couple of cheap queries show that the sensor
+        still has the configuration it was left with last time (see
+        atlas_config.py).
+
         Returns:
             True if successful, False if not.
+
+        Raises:
+            OSError: if the sensor does not answer, i.e. is not connected.
         """
+        key = config_key(self.module, self.address, self._firmware())
         try:
+            entry = config_cache.get(key)
+            if entry is not None and entry['state'] == self._config_state():
+                self._cal_data = entry['calibration']
+                return True
             if (not hasattr(self, '_cal_data')):
-                self._set_cal_data()
+                if not self._set_cal_data() and entry is not None:
+                    self._cal_data = entry['calibration']
             self.factory_reset()
             self._import_calibration()
+            self._enable_outputs()
+            if hasattr(self, '_cal_data'):
+                config_cache.put(key, {'calibration': self._cal_data, 'state': self._config_state()})
             return True
         except:
-            return False
\ No newline at end of file
+            return False
+
+    def _firmware(self) -> str:
+        """Gets the firmware version from the device information ('?i,EC,2.16')."""
+        info = self.query('i').split(',')
+        return info[2] if len(info) > 2 else ''
+
+    def _config_state(self) -> Dict[str, str]:
+        """Gets the responses that show the sensor's calibration and outputs."""
+        return {
+            'calibration': self.query('Cal,?'),
+            'outputs': self.query('O,?') if self._PARAMS else '',
+        }
+
+    def _enable_outputs(self) -> None:
+        """Ensures that all measurement parameters are enabled."""
+        for param in self._PARAMS:
+            self.query(f'O,{param},1')
+            time.sleep(2)     # TODO: Test this with no delay, if it works remove line. 21/07/2021
@@ -21,8 +21,14 @@ Pinouts:
     VDA - VDA
     OFF - Trim and leave unconnected. 
 """
+from collections import namedtuple
+
 from .atlasI2C import AtlasI2C
-import time
+
+# The records read_all returns for each sensor, named like the Sensor attributes
+ECReading = namedtuple('ECReading', ['conductivity', 'total_dissolved_solids', 'salinity', 'specific_gravity'])
+DOReading = namedtuple('DOReading', ['dissolved_oxygen', 'percentage_oxygen'])
+PHReading = namedtuple('PHReading', ['pH'])
 
 
 class EC_Sensor(AtlasI2C):
@@ -44,6 +50,7 @@ class EC_Sensor(AtlasI2C):
         set_params: Enables/disables measurement parameters.
         set_probe: Sets the type/model of probe.
         get_probe: Shows the probe model that is currently set.
+        read_all: Gets all four readings from one measurement, as an ECReading.
         get_conductivity: Gets the conductivity readings.
         get_salinity: Gets the salinity readings.
         get_tds: Gets the total dissolved solids readings.
@@ -53,9 +60,10 @@ class EC_Sensor(AtlasI2C):
         ec_sensor = EC_Sensor()    # Sets up the class for the sensor, it automatically gets initialised.
         ec_sensor.initialise_sensor()    # To re initialise it if you want.
         
-        ec_sensor.get_conductivity()   # Takes readings.
+        ec_sensor.read_all().conductivity   # Takes readings.
     """
     _PARAMS = ['EC', 'TDS', 'S', 'SG']
+    READING = ECReading
 
     def __init__(self, 
                  address: int = 100, 
@@ -71,10 +79,6 @@ class EC_Sensor(AtlasI2C):
 
         super().__init__(moduletype=moduletype, name=name, address=address, bus=bus)
 
-        for param in self._PARAMS:    # Ensures that all measurement params are enabled.
-            self.query(f'O,{param},1')
-            time.sleep(2)     # TODO: Test this with no delay, if it works remove line. 21/07/2021
-
     def set_TDS_conv(self, conv_factor: float = 0.54) -> bool:
         """Set custom conversion factor for the TDS measurement.
 
@@ -138,60 +142,32 @@ class EC_Sensor(AtlasI2C):
         return self.query('K,?')
     
     def get_conductivity(self) -> float:
-        """Explicitly returns the electrical conductivity measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[0]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'get_conductivity error: {err}')
-            return -1
-    
+        """Explicitly returns the electrical conductivity measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('conductivity')
+
     def get_tds(self) -> float:
-        """Explicitly returns the total dissolved solids measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[1]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'get_tds error: {err}')
-            return -1
-    
+        """Explicitly returns the total dissolved solids measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('total_dissolved_solids')
+
     def get_salinity(self) -> float:
-        """Explicitly returns the salinity measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[2]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'get_salinity error: {err}')
-            return -1
-    
+        """Explicitly returns the salinity measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('salinity')
+
     def get_specific_gravity(self) -> float:
-        """Explicitly returns the specific gravity measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[3]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'get_specific_gravity error: {err}')
-            return -1
+        """Explicitly returns the specific gravity measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('specific_gravity')
 
 
 class DO_Sensor(AtlasI2C):
@@ -205,6 +181,7 @@ class DO_Sensor(AtlasI2C):
         set_press_compensation: Sets the pressure in order to compensate for it.
         set_sal_compensation: Sets the salinity in order to compensate for it.
         set_params: Enables/disables measurement parameters.
+        read_all: Gets both readings from one measurement, as a DOReading.
         get_do: Gets dissolved oxygen readings.
         get_percentage_oxygen: Gets percentage oxygen readings.
 
@@ -219,6 +196,7 @@ class DO_Sensor(AtlasI2C):
         do_sensor.get_do()  # Takes readings.
     """
     _PARAMS = ['DO', '%']
+    READING = DOReading
     
     def __init__(self, 
                  address: int = 97, 
@@ -233,38 +211,20 @@ class DO_Sensor(AtlasI2C):
         # to initialise the sensors.
         super().__init__(address=address, moduletype=moduletype, name=name, bus=bus)
 
-        for param in self._PARAMS:    # Ensures that all measurement parameters are enabled.
-            self.query(f'O,{param},1')
-            time.sleep(2)
-
     def get_do(self) -> float:
-        """Explicitly returns the dissolved oxygen measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[0]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'get_do error: {err}')
-            return -1
-        
+        """Explicitly returns the dissolved oxygen measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('dissolved_oxygen')
+
     def get_percent_oxygen(self) -> float:
-        """Explicitly returns the percentage oxygen measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[1]
-            if data.endswith('\x00'):
-                data = data.rstrip('\x00')
-                return float(data)
-            else:
-                return float(data)
-        except Exception as err:
-            print(f'po read error: {err}')
-            return -1
-    
+        """Explicitly returns the percentage oxygen measurement.
+
+        Each call takes a whole reading; use read_all to get every parameter from one.
+        """
+        return self._read_parameter('percentage_oxygen')
+
     def set_temp_compensation(self, temp: int = 20) -> str:
         """Sets the temperature and compensates for its effects in the measurements.
 
@@ -337,6 +297,7 @@ class PH_Sensor(AtlasI2C):
     Public Methods:
         set_temp_compensation: Sets the temperature in order to compensate for it.
         get_slope: Shows how well the probe is working compared to an ideal probe.
+        read_all: Gets the reading as a PHReading.
         get_ph: Gets pH readings.
     
     Example Use:
@@ -346,6 +307,8 @@ class PH_Sensor(AtlasI2C):
         ph_sensor.get_ph()   # Takes readings.
     """
     # Only reads pH, so no _PARAMS or _UNITS class attributes.
+    READING = PHReading
+
     def __init__(self,
                  moduletype: str = 'pH', 
                  name: str = 'Atlas_pH_sensor', 
@@ -361,14 +324,8 @@ class PH_Sensor(AtlasI2C):
         
     def get_ph(self) -> float:
         """Explicitly returns the pH measurement."""
-        try:
-            datalist = self.get_data()
-            data = datalist[0].rstrip('\x00')
-            return float(data)
-        except Exception as err:
-            print(f'get_ph error: {err}')
-            return -1
-    
+        return self._read_parameter('pH')
+
     def set_temp_compensation(self, temp: int = 25) -> str:
         """Compensates for the effects of ambient temperature in the measurements.
 
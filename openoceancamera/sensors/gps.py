@@ -1,12 +1,12 @@
 import time
-import board
-import busio
 import adafruit_gps
 from adafruit_gps import GPS_GtopI2C
 
+from i2c_bus import BusioI2C, get_bus
+
 class GPS(GPS_GtopI2C):
     def __init__(self):
-        super().__init__(board.I2C())
+        super().__init__(BusioI2C(get_bus(1)))
         self.send_command(b"PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0")
         self.send_command(b"PMTK220,1000")
         self.request_firmware()
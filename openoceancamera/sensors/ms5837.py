@@ -31,13 +31,10 @@
     depth = ms5837.depth('fathoms') 
 """
 
-try:  
-    import math
-    import time     # Used for pausing func to perform ADC temperature conversion.
-    import smbus     # Used for I2C comms with TSYS01.
-except ImportError: 
-    print("The smbus module is required.")
-    print("Try 'sudo apt-get install python-smbus' in Terminal.")
+import math
+import time     # Used for pausing func to perform ADC temperature conversion.
+
+from i2c_bus import get_bus     # The I2C bus, shared with the other sensors.
 
 
 class MS5837():
@@ -55,10 +52,10 @@ class MS5837():
         if self._model in ['30BA','02BA']:
             if self._address in [0x76,0x77]:
                 try:  
-                    self._i2c = smbus.SMBus(self._bus) 
+                    self._i2c = get_bus(self._bus) 
                 except: 
                     print("Can't initiate I2C over bus #{}.".format(self._bus))
-                    print("1) Do you have python-smbus installed?")
+                    print("1) Do you have smbus2 installed?")
                     print("2) Check device status with 'i2cdetect -y 1'")
                     print("\tor 'i2cdetect -y 0' via Terminal.")
                     print("3) Check SDA/SCL orientation.")
@@ -110,6 +107,18 @@ class MS5837():
 
             
     def _get_data(self,resolution=8192):
+        for wait in self.conversion(resolution = resolution):
+            time.sleep(wait)
+
+    def conversion(self,resolution=8192):
+        
+        """Convert pressure (D1) and then temperature (D2).
+        A generator that yields the seconds to wait for each conversion 
+        before its result is read, so that other devices can be read
+        meanwhile (see conversions.py). _get_data runs it with sleeps.
+        resolution -- the resolution option of the sensor
+        """
+        
         self._d1 = 0 
         self._d2 = 0
         if resolution not in self._osr:
@@ -127,12 +136,12 @@ class MS5837():
             wait = self._wait_time[idx]
 
         self._i2c.write_byte(self._address,conv_d1_addr)    # Issue conversion.
-        time.sleep(wait)
+        yield wait
         d1 = self._i2c.read_i2c_block_data(self._address,self._read,3) 
         self._d1 = d1[0] << 16 | d1[1] << 8 | d1[2] 
 
         self._i2c.write_byte(self._address,conv_d2_addr) 
-        time.sleep(wait) 
+        yield wait 
         d2 = self._i2c.read_i2c_block_data(self._address,self._read,3) 
         self._d2 = d2[0] << 16 | d2[1] << 8 | d2[2] 
         
@@ -0,0 +1,154 @@
+"""Reads the sensors on a thread of their own.
+
+A full read of the sensors takes about 1.5 s when the Atlas boards are
+attached (they convert for that long, all at once). The sampler does the
+reading at its own pace in the background, logs each reading and keeps the
+recent ones in a ring buffer, so the capture loop can annotate frames with
+the newest reading without waiting for the sensors:
+
+    sensor_sampler.start()
+    sensor_data = sensor_sampler.latest_data()
+
+A slot that captures more often than every SAMPLE_PERIOD passes its own
+period to start(), so that each frame still gets a reading taken since
+the frame before (or as close to that as the 1.5 s read allows).
+"""
+import threading
+from collections import deque, namedtuple
+from typing import Any, Callable, Dict, List, Optional
+
+import clock
+from logger import logger
+from .sensors import Sensor, log_sensor_data
+
+# Seconds between the starts of two readings. Readings that take longer
+# than this follow each other back to back.
+SAMPLE_PERIOD = 5
+# Number of readings kept in memory
+HISTORY_LENGTH = 720
+
+SensorSample = namedtuple("SensorSample", ["timestamp", "monotonic", "data"])
+
+
+def no_reading() -> Dict[str, Any]:
+    """What Sensor.get_sensor_data() returns before anything has been read."""
+    return {
+        "pressure": -1,
+        "temperature": -1,
+        "mstemp": -1,
+        "depth": -1,
+        "luminosity": -1,
+        "gps": {"lat": -1, "lng": -1},
+        "conductivity": -1,
+        "salinity": -1,
+        "specific_gravity": -1,
+        "total_dissolved_solids": -1,
+        "dissolved_oxygen": -1,
+        "percentage_oxygen": -1,
+        "pH": -1,
+    }
+
+
+class SensorSampler(object):
+    def __init__(self,
+                 period: float = SAMPLE_PERIOD,
+                 history: int = HISTORY_LENGTH,
+                 sensor_factory: Callable[[], Sensor] = Sensor,
+                 log: bool = True):
+        """
+        Args:
+            period: Seconds between readings.
+            history: Number of readings to keep.
+            sensor_factory: Makes the Sensor to read, on the sampler thread.
+            log: Whether to append each reading to the sensor log.
+        """
+        self.period = period
+        self.log = log
+        self._default_period = period
+        self._sensor_factory = sensor_factory
+        self._sensor = None
+        self._samples = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._new_sample = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, period: Optional[float] = None) -> None:
+        """Starts sampling, if it is not running already.
+
+        Args:
+            period: Seconds between readings until the next start(), if
+                shorter than the sampler's own period. If the sampler is
+                running already, it applies from the next reading on.
+        """
+        self.period = self._default_period if period is None else min(period, self._default_period)
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="sensor-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops sampling after the reading in progress, if any."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def sample(self) -> SensorSample:
+        """Takes one reading now, on the calling thread."""
+        if self._sensor is None:
+            self._sensor = self._sensor_factory()
+        data = self._sensor.read_sensor_data()
+        sample = SensorSample(clock.now(), clock.monotonic(), data)
+        with self._new_sample:
+            self._samples.append(sample)
+            self._new_sample.notify_all()
+        if self.log:
+            try:
+                log_sensor_data(data, sample.timestamp)
+            except Exception as err:
+                logger.error(f"Could not log the sensor reading: {err}")
+        return sample
+
+    def _run(self) -> None:
+        logger.debug("Sensor sampler started")
+        while not self._stopped.is_set():
+            started = clock.monotonic()
+            try:
+                self.sample()
+            except Exception as err:
+                logger.error(f"Sensor sampler: {err}")
+            clock.wait(self._stopped, max(self.period - (clock.monotonic() - started), 0))
+        logger.debug("Sensor sampler stopped")
+
+    def latest(self) -> Optional[SensorSample]:
+        """Returns the newest reading without waiting, or None if there is none yet."""
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def latest_data(self) -> Dict[str, Any]:
+        """Returns a copy of the newest reading's data, -1 for everything if there is none yet."""
+        sample = self.latest()
+        return dict(sample.data) if sample is not None else no_reading()
+
+    def wait_for_sample(self, timeout: Optional[float] = None) -> Optional[SensorSample]:
+        """Waits for the first reading if there is none yet, then returns the newest."""
+        with self._new_sample:
+            self._new_sample.wait_for(lambda: self._samples, timeout)
+            return self._samples[-1] if self._samples else None
+
+    def history(self, since: Optional[float] = None) -> List[SensorSample]:
+        """Returns the buffered readings, oldest first, optionally only those after the monotonic time `since`."""
+        with self._lock:
+            samples = list(self._samples)
+        if since is None:
+            return samples
+        return [sample for sample in samples if sample.monotonic > since]
+
+
+sensor_sampler = SensorSampler()
@@ -1,9 +1,12 @@
-import os
 import json
 from logger import logger
 from datetime import datetime
-from time import sleep
 from constants import LOG_FILE
+import clock
+from media_writer import media_writer
+from instrumentation import timed
+from conversions import Conversion, blocking, run_conversions
+from device_registry import DeviceRegistry
 
 from .ms5837 import MS5837
 from .tsys01 import TSYS01_30BA, UNITS_Centigrade
@@ -11,7 +14,14 @@ from tsl2561 import TSL2561
 from .gps import GPS
 from .atlas_sensors import EC_Sensor, DO_Sensor, PH_Sensor
 
-from typing import Dict
+from collections import namedtuple
+from typing import Any, Dict, Optional
+
+# Atmospheric pressure at sea level in mbar, which MS5837.depth() subtracts by default
+SEA_LEVEL_PRESSURE = 1013.25
+
+# One reading of each Atlas board, see Sensor.read_atlas_sensors
+AtlasReadings = namedtuple("AtlasReadings", ["ec", "do", "ph"])
 
 # TODO: Additional features need to be added for the new sensors. 20/07/2021
 # The new sensors need to compensate for things such as salinity, 
@@ -19,7 +29,16 @@ from typing import Dict
 # bare minimum, at least once when initialising.
 
 class Sensor:
-    def __init__(self):
+    def __init__(self, registry: Optional[DeviceRegistry] = None):
+        """A handle to the camera's sensors, which are shared by every Sensor.
+
+        Making one is cheap: the sensors are detected and initialised once
+        per process, on first use (see sensor_registry).
+
+        Args:
+            registry: The sensors to read; sensor_registry by default.
+        """
+        self._registry = registry or sensor_registry
         self.luminosity = -1
         self.temperature = -1
         self.pressure = -1
@@ -36,136 +55,55 @@ class Sensor:
         self.percentage_oxygen = -1
         self.pH = -1
 
-        try:
-            self.gps = GPS()
-        except Exception as err: 
-            logger.error(f"GPS: {err}")
-        try:
-            self.pressure_sensor = PressureSensor()
-        except Exception as err: 
-            logger.error(f"Pressure sensor: {err}")
-        try:
-            self.temperature_sensor = TemperatureSensor() 
-        except Exception as err: 
-            logger.error(f"Temperature sensor: {err}")
-        try:
-            self.luminosity_sensor = LuminositySensor() 
-        except Exception as err: 
-            logger.error(f"Luminosity: {err}")
-        try:
-            self.ec_sensor = EC_Sensor()
-        except Exception as err:
-            logger.error(f"Conductivity sensor: {err}")
-        try:
-            self.do_sensor = DO_Sensor()
-        except Exception as err:
-            logger.error(f"Dissolved oxygen sensor: {err}")
-        try:
-            self.ph_sensor = PH_Sensor()
-        except Exception as err:
-            logger.error(f"pH sensor: {err}")
+    def __getattr__(self, name: str):
+        # The devices, e.g. self.gps, are only there if they are connected
+        if name in SENSOR_DEVICES:
+            device = self._registry.devices().get(name)
+            if device is not None:
+                return device
+        raise AttributeError(name)
 
+    @timed("sensors.read")
     def read_sensor_data(self) -> Dict[str, str]:
         """Reads data from all connected sensors.
 
+        Every sensor's conversion is started before any result is read (see
+        conversions.py), so a reading takes about as long as the slowest
+        sensor rather than all of them together.
+
         Returns:
             A dictionary. Parameters are keys, and values are the
             readings.
         """
-        if hasattr(self, 'luminosity_sensor'):
-            try:
-                self.luminosity = self.luminosity_sensor.luminosity() 
-            except LuminositySensorCannotReadException as err: 
-                self.luminosity = -1 
-                logger.error(f"Error: {err}")
-            except Exception as err:
-                logger.error(f"Sensor error: {err}")
-        else:
-            self.luminosity = -1 
+        # Two cycles at once would send commands in each other's conversions
+        with self._registry.use_lock:
+            readings = run_conversions(self._conversions())
+
+        luminosity = self._reading(readings, "luminosity", "Luminosity")
+        self.luminosity = -1 if luminosity is None else luminosity
 
         if hasattr(self, 'gps'):
-            try:
-                self.gps.update()
-                if self.gps.has_fix:
-                    self.gps_coordinates = {
-                      "lat": self.gps.latitude,
-                      "lng": self.gps.longitude
-                    }
-            except Exception as err:
-                logger.error(f"GPS not connected: {err}")
+            gps_coordinates = self._reading(readings, "gps", "GPS not connected")
+            if gps_coordinates is not None:
+                self.gps_coordinates = gps_coordinates
         else:
             self.gps_coordinates = {
                   "lat": -1,
                   "lng": -1,
                 }
-        
-        if hasattr(self, 'pressure_sensor'):
-            try:
-                self.pressure = self.pressure_sensor.absolute_pressure()
-                self.temperature = self.pressure_sensor.temperature()
-                self.depth = self.pressure_sensor.depth()
-            except PressureSensorCannotReadException as err:
-                logger.error(f"Error: {err}")
-            except Exception as err:
-                logger.error(f"Pressure sensor: {err}")
-        
-        if hasattr(self, 'temperature_sensor'):
-            try:
-                self.temperature = self.temperature_sensor.temperature()
-            except Exception as err:
-                logger.error(f"Pressure sensor: {err}")
-
-        # TODO: Repeated _get_data method calls
-        # Each of these 'get' methods, is calling _get_data again and again
-        # behind the scenes. This is repetitive, and may even be causing errors.
-        # This should be changed so that it calls _get_data once, gets a list of 
-        # parameters, and then simply parses that list, to get the values for each
-        # component.
-
-        if hasattr(self, 'ec_sensor'):
-            try:
-                self.conductivity = self.ec_sensor.get_conductivity()
-            except Exception as err:
-                self.conductivity = -1
-                logger.error(f"Sensor error: {err}")
-            
-            try:
-                self.total_dissolved_solids = self.ec_sensor.get_tds()
-            except Exception as err:
-                self.total_dissolved_solids = -1
-                logger.error(f"Sensor error: {err}")
-            
-            try:
-                self.salinity = self.ec_sensor.get_salinity()
-            except Exception as err:
-                self.salinity = -1
-                logger.error(f"Sensor error: {err}")
-            
-            try:
-                self.specific_gravity = self.ec_sensor.get_specific_gravity()
-            except Exception as err:
-                self.specific_gravity = -1
-                logger.error(f"Sensor error: {err}")
-        
-        if hasattr(self, 'do_sensor'):
-            try:
-                self.dissolved_oxygen = self.do_sensor.get_do()
-            except Exception as err:
-                self.dissolved_oxygen = -1
-                logger.error(f"Sensor error: {err}")
-            
-            try:
-                self.percentage_oxygen = self.do_sensor.get_percent_oxygen()
-            except Exception as err:
-                self.percentage_oxygen = -1
-                logger.error(f"Sensor error: {err}")
-
-        if hasattr(self, 'ph_sensor'):
-            try:
-                self.pH = self.ph_sensor.get_ph()
-            except Exception as err:
-                self.pH = -1
-                logger.error(f"Sensor error: {err}")
+
+        pressure = self._reading(readings, "pressure", "Pressure sensor")
+        if pressure is not None:
+            self.pressure, self.temperature, self.depth = pressure
+
+        temperature = self._reading(readings, "temperature", "Temperature sensor")
+        if temperature is not None:
+            self.temperature = temperature
+
+        atlas = self._atlas_readings(readings)
+        self.conductivity, self.total_dissolved_solids, self.salinity, self.specific_gravity = atlas.ec
+        self.dissolved_oxygen, self.percentage_oxygen = atlas.do
+        self.pH = atlas.ph.pH
 
         return {
             "pressure": self.pressure, 
@@ -183,6 +121,72 @@ class Sensor:
             "pH": self.pH,
         }
 
+    def _conversions(self) -> Dict[str, Conversion]:
+        """The conversions of one reading of the connected sensors, slowest first."""
+        conversions = self._atlas_conversions()
+        if hasattr(self, 'pressure_sensor'):
+            conversions["pressure"] = self.pressure_sensor.read_conversion()
+        if hasattr(self, 'temperature_sensor'):
+            conversions["temperature"] = self.temperature_sensor.read_conversion()
+        # These cannot be split, so they run while the others convert
+        if hasattr(self, 'luminosity_sensor'):
+            conversions["luminosity"] = blocking(self.luminosity_sensor.luminosity)
+        if hasattr(self, 'gps'):
+            conversions["gps"] = blocking(self._read_gps)
+        return conversions
+
+    def _reading(self, readings: Dict[str, Any], name: str, label: str) -> Any:
+        """The reading `name` of a cycle, or None if there is no such sensor or it failed."""
+        reading = readings.get(name)
+        if isinstance(reading, Exception):
+            logger.error(f"{label}: {reading}")
+            return None
+        return reading
+
+    def _read_gps(self) -> Optional[Dict[str, float]]:
+        """Reads what the GPS has sent since the last reading, and returns its position if it has a fix."""
+        self.gps.update()
+        if self.gps.has_fix:
+            return {
+              "lat": self.gps.latitude,
+              "lng": self.gps.longitude
+            }
+        return None
+
+    def read_atlas_sensors(self) -> AtlasReadings:
+        """Takes one reading from each Atlas board.
+
+        Each board gets a single R command and reports all of its parameters
+        in the response, and the boards convert at the same time, so a
+        cycle costs one long timeout however many boards there are.
+
+        Returns:
+            An AtlasReadings of the boards' records. Boards that are not
+            connected or failed to read have every parameter at -1.
+        """
+        with self._registry.use_lock:
+            return self._atlas_readings(run_conversions(self._atlas_conversions()))
+
+    def _atlas_conversions(self) -> Dict[str, Conversion]:
+        conversions = {}
+        for name, attribute in (("ec", "ec_sensor"), ("do", "do_sensor"), ("ph", "ph_sensor")):
+            if hasattr(self, attribute):
+                conversions[name] = getattr(self, attribute).conversion()
+        return conversions
+
+    def _atlas_readings(self, readings: Dict[str, Any]) -> AtlasReadings:
+        return AtlasReadings(
+            ec=self._atlas_reading(readings, "ec", "ec_sensor", EC_Sensor),
+            do=self._atlas_reading(readings, "do", "do_sensor", DO_Sensor),
+            ph=self._atlas_reading(readings, "ph", "ph_sensor", PH_Sensor),
+        )
+
+    def _atlas_reading(self, readings: Dict[str, Any], name: str, attribute: str, sensor_class):
+        if name not in readings:
+            return sensor_class.no_reading()
+        reading = self._reading(readings, name, getattr(self, attribute).name)
+        return sensor_class.no_reading() if reading is None else reading
+
     def get_sensor_data(self, short=False) -> Dict[str, str]:
         if short:
             return {
@@ -217,37 +221,21 @@ class Sensor:
             }
 
     def write_sensor_data(self, sensor_data_object=None) -> None:
-        if os.path.exists(LOG_FILE):
-            file_mode = "a"
-        else:
-            file_mode = "w"
         try:
-            self.read_sensor_data()
-            sensor_data_object = {
-                "pressure": self.pressure,
-                "temperature": self.temperature,
-                "mstemp": self.temperature,
-                "depth": self.depth,
-                "luminosity": self.luminosity,
-                "gps": self.gps_coordinates,
-                "conductivity": self.conductivity,
-                "total_dissolved_solids": self.total_dissolved_solids,
-                "salinity": self.salinity,
-                "specific_gravity": self.specific_gravity,
-                "dissolved_oxygen": self.dissolved_oxygen,
-                "percentage_oxygen": self.percentage_oxygen,
-                "pH": self.pH,
-                "timestamp": datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
-            }
-            sensor_data_json = json.dumps(sensor_data_object)
-            with open(LOG_FILE, file_mode) as f:
-                f.write(sensor_data_json)
-                f.write("\n")
+            log_sensor_data(self.read_sensor_data(), clock.now())
         except Exception as err:
             logger.error(err)
             return None
 
 
+def log_sensor_data(sensor_data: Dict[str, str], timestamp: datetime) -> None:
+    """Queues a reading from Sensor.read_sensor_data() to be appended to the sensor log on the external drive."""
+    sensor_data_object = dict(sensor_data)
+    sensor_data_object["timestamp"] = timestamp.strftime("%m/%d/%Y, %H:%M:%S")
+    sensor_data_json = json.dumps(sensor_data_object)
+    media_writer.append(LOG_FILE, (sensor_data_json + "\n").encode("utf-8"))
+
+
 class PressureSensorNotConnectedException(Exception):
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -263,6 +251,23 @@ class PressureSensor(MS5837):
         super().__init__('30BA')
         self.initialize_sensor()
 
+    def read_conversion(self):
+        """Reads pressure, temperature and depth from one conversion, see conversions.py.
+
+        absolute_pressure(), temperature() and depth() each convert afresh,
+        which would take three times as long.
+
+        Returns:
+            The absolute pressure in mbar, the temperature in Celsius and the
+            depth in m, as those methods compute them.
+        """
+        yield from self.conversion()
+        self._first_order_calculation()
+        self._second_order_calculation()
+        pressure = round(max(self.p2 - SEA_LEVEL_PRESSURE, 0) / 100, 2)
+        depth = max(self._gsw_depth_from_z(self._gsw_z_from_p(pressure)), 0)
+        return round(self.p2, 2), round(self.temp2, 2), round(depth, 2)
+
 
 class TemperatureSensorNotConnectedException(Exception):
     def __init__(self, *args, **kwargs) -> None:
@@ -293,6 +298,13 @@ class TemperatureSensor(TSYS01_30BA):
                 "Could not read temperature values"
             )
 
+    def read_conversion(self):
+        """Reads the temperature in Celsius, as a conversion (see conversions.py)."""
+        if self._bus is None:
+            raise TemperatureSensorCannotReadException("No bus")
+        yield from self.conversion()
+        return super().temperature()
+
 
 class LuminositySensorNotConnectedException(Exception):
     def __init__(self, *args, **kwargs) -> None:
@@ -315,8 +327,8 @@ class LuminositySensor(TSL2561):
             )
 
     def luminosity(self):
-        if self.lux() >= 0:
-            data = self.lux()
+        data = self.lux()
+        if data >= 0:
             logger.info(f"Reading luminosity data from the sensor: {data}")
             return data
         else:
@@ -355,5 +367,21 @@ class PHSensorCannotReadException(Exception):
         super().__init__(*args, **kwargs)
 
 
+# The sensors a Sensor may have, by attribute: the label of their log
+# messages and their constructor, which raises if they are not connected
+SENSOR_DEVICES = {
+    "gps": ("GPS", GPS),
+    "pressure_sensor": ("Pressure sensor", PressureSensor),
+    "temperature_sensor": ("Temperature sensor", TemperatureSensor),
+    "luminosity_sensor": ("Luminosity", LuminositySensor),
+    "ec_sensor": ("Conductivity sensor", EC_Sensor),
+    "do_sensor": ("Dissolved oxygen sensor", DO_Sensor),
+    "ph_sensor": ("pH sensor", PH_Sensor),
+}
+
+# The camera's sensors, initialised once per process and shared by every Sensor
+sensor_registry = DeviceRegistry(SENSOR_DEVICES)
+
+
 if __name__ == "__main__":
     pass
@@ -1,6 +1,7 @@
-import smbus2 as smbus
 from time import sleep
 
+from i2c_bus import get_bus
+
 # Models
 MODEL_30BA = 1
 
@@ -27,7 +28,7 @@ class TSYS01(object):
         self._model = model
 
         try:
-            self._bus = smbus.SMBus(bus)
+            self._bus = get_bus(bus)
         except:
             print(("Bus %d is not available.") % bus)
             print("Available busses are listed as /dev/i2c*")
@@ -61,16 +62,23 @@ class TSYS01(object):
             print("No bus!")
             return False
 
+        for wait in self.conversion():
+            sleep(wait)
+        return True
+
+    # A generator that yields the time to wait for the conversion before
+    # reading it, so other devices can be read meanwhile.
+    # See conversions.py; read() runs it with a sleep.
+    def conversion(self):
         # Request conversion.
         self._bus.write_byte(self._TSYS01_ADDR, self._TSYS01_CONVERT)
 
         # Max conversion time = 9.04 ms.
-        sleep(0.01)
+        yield 0.01
 
         adc = self._bus.read_i2c_block_data(self._TSYS01_ADDR, self._TSYS01_READ, 3)
         adc = adc[0] << 16 | adc[1] << 8 | adc[2]
         self._calculate(adc)
-        return True
 
     # Temperature in requested units.
     # default degrees C.
@@ -0,0 +1,124 @@
+"""Fast-forward dry runs of a schedule against fake hardware.
+
+The simulator replays a schedule.json through the real camera thread and
+capture code, with the camera, sensors, subsea light, uploaders and WittyPi
+replaced by the fakes in simulator.backends, and with time provided by a
+VirtualClock. A month-long deployment runs in seconds and produces a
+report of what it would have captured, written and uploaded, and of how
+often the Pi would have rebooted.
+
+Usage (from the openoceancamera directory):
+    python3 -m simulator schedule.json [--start 2021-08-01-00:00:00] [--days 30]
+"""
+import importlib
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import clock
+from clock import VirtualClock, VirtualClockExpired
+from . import backends
+
+
+def simulate(schedule_path: str, start: datetime, end: datetime,
+             picamera_version: Tuple[int, int] = backends.PICAMERA_VERSION) -> Dict[str, Any]:
+    """Replays the schedule at `schedule_path` from `start` to `end`.
+
+    Args:
+        picamera_version: The picamera whose behaviour the fake camera has,
+            by default the one requirements.txt pins.
+
+    Returns:
+        The summary of a SimulationReport.
+    """
+    installed = backends.install()
+    # Imported here, once the fakes are in place of the hardware modules.
+    # (camera.camera_thread is shadowed by the function of the same name.)
+    camera_thread_module = importlib.import_module("camera.camera_thread")
+    capture_module = importlib.import_module("camera.capture")
+    media_writer_module = importlib.import_module("media_writer")
+    triggers_module = importlib.import_module("triggers")
+    exposure_presets_module = importlib.import_module("exposure_presets")
+    instrumentation = importlib.import_module("instrumentation").instrumentation
+
+    report = backends.report = backends.SimulationReport()
+    wittypi = backends.FakeWittyPi()
+    virtual_clock = VirtualClock(start, end)
+    previous_clock = clock.get_clock()
+    clock.set_clock(virtual_clock)
+
+    def start_capture(slot):
+        files_before = len(report.files)
+        bytes_before = report.bytes_written()
+        started = clock.now()
+        timing = original_start_capture(slot)
+        report.slots.append({
+            "start": started,
+            "stop": clock.now(),
+            "video": bool(slot["video"]),
+            "files": len(report.files) - files_before,
+            "bytes": report.bytes_written() - bytes_before,
+            "timing": timing,
+            "stages": instrumentation.last_slot["stages"],
+        })
+
+    def start_upload(slot):
+        report.uploads.append({"start": clock.now(), "stop": slot["stop"]})
+
+    def run_wiper(sweeps):
+        report.wiper_runs += 1
+        clock.sleep(3 * sweeps)
+
+    def reboot_camera():
+        report.errors.append(f"{clock.now()}: capture failed, the camera would reboot")
+
+    original_start_capture = camera_thread_module.start_capture
+    patches = {
+        (camera_thread_module, "start_capture"): start_capture,
+        (camera_thread_module, "start_upload"): start_upload,
+        (camera_thread_module, "set_startup_time"): wittypi.set_startup_time,
+        (camera_thread_module, "set_shutdown_time"): wittypi.set_shutdown_time,
+        (capture_module, "run_wiper"): run_wiper,
+        (capture_module, "reboot_camera"): reboot_camera,
+        (capture_module, "append_index"): backends.append_index,
+        (capture_module, "make_preview_dir"): lambda: None,
+        # Presets are learned afresh, and kept in memory, for every simulation
+        (capture_module, "preset_cache"): exposure_presets_module.ExposurePresetCache(),
+        (media_writer_module.MediaWriter, "_write_file"): backends.write_media_file,
+        (media_writer_module.MediaWriter, "_append"): backends.write_media_file,
+        (triggers_module.LumaMonitor, "next_frame"): backends.latest_luma_frame,
+        (backends.FakePiCamera, "version"): tuple(picamera_version),
+    }
+    originals = {target: getattr(*target) for target in patches}
+    for (module, name), replacement in patches.items():
+        setattr(module, name, replacement)
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            plan_path = os.path.join(directory, "schedule.plan")
+            while virtual_clock.now() < end:
+                boot = {"on": virtual_clock.now(), "off": None}
+                report.boots.append(boot)
+                wittypi.reset()
+                try:
+                    camera_thread_module.camera_thread(schedule_path, plan_path)
+                except VirtualClockExpired:
+                    boot["off"] = end
+                    break
+                boot["off"] = wittypi.shutdown_time or virtual_clock.now()
+                if wittypi.startup_time is None:
+                    # Nothing left to wake up for.
+                    break
+                virtual_clock.set(max(wittypi.startup_time, boot["off"]))
+    finally:
+        backends.sensor_sampler.stop()
+        clock.set_clock(previous_clock)
+        for (module, name), original in originals.items():
+            setattr(module, name, original)
+        installed.restore()
+    summary = report.summary()
+    summary["start"] = str(start)
+    summary["end"] = str(end)
+    summary["picamera"] = ".".join(str(part) for part in picamera_version)
+    return summary
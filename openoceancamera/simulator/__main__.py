@@ -0,0 +1,46 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from Scheduler import DATETIME_FORMAT
+from schedule_plan import compile_schedule
+from . import simulate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay a schedule.json in virtual time.")
+    parser.add_argument("schedule", help="path to the schedule.json to replay")
+    parser.add_argument("--start", help=f"simulation start ({DATETIME_FORMAT.replace('%', '%%')}), defaults to the first slot")
+    parser.add_argument("--days", type=float, help="how many days to simulate, defaults to the whole schedule")
+    parser.add_argument("--picamera", default="1.13", choices=("1.13", "1.14"),
+                        help="the picamera version to simulate, defaults to the one requirements.txt pins")
+    args = parser.parse_args()
+
+    with open(args.schedule) as f:
+        plan = compile_schedule(json.load(f))
+    starts = [slot["start"] for slot in plan.slots] + [rule.begin for rule in plan.rules]
+    stops = [slot["stop"] for slot in plan.slots] + [rule.end for rule in plan.rules]
+    if not starts:
+        parser.error("the schedule is empty")
+    if args.start:
+        start = datetime.strptime(args.start, DATETIME_FORMAT)
+    else:
+        start = min(starts) - timedelta(minutes=5)
+    if args.days:
+        end = start + timedelta(days=args.days)
+    else:
+        end = max(stops) + timedelta(minutes=5)
+
+    started = time.monotonic()
+    # The capture code prints to stdout in places; keep the report readable.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        summary = simulate(args.schedule, start, end, tuple(int(part) for part in args.picamera.split(".")))
+    summary["simulation_seconds"] = round(time.monotonic() - started, 2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
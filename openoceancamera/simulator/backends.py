@@ -0,0 +1,563 @@
+"""Fake hardware used by the deployment simulator.
+
+These stand in for picamera, RPi.GPIO, the sensors, the uploaders and the
+WittyPi. They do no I/O: they only move the virtual clock forward by about
+as long as the real hardware would take, and record what would have been
+written in a SimulationReport.
+"""
+import os
+import sys
+import types
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+import clock
+from triggers import yuv_frame_size
+
+# Rough sizes of what the camera writes, used to estimate bytes written.
+JPEG_BYTES_PER_PIXEL = 0.35
+H264_BITRATE = 17000000  # picamera's default, in bits per second
+RAW_BAYER_BYTES = 10270208  # appended to stills with bayer=True by the V2 module
+# How long one still capture takes on the Pi, from trigger to file closed.
+STILL_CAPTURE_SECONDS = 0.6
+# Captures from the video port skip the mode switch and take about a frame or two.
+VIDEO_PORT_CAPTURE_SECONDS = 0.1
+# How long opening the camera takes.
+CAMERA_OPEN_SECONDS = 2.0
+# How long a full read of the sensors takes, most of it the Atlas boards
+# converting.
+SENSOR_READ_SECONDS = 1.5
+# Auto exposure moves from its starting values to the scene's over this
+# long, after the camera opens or is put back into auto exposure.
+AE_SETTLE_SECONDS = 1.5
+# The picamera that requirements.txt pins. Before 1.14 the gains cannot be set.
+PICAMERA_VERSION = (1, 13)
+# (starting value, converged value) of what auto exposure controls
+AE_RAMPS = {
+    "analog_gain": (1.0, 4.0),
+    "digital_gain": (1.0, 1.5),
+    "exposure_speed": (10000, 20000),
+}
+
+
+class SimulationReport(object):
+    """Everything a simulated deployment produced."""
+
+    def __init__(self):
+        self.files = {}
+        self.slots = []
+        self.uploads = []
+        self.boots = []
+        self.errors = []
+        self.light_on_seconds = 0.0
+        self.wiper_runs = 0
+        self.sensor_records = 0
+        self.camera_opens = 0
+        self.index_entries = []
+        self._light_on_since = None
+
+    def add_file(self, path: str, size: int) -> None:
+        self.files[path] = self.files.get(path, 0) + int(size)
+
+    def bytes_written(self) -> int:
+        return sum(self.files.values())
+
+    def light_on(self) -> None:
+        if self._light_on_since is None:
+            self._light_on_since = clock.monotonic()
+
+    def light_off(self) -> None:
+        if self._light_on_since is not None:
+            self.light_on_seconds += clock.monotonic() - self._light_on_since
+            self._light_on_since = None
+
+    def summary(self) -> Dict[str, Any]:
+        extensions = defaultdict(int)
+        for path in self.files:
+            if "/previews/" in path:
+                extensions["preview"] += 1
+            else:
+                extensions[path.rsplit(".", 1)[-1]] += 1
+        powered_on = sum(
+            ((boot["off"] - boot["on"]).total_seconds() for boot in self.boots if boot["off"]),
+            0.0,
+        )
+        timings = [slot["timing"] for slot in self.slots if slot.get("timing")]
+        stages = defaultdict(lambda: [0, 0.0])
+        for slot in self.slots:
+            for stage, histogram in slot.get("stages", {}).items():
+                stages[stage][0] += histogram["count"]
+                stages[stage][1] += histogram["mean_ms"] * histogram["count"]
+        settle = defaultdict(list)
+        for timing in timings:
+            if "exposure" in timing:
+                settle[timing["exposure"]].append(timing["settle_seconds"])
+        dropped = sum(timing.get("dropped", 0) for timing in timings)
+        events = sum(timing.get("events", 0) for timing in timings)
+        suppressed = sum(timing.get("suppressed", 0) for timing in timings)
+        unusable = sum(1 for path, entry in self.index_entries if path.endswith(".quality.jsonl") and not entry["usable"])
+        return {
+            "boots": len(self.boots),
+            "reboots": max(len(self.boots) - 1, 0),
+            "powered_on_hours": round(powered_on / 3600, 2),
+            "slots_run": len(self.slots),
+            "files": len(self.files),
+            "files_by_type": dict(extensions),
+            "bytes_written": self.bytes_written(),
+            "missed_deadlines": sum(timing.get("missed_deadlines", 0) for timing in timings),
+            "max_jitter_ms": max((timing.get("max_jitter_ms", 0.0) for timing in timings), default=0.0),
+            "dropped_frames": dropped,
+            "sensor_records": self.sensor_records,
+            "camera_opens": self.camera_opens,
+            "video_segments": sum(1 for path, entry in self.index_entries if path.endswith(".index.jsonl")),
+            "trigger_events": events,
+            "suppressed_frames": suppressed,
+            "unusable_frames": unusable,
+            # Mean time from the light going on to the first usable frame, by
+            # how the exposure was set
+            "time_to_first_frame_ms": {
+                source: round(sum(seconds) / len(seconds) * 1000, 1) for source, seconds in settle.items()
+            },
+            # Mean simulated time per stage of the capture pipeline
+            "stage_mean_ms": {
+                stage: round(total / count, 1) for stage, (count, total) in sorted(stages.items()) if count
+            },
+            "light_on_hours": round(self.light_on_seconds / 3600, 2),
+            "wiper_runs": self.wiper_runs,
+            "upload_windows": [
+                {"start": str(upload["start"]), "stop": str(upload["stop"])} for upload in self.uploads
+            ],
+            "errors": self.errors,
+        }
+
+
+report = SimulationReport()
+
+
+class FakePiCamera(object):
+    """Just enough of picamera.PiCamera for the capture code.
+
+    It behaves like picamera `version`: before 1.14, setting analog_gain
+    or digital_gain raises AttributeError. A non-zero ISO makes auto
+    exposure aim the analog gain at iso / 100.
+    """
+
+    version = PICAMERA_VERSION
+
+    def __init__(self, resolution=(1920, 1080), framerate=30, **kwargs):
+        self.resolution = resolution
+        self.framerate = framerate or 30
+        self.iso = 0
+        self.shutter_speed = 0
+        self.exposure_compensation = 0
+        self.awb_mode = "auto"
+        self.awb_gains = (1.6, 1.4)
+        self.annotate_text = ""
+        self.annotate_text_size = 32
+        self.closed = False
+        self._recordings = {}
+        self._bitrates = {}
+        self._manual = {}
+        report.camera_opens += 1
+        clock.sleep(CAMERA_OPEN_SECONDS)
+        self.exposure_mode = "auto"
+
+    @property
+    def exposure_mode(self) -> str:
+        return self._exposure_mode
+
+    @exposure_mode.setter
+    def exposure_mode(self, mode: str) -> None:
+        if mode == "off":
+            # Freezes what auto exposure has reached
+            for name in AE_RAMPS:
+                self._manual.setdefault(name, self._auto_value(name))
+        else:
+            self._manual = {}
+            self._ae_started = clock.monotonic()
+        self._exposure_mode = mode
+
+    def _auto_value(self, name: str) -> float:
+        start, converged = AE_RAMPS[name]
+        if name == "analog_gain" and self.iso:
+            converged = self.iso / 100
+        progress = min((clock.monotonic() - self._ae_started) / AE_SETTLE_SECONDS, 1.0)
+        return start + (converged - start) * progress
+
+    @property
+    def analog_gain(self) -> float:
+        return self._manual.get("analog_gain", self._auto_value("analog_gain"))
+
+    @analog_gain.setter
+    def analog_gain(self, value: float) -> None:
+        self._set_gain("analog_gain", value)
+
+    @property
+    def digital_gain(self) -> float:
+        return self._manual.get("digital_gain", self._auto_value("digital_gain"))
+
+    @digital_gain.setter
+    def digital_gain(self, value: float) -> None:
+        self._set_gain("digital_gain", value)
+
+    def _set_gain(self, name: str, value: float) -> None:
+        if self.version < (1, 14):
+            raise AttributeError(f"can't set attribute {name}")
+        self._manual[name] = value
+
+    @property
+    def exposure_speed(self) -> int:
+        if self.shutter_speed:
+            return self.shutter_speed
+        return int(self._manual.get("exposure_speed", self._auto_value("exposure_speed")))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        for splitter_port in list(self._recordings):
+            self.stop_recording(splitter_port=splitter_port)
+        self.closed = True
+
+    def _still_size(self, resize=None, bayer=False) -> int:
+        width, height = resize or self.resolution
+        return int(width * height * JPEG_BYTES_PER_PIXEL) + (RAW_BAYER_BYTES if bayer else 0)
+
+    def capture(self, output, format=None, use_video_port=False, resize=None, bayer=False, **kwargs) -> None:
+        clock.sleep(VIDEO_PORT_CAPTURE_SECONDS if use_video_port else STILL_CAPTURE_SECONDS)
+        self._store_still(output, resize, bayer)
+
+    def _store_still(self, output, resize=None, bayer=False) -> None:
+        self._feed_yuv_recordings()
+        if isinstance(output, str):
+            report.add_file(output, self._still_size(resize, bayer))
+        else:
+            output.write(b"\0" * self._still_size(resize, bayer))
+
+    def capture_sequence(self, outputs, format=None, use_video_port=False, resize=None, **kwargs) -> None:
+        for n, output in enumerate(outputs):
+            if n and use_video_port:
+                # Back to back from the video port, a frame apart
+                clock.sleep(1 / self.framerate)
+                self._store_still(output, resize)
+            else:
+                self.capture(output, format=format, use_video_port=use_video_port, resize=resize)
+
+    def capture_continuous(self, output, format=None, use_video_port=False, resize=None, **kwargs):
+        counter = 1
+        while True:
+            if isinstance(output, str):
+                target = output.format(timestamp=clock.now(), counter=counter)
+            else:
+                target = output
+            self.capture(target, format=format, use_video_port=use_video_port, resize=resize)
+            yield target
+            counter += 1
+
+    def _feed_yuv_recordings(self) -> None:
+        # The same frame every time: the simulated scene never changes.
+        for output, format, started, resize in self._recordings.values():
+            if format == "yuv":
+                output.write(_scene_frame(yuv_frame_size(resize or self.resolution)[1]))
+
+    def start_recording(self, output, format=None, splitter_port=1, resize=None, bitrate=H264_BITRATE, **kwargs) -> None:
+        self._recordings[splitter_port] = (output, format, clock.monotonic(), resize)
+        self._bitrates[splitter_port] = bitrate
+
+    def split_recording(self, output, splitter_port=1, **kwargs) -> None:
+        format, resize = self._recordings[splitter_port][1], self._recordings[splitter_port][3]
+        bitrate = self._bitrates[splitter_port]
+        self.stop_recording(splitter_port=splitter_port)
+        self.start_recording(output, format=format, splitter_port=splitter_port, resize=resize, bitrate=bitrate)
+
+    def wait_recording(self, timeout=0, splitter_port=1) -> None:
+        clock.sleep(timeout)
+
+    def stop_recording(self, splitter_port=1) -> None:
+        if splitter_port not in self._recordings:
+            return
+        output, format, started, resize = self._recordings.pop(splitter_port)
+        bitrate = self._bitrates.pop(splitter_port)
+        if format != "yuv":
+            _account_video(output, (clock.monotonic() - started) * bitrate / 8)
+
+
+@lru_cache(maxsize=4)
+def _scene_frame(size: int) -> bytes:
+    """A YUV frame of a textured, evenly lit scene, with enough detail to score as usable (see quality.py)."""
+    return bytes(64 + (n * 37 + n // 7 * 11) % 64 for n in range(size))
+
+
+def _account_video(output, size: float) -> None:
+    """Records a recording's estimated size instead of writing that many bytes to its output."""
+    if isinstance(output, str):
+        report.add_file(output, size)
+    elif hasattr(output, "bytes_written"):
+        # A MediaStream; counted here as its data never goes through the writer.
+        report.add_file(output.name, size)
+        output.bytes_written += int(size)
+
+
+class FakeCircularIO(object):
+    """Stands in for picamera.PiCameraCircularIO, holding nothing but its length."""
+
+    def __init__(self, camera, size=None, seconds=None, bitrate=H264_BITRATE, splitter_port=1):
+        self.seconds = seconds
+        self.bitrate = bitrate
+
+    def write(self, data) -> int:
+        return len(data)
+
+    def copy_to(self, output, size=None, seconds=None, **kwargs) -> None:
+        _account_video(output, (seconds or self.seconds) * self.bitrate / 8)
+
+    def clear(self) -> None:
+        pass
+
+
+class FakePWM(object):
+    def __init__(self, pin, frequency):
+        pass
+
+    def start(self, duty_cycle):
+        if duty_cycle:
+            report.light_on()
+
+    def ChangeDutyCycle(self, duty_cycle):
+        if duty_cycle:
+            report.light_on()
+        else:
+            report.light_off()
+
+    def stop(self):
+        report.light_off()
+
+
+class FakeSensor(object):
+    """Stands in for sensors.Sensor, reporting a camera at 10 m depth."""
+
+    def __init__(self):
+        self._data = {
+            "pressure": 2026.25,
+            "temperature": 12.0,
+            "mstemp": 12.0,
+            "depth": 10.0,
+            "luminosity": 5,
+            "gps": {"lat": -1, "lng": -1},
+            "conductivity": -1,
+            "total_dissolved_solids": -1,
+            "salinity": -1,
+            "specific_gravity": -1,
+            "dissolved_oxygen": -1,
+            "percentage_oxygen": -1,
+            "pH": -1,
+        }
+
+    def read_sensor_data(self) -> Dict[str, Any]:
+        return dict(self._data)
+
+    def get_sensor_data(self, short=False) -> Dict[str, Any]:
+        return dict(self._data)
+
+    def write_sensor_data(self, sensor_data_object=None) -> None:
+        report.sensor_records += 1
+
+
+FakeSensorSample = namedtuple("FakeSensorSample", ["timestamp", "monotonic", "data"])
+
+
+class FakeSensorSampler(object):
+    """Stands in for sensors.SensorSampler.
+
+    Nothing runs in the background in a simulation, so instead of reading
+    on a thread, it counts the readings the sampler would have logged
+    since it was started whenever it is asked for one.
+    """
+
+    def __init__(self, period=5):
+        self.period = period
+        self._default_period = period
+        self._sensor = FakeSensor()
+        self._started = None
+        self._logged = 0
+
+    @property
+    def running(self) -> bool:
+        return self._started is not None
+
+    def _catch_up(self) -> None:
+        if self._started is None:
+            return
+        due = int((clock.monotonic() - self._started) // self.period) + 1
+        report.sensor_records += due - self._logged
+        self._logged = due
+
+    def start(self, period=None) -> None:
+        self._catch_up()
+        period = self._default_period if period is None else min(period, self._default_period)
+        # Readings follow each other back to back at best
+        period = max(period, SENSOR_READ_SECONDS)
+        if self._started is not None and self._logged and period != self.period:
+            # The next reading comes a new period after the last one
+            self._started += (self._logged - 1) * self.period
+            self._logged = 1
+        self.period = period
+        if self._started is None:
+            self._started = clock.monotonic()
+            self._logged = 0
+        self._catch_up()
+
+    def stop(self, timeout=None) -> None:
+        self._catch_up()
+        self._started = None
+
+    def latest(self):
+        self._catch_up()
+        if self._started is None:
+            return None
+        monotonic = self._started + (self._logged - 1) * self.period
+        return FakeSensorSample(clock.now(), monotonic, self._sensor.get_sensor_data())
+
+    def latest_data(self) -> Dict[str, Any]:
+        self._catch_up()
+        return self._sensor.get_sensor_data()
+
+    def wait_for_sample(self, timeout=None):
+        """Waits for the first reading, which is ready SENSOR_READ_SECONDS after the start."""
+        if self._started is None:
+            return None
+        remaining = self._started + SENSOR_READ_SECONDS - clock.monotonic()
+        if timeout is not None and remaining > timeout:
+            clock.sleep(timeout)
+            return None
+        if remaining > 0:
+            clock.sleep(remaining)
+        return self.latest()
+
+
+sensor_sampler = FakeSensorSampler()
+
+
+class FakeUploader(object):
+    def upload_file(self, filename: str) -> None:
+        pass
+
+
+class FakeWittyPi(object):
+    """Records the startup and shutdown times the camera thread asks for."""
+
+    def __init__(self):
+        self.startup_time = None
+        self.shutdown_time = None
+
+    def reset(self) -> None:
+        self.startup_time = None
+        self.shutdown_time = None
+
+    def set_startup_time(self, when: datetime) -> None:
+        self.startup_time = when
+
+    def set_shutdown_time(self, when: datetime) -> None:
+        self.shutdown_time = when
+
+
+def append_index(index_path: str, entry: Dict[str, Any]) -> None:
+    """Stands in for camera.capture.append_index."""
+    report.index_entries.append((index_path, entry))
+
+
+def latest_luma_frame(monitor, timeout: float) -> Optional[bytes]:
+    """Stands in for triggers.LumaMonitor.next_frame; the fake camera only writes frames when it captures."""
+    return monitor.latest()
+
+
+def write_media_file(writer, path: str, data: bytes) -> None:
+    """Stands in for MediaWriter._write_file and MediaWriter._append."""
+    report.add_file(path, len(data))
+
+
+def _module(name: str, **attributes) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+class Installed(object):
+    """Takes the fakes that install() put in sys.modules out again.
+
+    restore() puts back the modules that the fakes replaced and forgets the
+    camera's modules that were imported while the fakes were in place, as
+    those are bound to the fakes. It is also a context manager:
+
+        with install():
+            camera_thread = importlib.import_module("camera.camera_thread")
+    """
+
+    # The openoceancamera directory
+    ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def __init__(self, modules: Dict[str, types.ModuleType]):
+        self._before = dict(sys.modules)
+        self._replaced = list(modules)
+        self._undo = []
+        sys.modules.update(modules)
+
+    def on_restore(self, undo: Callable[[], None]) -> None:
+        """Has restore() call `undo` as well, for changes made outside sys.modules."""
+        self._undo.append(undo)
+
+    def _imported_since(self, name: str, module) -> bool:
+        path = getattr(module, "__file__", None)
+        return name not in self._before and path is not None and os.path.abspath(path).startswith(self.ROOT + os.sep)
+
+    def restore(self) -> None:
+        while self._undo:
+            self._undo.pop()()
+        for name, module in list(sys.modules.items()):
+            if self._imported_since(name, module):
+                del sys.modules[name]
+        for name in self._replaced:
+            if name in self._before:
+                sys.modules[name] = self._before[name]
+            else:
+                sys.modules.pop(name, None)
+        self._replaced = []
+
+    def __enter__(self) -> "Installed":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.restore()
+
+
+def install() -> Installed:
+    """Replaces the hardware modules in sys.modules with the fakes.
+
+    Must be called before the camera package is imported.
+
+    Returns:
+        An Installed, whose restore() takes the fakes out again.
+    """
+    gpio = _module(
+        "RPi.GPIO",
+        BCM="BCM", BOARD="BOARD", OUT="OUT", IN="IN", HIGH=1, LOW=0, PUD_DOWN="PUD_DOWN",
+        setwarnings=lambda *args: None,
+        setmode=lambda *args: None,
+        setup=lambda *args, **kwargs: None,
+        input=lambda *args: 0,
+        PWM=FakePWM,
+    )
+    return Installed({
+        "RPi": _module("RPi", GPIO=gpio),
+        "RPi.GPIO": gpio,
+        "picamera": _module("picamera", PiCamera=FakePiCamera, PiCameraCircularIO=FakeCircularIO),
+        "sensors": _module(
+            "sensors", Sensor=FakeSensor, SensorSampler=FakeSensorSampler, sensor_sampler=sensor_sampler,
+        ),
+        "uploader": _module("uploader", S3Uploader=FakeUploader, DropboxUploader=FakeUploader),
+    })
@@ -0,0 +1,326 @@
+"""A simulated I2C bus with the sensors' datasheet timings.
+
+The devices convert in the time of the clock module, so on a VirtualClock
+a sampling cycle takes no real time and its length is exact. Each transfer
+takes as long as its bytes would at BUS_HZ. A result that is read before
+its conversion has finished is wrong, as on the real devices: the MS5837
+and TSYS01 return 0 and the Atlas boards report that they are still
+processing. Such reads are counted in SimulatedBus.early_reads.
+
+install() makes it the shared bus of i2c_bus and puts stand-ins for the
+other sensor libraries in sys.modules, so the real sensors package can be
+imported and its drivers run against the bus:
+
+    bus = SimulatedBus.with_sensors()
+    with i2c.install(bus) as installed:
+        sensor = installed.sensors.Sensor()
+"""
+import importlib
+import sys
+import threading
+from typing import Dict, List
+
+import clock
+import i2c_bus
+from atlas_config import AtlasConfigCache
+from .backends import Installed, _module
+
+# SCL frequency of the Raspberry Pi's I2C bus
+BUS_HZ = 100000
+# Integration time of the TSL2561 with the tsl2561 library's default settings
+TSL2561_INTEGRATION_SECONDS = 0.402
+# Bytes of NMEA the GPS sends per update
+GPS_UPDATE_BYTES = 80
+
+# The response code of an Atlas board that has not finished a command
+ATLAS_PENDING = 254
+ATLAS_SUCCESS = 1
+
+
+class SimulatedDevice(object):
+    """A device that converts for `seconds` after a command and then has `result` to read."""
+
+    def __init__(self):
+        self._ready_at = None
+        self._result = None
+
+    def start(self, result, seconds: float) -> None:
+        self._result = result
+        self._ready_at = clock.monotonic() + seconds
+
+    def ready(self) -> bool:
+        return self._ready_at is not None and clock.monotonic() >= self._ready_at
+
+
+class SimulatedADC(SimulatedDevice):
+    """The MS5837 and TSYS01: a byte command starts a conversion, register 0 reads its 24-bit result."""
+
+    RESET = 0x1E
+    # Conversion commands and their maximum conversion time from the datasheet
+    CONVERSIONS = {}
+
+    def __init__(self, prom: Dict[int, int], values: Dict[int, int]):
+        super().__init__()
+        self.prom = prom
+        # The result of each conversion command
+        self.values = values
+        self.early_reads = 0
+
+    def write_byte(self, value: int) -> None:
+        if value in self.CONVERSIONS:
+            self.start(self.values[value], self.CONVERSIONS[value])
+        elif value == self.RESET:
+            self.start(0, 0.0028)
+
+    def read_block(self, register: int, length: int) -> List[int]:
+        if not self.ready():
+            self.early_reads += 1
+            return [0] * length
+        result, self._result = self._result or 0, 0
+        return [(result >> 8 * (length - 1 - i)) & 0xFF for i in range(length)]
+
+    def read_word(self, register: int) -> int:
+        word = self.prom.get(register, 0)
+        return ((word & 0xFF) << 8) | (word >> 8)    # SMBus words are little endian
+
+
+class SimulatedMS5837(SimulatedADC):
+    # D1 and D2 at each OSR, 256 to 8192
+    CONVERSIONS = dict(
+        [(0x40 + 2 * i, seconds) for i, seconds in enumerate((0.00060, 0.00117, 0.00228, 0.00454, 0.00904, 0.01808))]
+        + [(0x50 + 2 * i, seconds) for i, seconds in enumerate((0.00060, 0.00117, 0.00228, 0.00454, 0.00904, 0.01808))]
+    )
+    # The worked example of the MS5837-30BA datasheet: 19.81 C, 3999.8 mbar
+    COEFFICIENTS = [0, 34982, 36352, 20328, 22354, 26646, 26146]
+    D1 = 4958179
+    D2 = 6815414
+
+    def __init__(self):
+        coefficients = list(self.COEFFICIENTS)
+        coefficients[0] = _crc4(coefficients) << 12
+        values = {command: self.D1 if command < 0x50 else self.D2 for command in self.CONVERSIONS}
+        super().__init__({0xA0 + 2 * i: c for i, c in enumerate(coefficients)}, values)
+
+
+class SimulatedTSYS01(SimulatedADC):
+    CONVERSIONS = {0x48: 0.00904}
+    # The worked example of the TSYS01 datasheet: 10.59 C
+    COEFFICIENTS = {0xA2: 28446, 0xA4: 24926, 0xA6: 36016, 0xA8: 32791, 0xAA: 40781}
+    ADC = 9378708
+
+    def __init__(self):
+        super().__init__(self.COEFFICIENTS, {0x48: self.ADC})
+
+
+class SimulatedAtlas(SimulatedDevice):
+    """An Atlas EZO board in I2C mode: text commands, then a response code and text once processed.
+
+    It keeps its calibration and enabled outputs like the real board,
+    counts the commands that change them in `flash_writes` and keeps every
+    command it was sent in `commands`.
+    """
+
+    FIRMWARE = "2.16"
+    # Processing times from the EZO datasheets
+    COMMAND_SECONDS = 0.3
+    READING_SECONDS = {"EC": 0.6, "DO": 0.6, "pH": 0.9}
+    READINGS = {"EC": "52.8,28.5,0.03,1.00", "DO": "8.12,98.3", "pH": "8.14"}
+    # The outputs of each module; a factory reset leaves only the first enabled
+    OUTPUTS = {"EC": ["EC", "TDS", "S", "SG"], "DO": ["DO", "%"], "pH": []}
+    # The strings a calibrated board exports
+    CALIBRATION = ["59A2C31F0B4", "D7E6F5A4B3C"]
+
+    def __init__(self, module: str):
+        super().__init__()
+        self.module = module
+        self.calibration = list(self.CALIBRATION)
+        self.outputs = list(self.OUTPUTS[module])
+        self.flash_writes = 0
+        self.early_reads = 0
+        self.commands = []
+        self._export = []
+
+    def write(self, data: bytes) -> None:
+        command = data.decode("latin-1").rstrip("\x00")
+        self.commands.append(command)
+        name, _, argument = command.upper().partition(",")
+        response = ""
+        if name == "R":
+            self.start(self.READINGS[self.module], self.READING_SECONDS[self.module])
+            return
+        elif name == "I":
+            response = f"?I,{self.module},{self.FIRMWARE}"
+        elif name == "CAL" and argument == "?":
+            response = f"?CAL,{len(self.calibration)}"
+        elif name == "O" and argument == "?":
+            response = ",".join(["?O"] + self.outputs)
+        elif name == "O":
+            output, _, enable = argument.partition(",")
+            enabled = set(self.outputs) | {output} if enable == "1" else set(self.outputs) - {output}
+            self.outputs = [o for o in self.OUTPUTS[self.module] if o in enabled]
+            self.flash_writes += 1
+        elif name == "EXPORT" and argument == "?":
+            self._export = list(self.calibration) + ["*DONE"]
+            response = f"?EXPORT,{len(self.calibration)},{sum(len(c) for c in self.calibration)}"
+        elif name == "EXPORT":
+            response = self._export.pop(0) if self._export else "*DONE"
+        elif name == "IMPORT":
+            self.calibration.append(command.partition(",")[2])
+            self.flash_writes += 1
+        elif name == "FACTORY":
+            self.calibration = []
+            self.outputs = self.OUTPUTS[self.module][:1]
+            self.flash_writes += 1
+        self.start(response, self.COMMAND_SECONDS)
+
+    def read(self, length: int) -> bytes:
+        if not self.ready():
+            self.early_reads += 1
+            return bytes([ATLAS_PENDING]).ljust(length, b"\x00")
+        return (bytes([ATLAS_SUCCESS]) + self._result.encode("latin-1")).ljust(length, b"\x00")[:length]
+
+
+class SimulatedGPS(SimulatedDevice):
+    """A GPS module on I2C, which streams NMEA sentences."""
+
+    SENTENCE = b"$GNRMC,120000.000,A,5130.0000,N,00007.2000,W,0.00,0.00,010821,,,A*6C\r\n"
+
+    def write(self, data: bytes) -> None:
+        pass
+
+    def read(self, length: int) -> bytes:
+        return (self.SENTENCE * (length // len(self.SENTENCE) + 1))[:length]
+
+
+class SimulatedBus(object):
+    """Stands in for i2c_bus.I2CBus, with devices by address."""
+
+    def __init__(self, devices: Dict[int, SimulatedDevice]):
+        self.devices = devices
+        self.lock = threading.RLock()
+        self.transfers = 0
+
+    @classmethod
+    def with_sensors(cls) -> "SimulatedBus":
+        """A bus with the sensors of a camera at their usual addresses."""
+        return cls({
+            0x10: SimulatedGPS(),
+            0x76: SimulatedMS5837(),
+            0x77: SimulatedTSYS01(),
+            100: SimulatedAtlas("EC"),
+            97: SimulatedAtlas("DO"),
+            99: SimulatedAtlas("pH"),
+        })
+
+    @property
+    def early_reads(self) -> int:
+        return sum(getattr(device, "early_reads", 0) for device in self.devices.values())
+
+    def device(self, address: int):
+        if address not in self.devices:
+            raise OSError(121, "Remote I/O error")
+        return self.devices[address]
+
+    def transfer(self, length: int) -> None:
+        """Takes the time of a transfer of `length` bytes after the address, 9 clocks a byte."""
+        with self.lock:
+            self.transfers += 1
+            clock.sleep((length + 1) * 9 / BUS_HZ)
+
+    def write_byte(self, address: int, value: int) -> None:
+        with self.lock:
+            self.transfer(1)
+            self.device(address).write_byte(value)
+
+    def read_word_data(self, address: int, register: int) -> int:
+        with self.lock:
+            self.transfer(3)
+            return self.device(address).read_word(register)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int) -> List[int]:
+        with self.lock:
+            self.transfer(length + 1)
+            return self.device(address).read_block(register, length)
+
+    def write(self, address: int, data: bytes) -> None:
+        with self.lock:
+            self.transfer(len(data))
+            self.device(address).write(data)
+
+    def read(self, address: int, length: int) -> bytes:
+        with self.lock:
+            self.transfer(length)
+            return self.device(address).read(length)
+
+
+class FakeTSL2561(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def lux(self) -> float:
+        clock.sleep(TSL2561_INTEGRATION_SECONDS)
+        return 120.0
+
+
+class FakeGPS(object):
+    """Stands in for adafruit_gps.GPS_GtopI2C, with a fix. Sentences are read in full, discarded."""
+
+    has_fix = True
+    latitude = 51.5
+    longitude = -0.12
+    ADDRESS = 0x10
+
+    def __init__(self, i2c):
+        self._i2c = i2c
+
+    def send_command(self, command: bytes) -> None:
+        pass
+
+    def update(self) -> bool:
+        self._i2c.try_lock()
+        try:
+            self._i2c.readfrom_into(self.ADDRESS, bytearray(GPS_UPDATE_BYTES))
+        finally:
+            self._i2c.unlock()
+        return True
+
+
+def _crc4(coefficients: List[int]) -> int:
+    """The CRC of an MS5837 PROM, as the MS5837 class checks it."""
+    words = list(coefficients) + [0]
+    words[0] &= 0x0FFF
+    remainder = 0
+    for i in range(16):
+        remainder ^= words[i >> 1] & 0x00FF if i % 2 else words[i >> 1] >> 8
+        for _ in range(8):
+            remainder = (remainder << 1) ^ 0x3000 if remainder & 0x8000 else remainder << 1
+    return (remainder >> 12) & 0x000F
+
+
+def install(bus: SimulatedBus) -> Installed:
+    """Makes `bus` the shared I2C bus 1, puts stand-ins for the other sensor libraries in sys.modules and imports the sensors package.
+
+    The drivers' own sleeps go to the clock module, like the conversions',
+    and the Atlas boards' configurations are cached in memory only.
+
+    Returns:
+        An Installed (see simulator.backends), whose restore() undoes all
+        of this and whose `sensors` is the sensors package.
+    """
+    previous_bus = i2c_bus._buses.get(1)
+    installed = Installed({
+        "tsl2561": _module("tsl2561", TSL2561=FakeTSL2561),
+        "adafruit_gps": _module("adafruit_gps", GPS_GtopI2C=FakeGPS),
+    })
+    i2c_bus.set_bus(1, bus)
+    if previous_bus is None:
+        installed.on_restore(lambda: i2c_bus._buses.pop(1, None))
+    else:
+        installed.on_restore(lambda: i2c_bus.set_bus(1, previous_bus))
+    installed.sensors = importlib.import_module("sensors")
+    atlas = sys.modules["sensors.atlasI2C"]
+    atlas.time = _module("time", sleep=clock.sleep)
+    atlas.config_cache = AtlasConfigCache()
+    sys.modules["sensors.ms5837"].time = _module("time", sleep=clock.sleep)
+    sys.modules["sensors.tsys01"].sleep = clock.sleep
+    return installed
@@ -2,6 +2,8 @@ import RPi.GPIO as GPIO
 import datetime
 import sys
 
+from instrumentation import timed
+
 GPIO.setwarnings(False)
 # originally 11
 GPIO.setmode(GPIO.BCM)
@@ -9,11 +11,13 @@ GPIO.setup(24, GPIO.OUT)
 pwm = GPIO.PWM(24, 500)  # PIN 12 = Board 32
 
 
+@timed("pwm.switch_off")
 def switch_off():
     pwm.ChangeDutyCycle(0)
     pwm.stop()
 
 
+@timed("pwm.switch_on")
 def switch_on(dc):
     print(dc)
     pwm.start(dc)
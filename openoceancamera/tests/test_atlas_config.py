@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+import clock
+from atlas_config import AtlasConfigCache, config_key
+from clock import VirtualClock
+from simulator import i2c
+from simulator.i2c import SimulatedAtlas, SimulatedBus
+
+ENTRY = {
+    "calibration": ["59A2C31F0B4", "D7E6F5A4B3C"],
+    "state": {"calibration": "?CAL,2", "outputs": "?O,EC,TDS,S,SG"},
+}
+
+
+class TestAtlasConfigCache:
+    def test_keys(self):
+        assert config_key("EC", 100, "2.16") != config_key("EC", 100, "2.15")
+        assert config_key("EC", 100, "2.16") != config_key("DO", 97, "2.16")
+
+    def test_persists(self, tmp_path):
+        path = str(tmp_path / "atlas_config.json")
+        AtlasConfigCache(path).put(config_key("EC", 100, "2.16"), ENTRY)
+        cache = AtlasConfigCache(path)
+        assert cache.get(config_key("EC", 100, "2.16")) == ENTRY
+        assert cache.get(config_key("EC", 100, "2.15")) is None
+        cache.clear()
+        assert AtlasConfigCache(path).get(config_key("EC", 100, "2.16")) is None
+
+    def test_corrupt_file(self, tmp_path):
+        path = tmp_path / "atlas_config.json"
+        path.write_text("{")
+        cache = AtlasConfigCache(str(path))
+        assert cache.get("key") is None
+        cache.put("key", ENTRY)
+        assert AtlasConfigCache(str(path)).get("key") == ENTRY
+
+
+@pytest.fixture
+def board():
+    return SimulatedAtlas("EC")
+
+
+@pytest.fixture
+def boot(board, tmp_path):
+    """Brings up the EC board as a new process would, and returns the commands it was sent."""
+    previous = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    path = str(tmp_path / "atlas_config.json")
+    with i2c.install(SimulatedBus({100: board})) as installed:
+        def boot():
+            installed.sensors.atlasI2C.config_cache = AtlasConfigCache(path)
+            board.commands.clear()
+            installed.sensors.EC_Sensor()
+            return board.commands
+
+        boot.cache = lambda: AtlasConfigCache(path)
+        yield boot
+    clock.set_clock(previous)
+
+
+class TestAtlasBringUp:
+    KEY = config_key("EC", 100, SimulatedAtlas.FIRMWARE)
+
+    def test_cold_boot_configures_and_caches(self, boot, board):
+        commands = boot()
+        assert "Factory" in commands
+        assert [c for c in commands if c.startswith("O,") and c != "O,?"] == ["O,EC,1", "O,TDS,1", "O,S,1", "O,SG,1"]
+        assert boot.cache().get(self.KEY) == {
+            "calibration": SimulatedAtlas.CALIBRATION,
+            "state": {"calibration": "?CAL,2", "outputs": "?O,EC,TDS,S,SG"},
+        }
+
+    def test_cached_boot_writes_nothing(self, boot, board):
+        boot()
+        writes = board.flash_writes
+        assert boot() == ["i", "Cal,?", "O,?"]
+        assert board.flash_writes == writes
+
+    def test_recalibrated_board_is_configured_again(self, boot, board):
+        boot()
+        board.calibration.append("0F1E2D3C4B5")
+        assert "Factory" in boot()
+        assert boot.cache().get(self.KEY)["calibration"] == SimulatedAtlas.CALIBRATION + ["0F1E2D3C4B5"]
+        assert boot.cache().get(self.KEY)["state"]["calibration"] == "?CAL,3"
+
+    def test_changed_outputs_are_enabled_again(self, boot, board):
+        boot()
+        board.outputs.remove("S")
+        assert "O,S,1" in boot()
+        assert board.outputs == ["EC", "TDS", "S", "SG"]
+        assert boot() == ["i", "Cal,?", "O,?"]
+
+    def test_new_firmware_is_configured_again(self, boot, board):
+        boot()
+        board.FIRMWARE = "2.17"
+        assert "Factory" in boot()
+        assert boot.cache().get(config_key("EC", 100, "2.17")) is not None
@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from simulator import i2c
+from simulator.i2c import ATLAS_PENDING, SimulatedBus
+
+
+@pytest.fixture
+def bus():
+    return SimulatedBus.with_sensors()
+
+
+@pytest.fixture
+def sensors(bus):
+    previous = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    with i2c.install(bus) as installed:
+        yield installed.sensors
+    clock.set_clock(previous)
+
+
+class TestAtlasReads:
+    def test_one_reply_fills_every_field(self, sensors, bus):
+        ec = sensors.EC_Sensor()
+        bus.devices[100].commands.clear()
+        assert ec.read_all() == sensors.ECReading(52.8, 28.5, 0.03, 1.0)
+        assert sensors.DO_Sensor().read_all() == sensors.DOReading(8.12, 98.3)
+        assert sensors.PH_Sensor().read_all() == sensors.PHReading(8.14)
+        # A single R command for all four parameters
+        assert bus.devices[100].commands == ["R"]
+
+    def test_missing_fields_are_unread(self, sensors, bus):
+        ec = sensors.EC_Sensor()
+        bus.devices[100].READINGS = {"EC": "52.8,28.5"}
+        assert ec.read_all() == sensors.ECReading(52.8, 28.5, -1, -1)
+
+    def test_error_response(self, sensors, bus):
+        ec = sensors.EC_Sensor()
+        bus.devices[100].read = lambda length: b"\x02".ljust(length, b"\x00")
+        with pytest.raises(sensors.AtlasReadError, match="response code 2"):
+            ec.read_all()
+        assert ec.get_conductivity() == -1
+
+    def test_read_before_the_reading_is_done(self, sensors):
+        ec = sensors.EC_Sensor()
+        ec._write("R")
+        with pytest.raises(sensors.AtlasReadError, match=f"response code {ATLAS_PENDING}"):
+            ec._read_values()
+
+    def test_no_reading(self, sensors):
+        assert sensors.EC_Sensor.no_reading() == sensors.ECReading(-1, -1, -1, -1)
+        assert sensors.PH_Sensor.no_reading() == sensors.PHReading(-1)
+
+
+class TestSensorCycle:
+    def test_each_board_is_read_once(self, sensors, bus):
+        sensor = sensors.Sensor()
+        sensors.sensor_registry.devices()
+        for address in (100, 97, 99):
+            bus.devices[address].commands.clear()
+        started = clock.monotonic()
+        data = sensor.read_sensor_data()
+        # The boards convert at the same time: one long timeout for all three
+        assert clock.monotonic() - started < 2
+        for address in (100, 97, 99):
+            assert bus.devices[address].commands == ["R"]
+        assert (data["conductivity"], data["salinity"], data["percentage_oxygen"], data["pH"]) == (52.8, 0.03, 98.3, 8.14)
+
+    def test_a_failed_board_reads_as_unread(self, sensors, bus):
+        sensor = sensors.Sensor()
+        sensors.sensor_registry.devices()
+        bus.devices[97].read = lambda length: b"\x02".ljust(length, b"\x00")
+        readings = sensor.read_atlas_sensors()
+        assert readings.do == sensors.DOReading(-1, -1)
+        assert readings.ec == sensors.ECReading(52.8, 28.5, 0.03, 1.0)
+        assert readings.ph == sensors.PHReading(8.14)
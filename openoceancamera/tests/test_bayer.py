@@ -0,0 +1,53 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from tools import bayer
+from tools.demosaic import develop_all, write_synthetic_frames
+
+
+def flat_mosaic(bayer_order, colour, shape=(32, 64)):
+    """A mosaic of a uniformly coloured scene."""
+    mosaic = numpy.zeros(shape, dtype=numpy.uint16)
+    (ry, rx), (g1y, g1x), (g2y, g2x), (by, bx) = bayer.BAYER_OFFSETS[bayer_order]
+    mosaic[ry::2, rx::2] = colour[0]
+    mosaic[g1y::2, g1x::2] = colour[1]
+    mosaic[g2y::2, g2x::2] = colour[1]
+    mosaic[by::2, bx::2] = colour[2]
+    return mosaic
+
+
+class TestBayer:
+    def test_round_trip(self):
+        mosaic = numpy.random.default_rng(1).integers(0, 1024, size=(48, 64), dtype=numpy.uint16)
+        raw = bayer.decode(b"\xff\xd8jpeg\xff\xd9" + bayer.make_raw_block(mosaic, bayer_order=1))
+        assert raw.bayer_order == 1
+        assert numpy.array_equal(raw.mosaic, mosaic)
+
+    def test_no_raw_data(self):
+        with pytest.raises(ValueError):
+            bayer.decode(b"\xff\xd8jpeg\xff\xd9")
+
+    @pytest.mark.parametrize("bayer_order", sorted(bayer.BAYER_OFFSETS))
+    @pytest.mark.parametrize("method", ["bilinear", "superpixel"])
+    def test_demosaic_flat_colour(self, bayer_order, method):
+        rgb = bayer.demosaic(flat_mosaic(bayer_order, (600, 300, 100)), bayer_order, method)
+        assert numpy.allclose(rgb, [600, 300, 100])
+
+    def test_colour_correct(self):
+        rgb = numpy.full((4, 4, 3), [64 + 959 / 4, 64 + 959 / 2, 64 + 959 / 4], dtype=numpy.float32)
+        corrected = bayer.colour_correct(rgb.copy())
+        # Grey world balances the red and blue to the green
+        assert numpy.allclose(corrected, 0.5)
+        corrected = bayer.colour_correct(rgb.copy(), gains=(1, 1), matrix=[0, 0, 1, 0, 1, 0, 1, 0, 0])
+        assert numpy.allclose(corrected, [0.25, 0.5, 0.25])
+        assert bayer.to_uint16(numpy.ones((1, 1, 3), dtype=numpy.float32), gamma=2.2).max() == 65535
+
+    def test_develop_all(self, tmp_path):
+        paths = write_synthetic_frames(str(tmp_path), 2, resolution=(64, 32))
+        (tmp_path / "broken_raw.jpg").write_bytes(b"\xff\xd8\xff\xd9")
+        options = {"method": "bilinear", "format": "npy", "gains": None, "matrix": None, "gamma": 2.2}
+        result = develop_all(paths + [str(tmp_path / "broken_raw.jpg")], str(tmp_path / "out"), options, workers=1)
+        assert result["frames"] == 2
+        assert result["failed"] == 1
+        assert numpy.load(str(tmp_path / "out" / "bench_raw0000.npy")).shape == (32, 64, 3)
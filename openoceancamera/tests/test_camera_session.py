@@ -0,0 +1,155 @@
+import importlib
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from simulator import backends
+
+
+@pytest.fixture
+def session_module():
+    previous = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    with backends.install():
+        yield importlib.import_module("camera.session")
+    clock.set_clock(previous)
+
+
+@pytest.fixture
+def session(session_module):
+    return session_module.CameraSession()
+
+
+class Holder(object):
+    """Holds a lease on another thread until release() is called."""
+
+    def __init__(self, session, **kwargs):
+        self._held = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(session,), kwargs=kwargs, daemon=True)
+        self._thread.start()
+        assert self._held.wait(5)
+
+    def _run(self, session, **kwargs):
+        with session.lease(**kwargs):
+            self._held.set()
+            self._done.wait(5)
+
+    def release(self):
+        self._done.set()
+        self._thread.join(5)
+
+
+class TestCameraSession:
+    def test_exclusive_lease_keeps_others_off(self, session, session_module):
+        holder = Holder(session)
+        with pytest.raises(session_module.CameraBusyError):
+            with session.lease(timeout=0.1):
+                pass
+        with pytest.raises(session_module.CameraBusyError):
+            with session.lease(exclusive=False, timeout=0.1):
+                pass
+        holder.release()
+        with session.lease(timeout=0.1) as camera:
+            assert camera is not None
+
+    def test_shared_leases_overlap(self, session):
+        holder = Holder(session, exclusive=False, resolution=(640, 480))
+        with session.lease(exclusive=False, resolution=(1920, 1080), timeout=0.1) as camera:
+            # Only the first shared user configures the camera
+            assert camera.resolution == (640, 480)
+        holder.release()
+
+    def test_waiting_for_exclusive_contends(self, session):
+        holder = Holder(session, exclusive=False)
+        assert not session.contended
+        acquired = threading.Event()
+
+        def exclusive():
+            with session.lease(timeout=5):
+                acquired.set()
+
+        thread = threading.Thread(target=exclusive, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if session.contended:
+                break
+            time.sleep(0.01)
+        assert session.contended
+        assert not acquired.is_set()
+        # The shared user gives the camera up, as the livestream does
+        holder.release()
+        thread.join(5)
+        assert acquired.is_set()
+        assert not session.contended
+
+    def test_closed_after_the_last_lease(self, session):
+        with session.lease() as camera:
+            assert session.is_open
+        assert camera.closed
+        assert not session.is_open
+
+    def test_kept_open_while_needed(self, session):
+        session.keep_open = lambda: True
+        with session.lease() as first:
+            pass
+        with session.lease() as second:
+            pass
+        assert second is first
+        assert session.is_open
+        assert session.close()
+        assert first.closed
+
+    def test_close_leaves_a_camera_in_use(self, session):
+        session.keep_open = lambda: True
+        holder = Holder(session, exclusive=False)
+        assert not session.close()
+        assert session.is_open
+        holder.release()
+
+    def test_failed_exclusive_lease_closes_the_camera(self, session):
+        session.keep_open = lambda: True
+        with pytest.raises(RuntimeError):
+            with session.lease() as camera:
+                raise RuntimeError("capture failed")
+        assert camera.closed
+
+    def test_shared_leases_wait_for_the_first_to_configure(self, session, session_module, monkeypatch):
+        opening = threading.Event()
+        opened = threading.Event()
+        done = threading.Event()
+        real_camera = session_module.PiCamera
+
+        def slow_camera(**kwargs):
+            opening.set()
+            assert opened.wait(5)
+            return real_camera(**kwargs)
+
+        def first():
+            with session.lease(exclusive=False) as camera:
+                cameras.append(camera)
+                done.wait(5)
+
+        def second():
+            with session.lease(exclusive=False, timeout=5) as camera:
+                cameras.append(camera)
+
+        monkeypatch.setattr(session_module, "PiCamera", slow_camera)
+        cameras = []
+        threads = [threading.Thread(target=first, daemon=True), threading.Thread(target=second, daemon=True)]
+        threads[0].start()
+        assert opening.wait(5)
+        threads[1].start()
+        threads[1].join(0.1)
+        # Still waiting for the camera the first lease is opening
+        assert threads[1].is_alive()
+        opened.set()
+        threads[1].join(5)
+        assert len(cameras) == 2
+        assert cameras[1] is cameras[0] is not None
+        done.set()
+        threads[0].join(5)
@@ -0,0 +1,104 @@
+import importlib
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from Scheduler import RecurringSlot, parse_slot_settings
+from schedule_plan import compile_schedule
+from simulator import backends
+
+
+class Started(BaseException):
+    """Ends the camera thread once it starts a slot."""
+
+
+def slot(start, stop, **kwargs):
+    entry = {
+        "start": start.strftime("%Y-%m-%d-%H:%M:%S"),
+        "stop": stop.strftime("%Y-%m-%d-%H:%M:%S"),
+    }
+    entry.update(kwargs)
+    return entry
+
+
+@pytest.fixture
+def camera_thread_module(monkeypatch, tmp_path):
+    with backends.install():
+        module = importlib.import_module("camera.camera_thread")
+        monkeypatch.setattr(module, "SCHEDULE_PLAN_PATH", str(tmp_path / "schedule.plan"))
+        monkeypatch.setattr(module, "POWER_PLAN_REPORT_PATH", str(tmp_path / "power_plan_report.wpi"))
+        yield module
+
+
+class TestCameraThread:
+    def test_waits_for_a_schedule_after_a_failed_load(self, camera_thread_module, monkeypatch, tmp_path):
+        started = []
+
+        def start_capture(slot):
+            started.append(slot)
+            raise Started()
+
+        def camera_thread():
+            try:
+                camera_thread_module.camera_thread(str(tmp_path / "missing.json"), str(tmp_path / "missing.plan"))
+            except Started:
+                pass
+
+        monkeypatch.setattr(camera_thread_module, "start_capture", start_capture)
+        thread = threading.Thread(target=camera_thread, daemon=True)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+
+        now = datetime.now()
+        camera_thread_module.reload_schedule(compile_schedule([slot(now - timedelta(seconds=1), now + timedelta(minutes=1))]))
+        thread.join(5)
+        assert not thread.is_alive()
+        assert len(started) == 1
+
+    def test_camera_is_kept_open_only_for_a_slot(self, camera_thread_module):
+        now = datetime.now()
+        session = importlib.import_module("camera.session").camera_session
+        assert session.keep_open is camera_thread_module.slot_due
+        camera_thread_module.camera_schedule.load_slots([], [])
+        assert not session.keep_open()
+        compile_schedule([slot(now + timedelta(seconds=30), now + timedelta(minutes=1))]).load_into(camera_thread_module.camera_schedule)
+        assert session.keep_open()
+        compile_schedule([slot(now + timedelta(minutes=5), now + timedelta(minutes=6))]).load_into(camera_thread_module.camera_schedule)
+        assert not session.keep_open()
+
+    def test_runs_a_slot_that_overlaps_one_that_stopped(self, camera_thread_module, monkeypatch):
+        # Overlaps with recurring slots are rejected by compile_schedule, but
+        # a schedule loaded by other means can still have them.
+        begin = datetime(2021, 8, 2, 6, 0, 0)
+        video = parse_slot_settings(slot(begin, begin + timedelta(minutes=30), video=True))
+        video["start"], video["stop"] = begin, begin + timedelta(minutes=30)
+        rule = RecurringSlot(parse_slot_settings(slot(begin, begin + timedelta(days=1))), begin,
+                             begin + timedelta(days=1), timedelta(hours=2), timedelta(minutes=10))
+        started = []
+        shutdowns = []
+
+        def start_capture(slot):
+            started.append((slot["start"], slot["stop"], bool(slot["video"])))
+            clock.sleep((slot["stop"] - clock.now()).total_seconds())
+
+        monkeypatch.setattr(camera_thread_module, "load_schedule",
+                            lambda scheduler, *paths: scheduler.load_slots([video], [rule]))
+        monkeypatch.setattr(camera_thread_module, "start_capture", start_capture)
+        monkeypatch.setattr(camera_thread_module, "set_startup_time", lambda when: None)
+        monkeypatch.setattr(camera_thread_module, "set_shutdown_time", lambda when: shutdowns.append(clock.now()))
+        previous = clock.get_clock()
+        clock.set_clock(VirtualClock(begin))
+        try:
+            camera_thread_module.camera_thread()
+        finally:
+            clock.set_clock(previous)
+        # The occurrence runs first; the video still gets the rest of its slot
+        assert started == [
+            (begin, begin + timedelta(minutes=10), False),
+            (begin, begin + timedelta(minutes=30), True),
+        ]
+        assert shutdowns == [begin + timedelta(minutes=30)]
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from conversions import blocking, run_conversions, run_serially
+from instrumentation import instrumentation
+
+
+@pytest.fixture
+def virtual_clock():
+    virtual_clock = VirtualClock(datetime(2021, 8, 1))
+    previous = clock.get_clock()
+    clock.set_clock(virtual_clock)
+    yield virtual_clock
+    clock.set_clock(previous)
+
+
+def device(log, name, *waits):
+    """A conversion that logs when it sends each command and reads each result."""
+    for wait in waits:
+        log.append((round(clock.monotonic(), 3), name, "convert"))
+        yield wait
+        log.append((round(clock.monotonic(), 3), name, "read"))
+    return name.upper()
+
+
+class TestRunConversions:
+    def test_waits_overlap(self, virtual_clock):
+        log = []
+        readings = run_conversions({
+            "atlas": device(log, "atlas", 1.5),
+            "pressure": device(log, "pressure", 0.02, 0.02),
+            "temperature": device(log, "temperature", 0.01),
+        })
+        assert readings == {"atlas": "ATLAS", "pressure": "PRESSURE", "temperature": "TEMPERATURE"}
+        assert virtual_clock.monotonic() == pytest.approx(1.5)
+        # Every command is sent first, then each result is read at its deadline
+        assert log == [
+            (0, "atlas", "convert"), (0, "pressure", "convert"), (0, "temperature", "convert"),
+            (0.01, "temperature", "read"),
+            (0.02, "pressure", "read"), (0.02, "pressure", "convert"),
+            (0.04, "pressure", "read"),
+            (1.5, "atlas", "read"),
+        ]
+
+    def test_serial(self, virtual_clock):
+        run_conversions({"atlas": device([], "atlas", 1.5), "pressure": device([], "pressure", 0.02, 0.02)}, overlap=False)
+        assert virtual_clock.monotonic() == pytest.approx(1.54)
+        assert run_serially(device([], "temperature", 0.01)) == "TEMPERATURE"
+        assert virtual_clock.monotonic() == pytest.approx(1.55)
+
+    def test_blocking_reads_run_while_others_convert(self, virtual_clock):
+        def lux():
+            clock.sleep(0.4)
+            return 120
+
+        readings = run_conversions({"atlas": device([], "atlas", 1.5), "luminosity": blocking(lux)})
+        assert readings["luminosity"] == 120
+        assert virtual_clock.monotonic() == pytest.approx(1.5)
+
+    def test_failures_are_returned(self, virtual_clock):
+        def failing():
+            yield 0.01
+            raise OSError(121, "Remote I/O error")
+
+        readings = run_conversions({"broken": failing(), "temperature": device([], "temperature", 0.01)})
+        assert isinstance(readings["broken"], OSError)
+        assert readings["temperature"] == "TEMPERATURE"
+
+    def test_stages_are_timed(self, virtual_clock):
+        instrumentation.end_slot("before")
+        run_conversions({"atlas": device([], "atlas", 1.5), "temperature": device([], "temperature", 0.01)})
+        stages = instrumentation.snapshot()["stages"]
+        assert stages["sensors.atlas"]["count"] == 1
+        assert stages["sensors.temperature"]["max_ms"] <= 20
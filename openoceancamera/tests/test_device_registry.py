@@ -0,0 +1,47 @@
+import threading
+import time
+
+from device_registry import DeviceRegistry
+
+
+class Device(object):
+    made = 0
+    lock = threading.Lock()
+
+    def __init__(self, seconds=0.0):
+        time.sleep(seconds)
+        with Device.lock:
+            Device.made += 1
+
+
+def not_connected():
+    raise OSError(121, "Remote I/O error")
+
+
+class TestDeviceRegistry:
+    def setup_method(self):
+        Device.made = 0
+
+    def test_devices_are_made_once_in_parallel(self):
+        registry = DeviceRegistry({name: (name, lambda: Device(0.2)) for name in ("a", "b", "c")})
+        assert not registry.initialised
+        started = time.monotonic()
+        threads = [threading.Thread(target=registry.devices) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert time.monotonic() - started < 0.5
+        assert Device.made == 3
+        assert registry.devices() is registry.devices()
+
+    def test_missing_devices_are_left_out(self):
+        registry = DeviceRegistry({"gps": ("GPS", not_connected), "ph_sensor": ("pH sensor", Device)})
+        assert list(registry.devices()) == ["ph_sensor"]
+
+    def test_reset_detects_again(self):
+        registry = DeviceRegistry({"ph_sensor": ("pH sensor", Device)})
+        registry.devices()
+        registry.reset()
+        registry.devices()
+        assert Device.made == 2
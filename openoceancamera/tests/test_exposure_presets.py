@@ -0,0 +1,83 @@
+from exposure_presets import ExposurePresetCache, apply_preset, prepare_exposure, preset_key, uses_auto_exposure
+
+PRESET = {"shutter_speed": 20000, "analog_gain": 4.0, "digital_gain": 1.5, "awb_gains": [1.6, 1.4]}
+
+
+class SettledCamera(object):
+    """A camera whose auto exposure has already converged."""
+
+    def __init__(self):
+        self.exposure_mode = "auto"
+        self.awb_mode = "auto"
+        self.awb_gains = (1.6, 1.4)
+        self.shutter_speed = 0
+        self.iso = 0
+        self.exposure_speed = 20000
+        self.analog_gain = 4.0
+        self.digital_gain = 1.5
+
+
+class ReadOnlyGainsCamera(SettledCamera):
+    """Like picamera 1.13, where the gains cannot be set."""
+
+    def __setattr__(self, name, value):
+        if name in ("analog_gain", "digital_gain") and hasattr(self, name):
+            raise AttributeError(f"can't set attribute {name}")
+        super().__setattr__(name, value)
+
+
+class TestPresetKey:
+    def test_bands(self):
+        assert preset_key({"depth": 12.3, "luminosity": 100}, 55) == preset_key({"depth": 11, "luminosity": 120}, 50)
+        assert preset_key({"depth": 12.3, "luminosity": 100}, 55) != preset_key({"depth": 16, "luminosity": 100}, 55)
+        assert preset_key({"depth": 12.3, "luminosity": 100}, 55) != preset_key({"depth": 12.3, "luminosity": 400}, 55)
+
+    def test_missing_readings(self):
+        assert preset_key({"depth": -1, "luminosity": -1}, 0) == "depth=unknown/light=0/lux=unknown"
+        assert preset_key({}, 100) == "depth=unknown/light=100/lux=unknown"
+
+    def test_uses_auto_exposure(self):
+        assert uses_auto_exposure({"iso": 0, "shutter_speed": 0, "exposure_mode": "auto", "exposure_compensation": 0})
+        assert not uses_auto_exposure({"iso": 400, "shutter_speed": 0, "exposure_mode": "auto"})
+        assert not uses_auto_exposure({"iso": 0, "shutter_speed": 0, "exposure_mode": "night"})
+
+
+class TestExposurePresets:
+    def test_learns_then_reuses(self, tmp_path):
+        presets = ExposurePresetCache(str(tmp_path / "presets.json"))
+        camera = SettledCamera()
+        timing = prepare_exposure(camera, "key", presets)
+        assert timing["exposure"] == "auto"
+        assert camera.exposure_mode == "off"
+        assert ExposurePresetCache(str(tmp_path / "presets.json")).get("key") == PRESET
+
+        camera = SettledCamera()
+        timing = prepare_exposure(camera, "key", presets)
+        assert timing["exposure"] == "preset"
+        assert timing["settle_seconds"] < 0.05
+        assert camera.shutter_speed == 20000
+        assert camera.awb_mode == "off"
+        assert camera.awb_gains == (1.6, 1.4)
+
+    def test_without_a_key_nothing_is_stored(self, tmp_path):
+        path = tmp_path / "presets.json"
+        camera = SettledCamera()
+        timing = prepare_exposure(camera, None, ExposurePresetCache(str(path)))
+        assert timing["exposure"] == "auto"
+        # Left to auto exposure, which has converged
+        assert camera.exposure_mode == "auto"
+        assert not path.exists()
+
+    def test_read_only_gains(self):
+        camera = ReadOnlyGainsCamera()
+        apply_preset(camera, PRESET)
+        assert camera.iso == 400
+        assert camera.exposure_mode == "off"
+
+    def test_corrupt_file(self, tmp_path):
+        path = tmp_path / "presets.json"
+        path.write_text("{")
+        presets = ExposurePresetCache(str(path))
+        assert presets.get("key") is None
+        presets.put("key", PRESET)
+        assert ExposurePresetCache(str(path)).get("key") == PRESET
@@ -0,0 +1,34 @@
+from frame_filter import RedundantFrameFilter
+
+
+def luma(value, changed=0, size=1000):
+    return bytes([value + 100]) * changed + bytes([value]) * (size - changed)
+
+
+class TestRedundantFrameFilter:
+    def test_keeps_frames_that_changed(self):
+        frame_filter = RedundantFrameFilter(0.05)
+        assert frame_filter.keep(luma(50))
+        assert not frame_filter.keep(luma(50, changed=10))
+        assert frame_filter.keep(luma(50, changed=100))
+        assert frame_filter.last_score == 0.1
+        assert frame_filter.report() == {"kept": 2, "suppressed": 1}
+
+    def test_compares_with_the_last_kept_frame(self):
+        frame_filter = RedundantFrameFilter(0.05)
+        frame_filter.keep(luma(50))
+        # Small changes that add up are measured against the kept frame
+        assert not frame_filter.keep(luma(50, changed=30))
+        assert frame_filter.keep(luma(50, changed=60))
+
+    def test_keeps_a_frame_every_max_skipped(self):
+        frame_filter = RedundantFrameFilter(0.05, max_skipped=3)
+        kept = [frame_filter.keep(luma(50)) for _ in range(9)]
+        assert kept == [True, False, False, False, True, False, False, False, True]
+
+    def test_keeps_frames_without_a_comparison(self):
+        frame_filter = RedundantFrameFilter(0.05)
+        assert frame_filter.keep(None)
+        assert frame_filter.keep(luma(50))
+        assert frame_filter.keep(None)
+        assert frame_filter.last_score is None
@@ -0,0 +1,31 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from tools import hdr_merge
+
+
+class TestHdrMerge:
+    def test_fusing_one_exposure_gives_it_back(self):
+        image = numpy.random.default_rng(1).random((37, 50, 3), dtype=numpy.float32)
+        fused = hdr_merge.fuse(numpy.stack([image, image]))
+        assert numpy.allclose(fused, image, atol=1e-5)
+
+    def test_prefers_well_exposed_frames(self):
+        scene = numpy.random.default_rng(2).random((64, 64, 3), dtype=numpy.float32) * 0.5 + 0.25
+        dark, bright = scene * 0.1, numpy.clip(scene * 4, 0, 1)
+        weights = hdr_merge.fusion_weights(numpy.stack([dark, scene, bright]))
+        assert numpy.allclose(weights.sum(axis=0), 1)
+        assert weights[1].mean() > 0.9
+        fused = hdr_merge.fuse(numpy.stack([dark, scene, bright]))
+        assert abs(fused.mean() - scene.mean()) < 0.05
+
+    def test_merge_all(self, tmp_path):
+        pytest.importorskip("PIL")
+        paths = hdr_merge.write_synthetic_brackets(str(tmp_path), 2, resolution=(64, 48))
+        (tmp_path / "broken.bracket.json").write_text('{"frames": []}')
+        options = {"format": "jpg", "quality": 90}
+        result = hdr_merge.merge_all(paths + [str(tmp_path / "broken.bracket.json")], str(tmp_path / "out"), options, workers=1)
+        assert result["brackets"] == 2
+        assert result["failed"] == 1
+        assert (tmp_path / "out" / "bench_hdr0000.jpg").exists()
@@ -0,0 +1,43 @@
+import pytest
+
+from instrumentation import Histogram, Instrumentation
+
+
+class TestHistogram:
+    def test_report(self):
+        histogram = Histogram()
+        for milliseconds in (0.05, 3, 4, 4.5, 80, 100000):
+            histogram.add(milliseconds)
+        report = histogram.report()
+        assert report["count"] == 6
+        assert report["min_ms"] == 0.05
+        assert report["max_ms"] == 100000
+        assert report["buckets"] == [[0.1, 1], [5, 3], [100, 1], [None, 1]]
+        assert report["p50_ms"] == 5
+        assert report["p95_ms"] == 100000
+
+    def test_empty(self):
+        report = Histogram().report()
+        assert report["count"] == 0
+        assert report["mean_ms"] is None
+        assert report["p50_ms"] is None
+        assert report["buckets"] == []
+
+
+class TestInstrumentation:
+    def test_timer_records_on_error(self):
+        instrumentation = Instrumentation()
+        with pytest.raises(ValueError):
+            with instrumentation.timer("stage"):
+                raise ValueError()
+        assert instrumentation.snapshot()["stages"]["stage"]["count"] == 1
+
+    def test_end_slot(self):
+        instrumentation = Instrumentation()
+        instrumentation.record("capture.jpeg", 0.1)
+        instrumentation.record("capture.jpeg", 0.3)
+        timings = instrumentation.end_slot("slot")
+        assert timings["slot"] == "slot"
+        assert timings["stages"]["capture.jpeg"]["mean_ms"] == 200
+        assert instrumentation.last_slot is timings
+        assert instrumentation.snapshot()["stages"] == {}
@@ -0,0 +1,101 @@
+import threading
+
+from media_writer import MediaWriter
+
+
+class BlockedWriter(MediaWriter):
+    """Holds every write until `release` is set, like a stalled USB drive."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.release = threading.Event()
+
+    def _write_file(self, path, data):
+        self.release.wait()
+        super()._write_file(path, data)
+
+
+class TestMediaWriter:
+    def test_writes_files(self, tmp_path):
+        with MediaWriter() as writer:
+            for n in range(5):
+                assert writer.write(str(tmp_path / f"{n}.jpg"), bytes([n]) * 10)
+        assert sorted(p.name for p in tmp_path.iterdir()) == [f"{n}.jpg" for n in range(5)]
+        assert (tmp_path / "3.jpg").read_bytes() == b"\x03" * 10
+        stats = writer.stats()
+        assert stats["written"] == 5
+        assert stats["bytes_written"] == 50
+        assert stats["dropped"] == 0
+
+    def test_drops_when_full(self, tmp_path):
+        writer = BlockedWriter(max_queued_bytes=2).start()
+        results = [writer.write(str(tmp_path / f"{n}.jpg"), b"xy", timeout=0.01) for n in range(6)]
+        # The frame held by the writer thread still counts, so the rest are dropped
+        assert results.count(False) >= 5
+        writer.release.set()
+        writer.close()
+        stats = writer.stats()
+        assert stats["written"] + stats["dropped"] == 6
+        assert stats["dropped"] == results.count(False)
+        assert len(list(tmp_path.iterdir())) == stats["written"]
+
+    def test_data_being_written_counts(self, tmp_path):
+        writer = BlockedWriter(max_queued_bytes=4).start()
+        assert writer.write(str(tmp_path / "a.jpg"), b"xy")
+        for _ in range(500):
+            if writer.stats()["queued"] == 0:
+                break
+            threading.Event().wait(0.01)
+        # a.jpg has been taken by the writer thread but is not written yet
+        assert writer.write(str(tmp_path / "b.jpg"), b"xy")
+        assert not writer.write(str(tmp_path / "c.jpg"), b"xy", timeout=0.01)
+        assert writer.stats()["queued_bytes"] == 4
+        writer.release.set()
+        writer.close()
+        assert writer.stats()["queued_bytes"] == 0
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["a.jpg", "b.jpg"]
+
+    def test_appends_in_order(self, tmp_path):
+        log = str(tmp_path / "log.jsonl")
+        with MediaWriter() as writer:
+            for n in range(100):
+                writer.append(log, f"{n}\n".encode())
+        assert (tmp_path / "log.jsonl").read_text().split() == [str(n) for n in range(100)]
+        assert writer.stats()["bytes_written"] == sum(len(f"{n}\n") for n in range(100))
+
+    def test_appends_wait_instead_of_dropping(self, tmp_path):
+        writer = BlockedWriter(max_queued_bytes=2).start()
+        writer.write(str(tmp_path / "a.jpg"), b"xy")
+        appender = threading.Thread(target=lambda: [writer.append(str(tmp_path / "log"), b"ab") for _ in range(3)])
+        appender.start()
+        appender.join(0.1)
+        assert appender.is_alive()
+        writer.release.set()
+        appender.join()
+        writer.close()
+        assert (tmp_path / "log").read_bytes() == b"ababab"
+        assert writer.stats()["dropped"] == 0
+
+    def test_stream(self, tmp_path):
+        with MediaWriter() as writer:
+            stream = writer.open_stream(str(tmp_path / "video.h264"))
+            stream.write(b"abc")
+            stream.write(memoryview(b"def"))
+            stream.close()
+            assert stream.bytes_written == 6
+        assert (tmp_path / "video.h264").read_bytes() == b"abcdef"
+
+    def test_flush_syncs(self, tmp_path):
+        with MediaWriter(sync_interval=3600) as writer:
+            writer.write(str(tmp_path / "a.jpg"), b"x")
+            writer.append(str(tmp_path / "log"), b"x")
+            assert writer.flush(timeout=5)
+            stats = writer.stats()
+            assert stats["syncs"] == 1
+            assert stats["queued"] == 0
+            assert (tmp_path / "a.jpg").read_bytes() == b"x"
+
+    def test_write_errors_are_counted(self, tmp_path):
+        with MediaWriter() as writer:
+            writer.write(str(tmp_path / "missing" / "a.jpg"), b"x")
+        assert writer.stats()["failed"] == 1
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from pacing import FramePacer
+
+
+@pytest.fixture
+def virtual_clock():
+    virtual_clock = VirtualClock(datetime(2021, 8, 1))
+    previous = clock.get_clock()
+    clock.set_clock(virtual_clock)
+    yield virtual_clock
+    clock.set_clock(previous)
+
+
+class TestFramePacer:
+    def test_work_does_not_drift(self, virtual_clock):
+        pacer = FramePacer(10)
+        deadlines = []
+        for _ in range(5):
+            deadlines.append(pacer.wait())
+            # Capture and sensor reads take time, but less than the period
+            virtual_clock.advance(3.7)
+        assert deadlines == [0, 10, 20, 30, 40]
+        assert pacer.report()["missed_deadlines"] == 0
+
+    def test_sub_second_period(self, virtual_clock):
+        pacer = FramePacer(0.25)
+        for _ in range(8):
+            pacer.wait()
+            virtual_clock.advance(0.1)
+        assert virtual_clock.monotonic() == pytest.approx(1.85)
+        assert pacer.frames == 8
+
+    def test_late_frames_are_skipped_and_counted(self, virtual_clock):
+        pacer = FramePacer(1)
+        assert pacer.wait() == 0
+        virtual_clock.advance(3.5)
+        # Deadlines 1 and 2 are more than a period late and are skipped;
+        # the frame due at 3 is taken half a second late.
+        assert pacer.wait() == 3
+        report = pacer.report()
+        assert report["frames"] == 2
+        assert report["missed_deadlines"] == 2
+        assert report["max_jitter_ms"] == 500.0
+
+    def test_jitter(self, virtual_clock):
+        pacer = FramePacer(1)
+        pacer.wait()
+        virtual_clock.advance(1.25)
+        pacer.wait()
+        report = pacer.report()
+        assert report["max_jitter_ms"] == 250.0
+        assert report["mean_jitter_ms"] == 125.0
+
+    def test_lead(self, virtual_clock):
+        pacer = FramePacer(10)
+        assert pacer.wait(lead=1) == 0
+        virtual_clock.advance(3)
+        assert pacer.wait(lead=1) == 10
+        assert virtual_clock.monotonic() == 9
+        # Late for the lead, but not for the frame
+        virtual_clock.advance(10.5)
+        assert pacer.wait(lead=1) == 20
+        assert virtual_clock.monotonic() == 19.5
+        assert pacer.report()["max_jitter_ms"] == 0.0
+
+    def test_stops_at_end(self, virtual_clock):
+        pacer = FramePacer(2)
+        frames = 0
+        while pacer.wait(end=10) is not None:
+            frames += 1
+        assert frames == 6
+        assert virtual_clock.monotonic() == 10
+
+    def test_restart_keeps_statistics(self, virtual_clock):
+        pacer = FramePacer(1)
+        pacer.wait()
+        pacer.wait()
+        virtual_clock.advance(10.5)
+        pacer.restart(20)
+        assert pacer.wait() == 20
+        assert pacer.wait() == 21
+        report = pacer.report()
+        assert report["frames"] == 4
+        assert report["missed_deadlines"] == 0
+
+    def test_invalid_period(self, virtual_clock):
+        with pytest.raises(ValueError):
+            FramePacer(0)
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from Scheduler import Scheduler
+from power_plan import PowerPlan, power_windows, should_power_off
+
+
+def slot(start, minutes):
+    return {"start": start, "stop": start + timedelta(minutes=minutes)}
+
+
+class TestPowerPlan:
+    base = datetime(2021, 8, 1, 12, 0, 0)
+
+    def test_close_slots_share_a_window(self):
+        b = self.base
+        windows = list(power_windows([
+            slot(b, 10),
+            slot(b + timedelta(minutes=15), 10),
+            slot(b + timedelta(hours=2), 10),
+        ]))
+        assert windows == [
+            (b - timedelta(minutes=2), b + timedelta(minutes=27)),
+            (b + timedelta(minutes=118), b + timedelta(minutes=132)),
+        ]
+
+    def test_report_and_wpi(self):
+        b = self.base
+        plan = PowerPlan(list(power_windows([slot(b, 10), slot(b + timedelta(hours=2), 10)])))
+        report = plan.report()
+        assert report["boots"] == 2
+        assert report["powered_on_hours"] == round(28 / 60, 2)
+        assert plan.to_wpi().splitlines()[2:] == [
+            "BEGIN\t2021-08-01 11:58:00",
+            "END\t2021-08-01 14:12:00",
+            "ON\tM14",
+            "OFF\tH1 M46",
+            "ON\tM14",
+        ]
+
+    def test_horizon(self):
+        b = self.base
+        scheduler = Scheduler()
+        scheduler.load_scheduler_data([{
+            "start": b.strftime("%Y-%m-%d-%H:%M:%S"),
+            "stop": (b + timedelta(days=365)).strftime("%Y-%m-%d-%H:%M:%S"),
+            "repeat": {"every": 120, "duration": 10},
+        }])
+        # A window every 2 hours for a year, or for the next day only
+        assert len(PowerPlan.from_scheduler(scheduler, now=b).windows) == 365 * 12
+        plan = PowerPlan.from_scheduler(scheduler, now=b, horizon=timedelta(days=1))
+        assert len(plan.windows) == 12
+        assert plan.windows[-1].on == b + timedelta(hours=22, minutes=-2)
+
+    def test_should_power_off(self):
+        b = self.base
+        assert should_power_off(b, b + timedelta(minutes=11))
+        assert not should_power_off(b, b + timedelta(minutes=10))
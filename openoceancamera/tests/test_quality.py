@@ -0,0 +1,88 @@
+import json
+import os
+import random
+
+import pytest
+
+import quality
+from quality import frame_quality, load_scores, upload_order
+
+
+def frame(pixel, resolution=quality.QUALITY_RESOLUTION):
+    width, height = resolution
+    return bytes(pixel(x, y) for y in range(height) for x in range(width))
+
+
+def textured(x, y):
+    return 60 + (x * 7 + y * 13) % 120
+
+
+class TestFrameQuality:
+    def test_textured_frame_is_usable(self):
+        scores = frame_quality(frame(textured))
+        assert scores["usable"]
+        assert 60 < scores["brightness"] < 180
+        assert scores["clipped"] == 0
+        assert scores["sharpness"] > quality.MIN_SHARPNESS
+        assert 0 < scores["score"] <= 1
+
+    @pytest.mark.parametrize("pixel", [
+        lambda x, y: 5,                                  # black
+        lambda x, y: 250,                                # blown out
+        lambda x, y: 100 + (x + y) // 32,                # sediment haze: no detail
+    ])
+    def test_unusable_frames(self, pixel):
+        assert not frame_quality(frame(pixel))["usable"]
+
+    def test_pure_python_fallback_agrees(self, monkeypatch):
+        pytest.importorskip("numpy")
+        rng = random.Random(1)
+        luma = bytes(rng.randrange(256) for _ in range(64 * 48))
+        expected = frame_quality(luma, (64, 48))
+        monkeypatch.setattr(quality, "numpy", None)
+        assert frame_quality(luma, (64, 48)) == pytest.approx(expected, rel=1e-3)
+
+    def test_padded_rows(self):
+        # picamera pads rows to 32 pixels; the padding is not scored
+        luma = b"".join(bytes([100]) * 40 + bytes([255]) * 24 for _ in range(16))
+        assert frame_quality(luma, (40, 16))["clipped"] == 0
+
+
+class TestUploadOrder:
+    def test_best_first_and_unusable_left_out(self, tmp_path):
+        entries = [
+            {"file": "a.jpg", "score": 0.2, "usable": True},
+            {"file": "b.jpg", "score": 0.0, "usable": False},
+            {"file": "c.jpg", "score": 0.7, "usable": True},
+        ]
+        (tmp_path / "slot.quality.jsonl").write_text("".join(json.dumps(e) + "\n" for e in entries) + '{"file": "d.j')
+        scores = load_scores(str(tmp_path))
+        assert set(scores) == {"a.jpg", "b.jpg", "c.jpg"}
+        paths = [str(tmp_path / name) for name in ("a.jpg", "b.jpg", "c.jpg", "d.jpg", "video.h264")]
+        ordered, skipped = upload_order(paths, scores, str(tmp_path))
+        assert ordered == [str(tmp_path / name) for name in ("c.jpg", "a.jpg", "d.jpg", "video.h264")]
+        assert skipped == [str(tmp_path / "b.jpg")]
+
+    def test_videos_go_after_photos(self, tmp_path):
+        entries = [
+            {"file": "a.jpg", "score": 0.4, "usable": True},
+            {"file": "b.jpg", "score": 0.8, "usable": True},
+        ]
+        (tmp_path / "slot.quality.jsonl").write_text("".join(json.dumps(e) + "\n" for e in entries))
+        names = ("seg_000.h264", "a.jpg", "seg_001.h264", "raw.jpg", "b.jpg")
+        paths = [str(tmp_path / name) for name in names]
+        ordered, skipped = upload_order(paths, load_scores(str(tmp_path)), str(tmp_path))
+        assert ordered == [str(tmp_path / name) for name in ("b.jpg", "a.jpg", "raw.jpg", "seg_000.h264", "seg_001.h264")]
+        assert skipped == []
+
+    def test_scores_are_keyed_by_relative_path(self, tmp_path):
+        for directory, score, usable in (("cam1", 0.9, True), ("cam2", 0.0, False)):
+            (tmp_path / directory).mkdir()
+            entry = {"file": "frame.jpg", "score": score, "usable": usable}
+            (tmp_path / directory / "slot.quality.jsonl").write_text(json.dumps(entry) + "\n")
+        scores = load_scores(str(tmp_path))
+        assert set(scores) == {os.path.join("cam1", "frame.jpg"), os.path.join("cam2", "frame.jpg")}
+        paths = [str(tmp_path / "cam1" / "frame.jpg"), str(tmp_path / "cam2" / "frame.jpg")]
+        ordered, skipped = upload_order(paths, scores, str(tmp_path))
+        assert ordered == paths[:1]
+        assert skipped == paths[1:]
@@ -0,0 +1,183 @@
+import importlib
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from simulator import i2c
+from simulator.i2c import SimulatedBus
+
+
+class FakeSensor(object):
+    """Takes `seconds` of virtual time per reading, once the test lets it with go()."""
+
+    def __init__(self, seconds=0.5, failures=0):
+        self.seconds = seconds
+        self.failures = failures
+        self.reads = 0
+        self._allowed = threading.Semaphore(0)
+
+    def go(self, readings=1):
+        for _ in range(readings):
+            self._allowed.release()
+
+    def read_sensor_data(self):
+        self._allowed.acquire()
+        clock.sleep(self.seconds)
+        self.reads += 1
+        if self.reads <= self.failures:
+            raise OSError(121, "Remote I/O error")
+        return {"pressure": self.reads}
+
+
+@pytest.fixture
+def sampler_module():
+    previous = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    with i2c.install(SimulatedBus({})):
+        yield importlib.import_module("sensors.sampler")
+    clock.set_clock(previous)
+
+
+@pytest.fixture
+def sensor():
+    return FakeSensor()
+
+
+@pytest.fixture
+def make_sampler(sampler_module, sensor):
+    samplers = []
+
+    def make_sampler(**kwargs):
+        kwargs.setdefault("sensor_factory", lambda: sensor)
+        kwargs.setdefault("log", False)
+        sampler = sampler_module.SensorSampler(**kwargs)
+        samplers.append(sampler)
+        return sampler
+
+    yield make_sampler
+    # Lets any reading in progress finish, so the threads can stop
+    sensor.go(100)
+    for sampler in samplers:
+        sampler.stop(5)
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+class TestSensorSampler:
+    def test_start_and_stop_are_idempotent(self, make_sampler, sensor):
+        sampler = make_sampler()
+        sampler.stop()
+        sampler.start()
+        thread = sampler._thread
+        sampler.start()
+        assert sampler._thread is thread
+        assert sampler.running
+        sensor.go(100)
+        sampler.stop(5)
+        sampler.stop(5)
+        assert not sampler.running
+        assert not thread.is_alive()
+        sampler.start()
+        assert sampler.running
+
+    def test_readings_are_paced_at_the_period(self, make_sampler, sensor):
+        sampler = make_sampler(period=5)
+        sampler.start()
+        sensor.go(3)
+        wait_for(lambda: len(sampler.history()) == 3)
+        assert [sample.monotonic for sample in sampler.history()] == [0.5, 5.5, 10.5]
+        assert [sample.data["pressure"] for sample in sampler.history()] == [1, 2, 3]
+
+    def test_start_with_a_shorter_period(self, make_sampler, sensor):
+        sampler = make_sampler(period=5)
+        sampler.start(2)
+        sensor.go(3)
+        wait_for(lambda: len(sampler.history()) == 3)
+        assert [sample.monotonic for sample in sampler.history()] == [0.5, 2.5, 4.5]
+        # A longer period than the sampler's own is not used
+        sampler.start(10)
+        assert sampler.period == 5
+        sampler.start()
+        assert sampler.period == 5
+
+    def test_slow_readings_follow_each_other(self, make_sampler, sensor):
+        sensor.seconds = 7
+        sampler = make_sampler(period=5)
+        sampler.start()
+        sensor.go(3)
+        wait_for(lambda: len(sampler.history()) == 3)
+        assert [sample.monotonic for sample in sampler.history()] == [7, 14, 21]
+
+    def test_nothing_read_yet(self, make_sampler, sampler_module):
+        sampler = make_sampler()
+        assert sampler.latest() is None
+        assert sampler.latest_data() == sampler_module.no_reading()
+        sampler.start()
+        assert sampler.latest_data() == sampler_module.no_reading()
+        assert sampler.wait_for_sample(0.05) is None
+
+    def test_wait_for_sample(self, make_sampler, sensor):
+        sampler = make_sampler()
+        sampler.start()
+        threading.Timer(0.05, sensor.go).start()
+        sample = sampler.wait_for_sample(5)
+        assert sample.data == {"pressure": 1}
+        assert sampler.latest_data() == {"pressure": 1}
+        # A copy, so the caller cannot change the buffered reading
+        sampler.latest_data()["pressure"] = -1
+        assert sampler.latest().data == {"pressure": 1}
+
+    def test_history_is_bounded(self, make_sampler, sensor):
+        sampler = make_sampler(history=3)
+        sensor.go(5)
+        for _ in range(5):
+            sampler.sample()
+        history = sampler.history()
+        assert [sample.data["pressure"] for sample in history] == [3, 4, 5]
+        assert sampler.history(since=history[0].monotonic) == history[1:]
+        assert sampler.history(since=history[-1].monotonic) == []
+
+    def test_sensor_is_made_once_on_the_sampler_thread(self, make_sampler, sensor):
+        made = []
+
+        def sensor_factory():
+            made.append(threading.current_thread().name)
+            return sensor
+
+        sampler = make_sampler(sensor_factory=sensor_factory)
+        sampler.start()
+        sensor.go(2)
+        wait_for(lambda: len(sampler.history()) == 2)
+        assert made == ["sensor-sampler"]
+
+    def test_failed_reading_does_not_stop_the_sampler(self, make_sampler, sensor):
+        sensor.failures = 1
+        sampler = make_sampler(period=5)
+        sampler.start()
+        sensor.go(2)
+        wait_for(lambda: len(sampler.history()) == 1)
+        # The first reading failed; the next one came a period later
+        assert sampler.latest().data == {"pressure": 2}
+        assert sampler.latest().monotonic == 5.5
+        assert sampler.running
+
+    def test_failed_log_does_not_stop_the_sampler(self, make_sampler, sensor, sampler_module, monkeypatch):
+        def log_sensor_data(data, timestamp):
+            raise OSError(28, "No space left on device")
+
+        monkeypatch.setattr(sampler_module, "log_sensor_data", log_sensor_data)
+        sampler = make_sampler(log=True)
+        sampler.start()
+        sensor.go(2)
+        wait_for(lambda: len(sampler.history()) == 2)
+        assert sampler.running
@@ -0,0 +1,193 @@
+import os
+import pytest
+from datetime import datetime, timedelta
+from Scheduler import Scheduler
+from schedule_plan import (
+    ScheduleValidationError, SchedulePlanError, compile_schedule, load_schedule, read_plan, write_plan,
+)
+
+
+def slot(start, stop, **kwargs):
+    entry = {
+        "start": start.strftime("%Y-%m-%d-%H:%M:%S"),
+        "stop": stop.strftime("%Y-%m-%d-%H:%M:%S"),
+    }
+    entry.update(kwargs)
+    return entry
+
+
+class TestSchedulePlan:
+    base = datetime(2021, 8, 1, 12, 0, 0)
+
+    def test_round_trip(self, tmp_path):
+        b = self.base
+        plan = compile_schedule([
+            slot(b + timedelta(hours=2), b + timedelta(hours=3), video=True, framerate=30,
+                 resolution={"x": 1280, "y": 720}, exposure_mode="night"),
+            slot(b, b + timedelta(hours=1), iso="400", frequency=0.5, light=40, upload=True,
+                 exposure_compensation=-6.0),
+            slot(b + timedelta(days=1), b + timedelta(days=30), repeat={"every": 120, "duration": 10}, wiper=True),
+        ])
+        path = str(tmp_path / "schedule.plan")
+        write_plan(plan, path)
+        loaded = read_plan(path)
+        assert loaded.slots == plan.slots
+        assert loaded.slots[0]["iso"] == 400
+        assert loaded.slots[0]["frequency"] == 0.5
+        assert loaded.slots[0]["exposure_compensation"] == -6
+        assert loaded.slots[0]["video"] is None
+        assert loaded.slots[1]["resolution"] == (1280, 720)
+        assert len(loaded.rules) == 1
+        rule = loaded.rules[0]
+        assert rule.settings["wiper"] is True
+        assert rule.every == timedelta(hours=2)
+        assert rule.duration == timedelta(minutes=10)
+
+    def test_burst_settings(self, tmp_path):
+        b = self.base
+        plan = compile_schedule([
+            slot(b, b + timedelta(hours=1), burst={"fps": "10", "duration": 5}),
+            slot(b + timedelta(hours=2), b + timedelta(hours=3)),
+        ])
+        assert plan.slots[0]["burst"] == {"fps": 10, "duration": 5, "interval": 0}
+        assert plan.slots[1]["burst"] is None
+        path = str(tmp_path / "schedule.plan")
+        write_plan(plan, path)
+        assert read_plan(path).slots == plan.slots
+
+    def test_trigger_settings(self):
+        b = self.base
+        plan = compile_schedule([
+            slot(b, b + timedelta(hours=1), video=True, trigger={"motion": "0.05", "post_seconds": 30}),
+        ])
+        assert plan.slots[0]["trigger"] == {
+            "pre_seconds": 10, "post_seconds": 30, "motion": 0.05,
+            "luminosity_change": None, "depth_change": None,
+        }
+
+    def test_raw_round_trips(self, tmp_path):
+        b = self.base
+        plan = compile_schedule([slot(b, b + timedelta(hours=1), frequency=10, raw=True)])
+        path = str(tmp_path / "schedule.plan")
+        write_plan(plan, path)
+        assert read_plan(path).slots[0]["raw"] is True
+
+    def test_bracket_settings(self):
+        b = self.base
+        plan = compile_schedule([slot(b, b + timedelta(hours=1), frequency=10, bracket={"compensation": ["-12", 0, 12]})])
+        assert plan.slots[0]["bracket"] == {"compensation": [-12, 0, 12]}
+
+    def test_merges_overlapping_slots(self):
+        b = self.base
+        plan = compile_schedule([
+            slot(b, b + timedelta(hours=1), iso=100),
+            slot(b + timedelta(minutes=30), b + timedelta(hours=2), iso=100),
+            slot(b + timedelta(hours=1, minutes=30), b + timedelta(hours=3), iso=200),
+            slot(b + timedelta(hours=2), b + timedelta(hours=2, minutes=30), iso=300),
+        ])
+        assert [(s["start"], s["stop"], s["iso"]) for s in plan.slots] == [
+            (b, b + timedelta(hours=2), 100),
+            (b + timedelta(hours=2, seconds=1), b + timedelta(hours=3), 200),
+        ]
+
+    def test_rejects_recurring_overlaps(self):
+        b = self.base
+        every_2h = {"every": 120, "duration": 10}
+        # The video slot from the review: 06:00 to 06:30 against a 10 minute occurrence at 06:00
+        with pytest.raises(ScheduleValidationError, match="overlaps the slot"):
+            compile_schedule([
+                slot(b, b + timedelta(days=2), repeat=every_2h),
+                slot(b + timedelta(hours=18), b + timedelta(hours=18, minutes=30), video=True),
+            ])
+        with pytest.raises(ScheduleValidationError, match="overlap at 2021-08-01 16:05:00"):
+            compile_schedule([
+                slot(b, b + timedelta(days=2), repeat=every_2h),
+                slot(b + timedelta(hours=1, minutes=5), b + timedelta(days=2), repeat={"every": 180, "duration": 10}),
+            ])
+
+    def test_recurring_slots_between_others(self):
+        b = self.base
+        plan = compile_schedule([
+            slot(b, b + timedelta(days=365), repeat={"every": 120, "duration": 10}),
+            # In the gaps of the first, which they only touch
+            slot(b + timedelta(minutes=10), b + timedelta(days=365), repeat={"every": 60, "duration": 50}),
+            slot(b + timedelta(hours=1), b + timedelta(hours=1, minutes=10), upload=True),
+        ])
+        assert len(plan.rules) == 2
+        assert len(plan.slots) == 1
+
+    @pytest.mark.parametrize("entry", [
+        {"start": "2021-08-01-12:00:00"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-11:00:00"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01 13:00"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "iso": "high"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "exposure_mode": "bright"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "repeat": {"every": 0, "duration": 1}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "burst": {"fps": 10}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "burst": {"fps": 100, "duration": 5}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "burst": {"fps": 10, "duration": 5, "interval": 2}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "burst": {"fps": 10, "duration": 5}, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "segment_seconds": 60},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "segment_mb": 0, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "trigger": {"motion": 0.1}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "trigger": {"pre_seconds": 5}, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "trigger": {"pre_seconds": 60, "motion": 0.05}, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "trigger": {"motion": 2}, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "suppress": {"threshold": 0.01}, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "suppress": {"threshold": 0.01, "mode": "delete"}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "suppress": {"mode": "skip"}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "raw": "yes"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "exposure_compensation": 2.5},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "frequency": "nan"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "light": "inf"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "iso": "100.5"},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "shutter_speed": 1000.5},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "raw": True, "video": True},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "raw": True, "frequency": 0.5},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "bracket": {"compensation": [0]}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "bracket": {"compensation": [0, 6], "shutter_speeds": [100, 200]}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "bracket": {"shutter_speeds": [1000, 2000000]}},
+        {"start": "2021-08-01-12:00:00", "stop": "2021-08-01-13:00:00", "bracket": {"compensation": [-6, 6]}, "raw": True},
+    ])
+    def test_invalid_slots_are_rejected(self, entry):
+        with pytest.raises(ScheduleValidationError):
+            compile_schedule([entry])
+
+    def test_rejects_foreign_file(self, tmp_path):
+        path = tmp_path / "schedule.plan"
+        path.write_bytes(b"not a plan at all")
+        with pytest.raises(SchedulePlanError):
+            read_plan(str(path))
+
+    def test_rejects_corrupt_extras(self, tmp_path):
+        import json
+        b = self.base
+        schedule_path = tmp_path / "schedule.json"
+        plan_path = tmp_path / "schedule.plan"
+        schedule_path.write_text(json.dumps([slot(b, b + timedelta(hours=1), burst={"fps": 10, "duration": 2})]))
+        write_plan(compile_schedule(json.loads(schedule_path.read_text())), str(plan_path))
+        data = plan_path.read_bytes()
+        plan_path.write_bytes(data[:-1] + b"!")
+        with pytest.raises(SchedulePlanError, match="corrupt"):
+            read_plan(str(plan_path))
+        # load_schedule falls back to the JSON and writes a good plan
+        scheduler = Scheduler()
+        load_schedule(scheduler, str(schedule_path), str(plan_path))
+        assert scheduler.active_slot(b)["burst"]["fps"] == 10
+        assert read_plan(str(plan_path)).slots[0]["burst"]["fps"] == 10
+
+    def test_load_schedule_recompiles_stale_plan(self, tmp_path):
+        import json
+        b = self.base
+        schedule_path = tmp_path / "schedule.json"
+        plan_path = tmp_path / "schedule.plan"
+        schedule_path.write_text(json.dumps([slot(b, b + timedelta(hours=1), iso=100)]))
+        scheduler = Scheduler()
+        load_schedule(scheduler, str(schedule_path), str(plan_path))
+        assert plan_path.exists()
+        assert scheduler.active_slot(b)["iso"] == 100
+
+        schedule_path.write_text(json.dumps([slot(b, b + timedelta(hours=1), iso=200)]))
+        os.utime(str(plan_path), (0, 0))
+        load_schedule(scheduler, str(schedule_path), str(plan_path))
+        assert scheduler.active_slot(b)["iso"] == 200
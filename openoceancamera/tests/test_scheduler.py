@@ -0,0 +1,154 @@
+import pytest
+from datetime import datetime, timedelta
+from Scheduler import Scheduler
+
+
+def make_slot(start, stop, **kwargs):
+    slot = {
+        "start": start.strftime("%Y-%m-%d-%H:%M:%S"),
+        "stop": stop.strftime("%Y-%m-%d-%H:%M:%S"),
+    }
+    slot.update(kwargs)
+    return slot
+
+
+class TestScheduler:
+    base = datetime(2021, 8, 1, 12, 0, 0)
+
+    def load(self, slots):
+        scheduler = Scheduler()
+        scheduler.load_scheduler_data(slots)
+        return scheduler
+
+    def test_slots_are_sorted_on_load(self):
+        b = self.base
+        scheduler = self.load([
+            make_slot(b + timedelta(hours=2), b + timedelta(hours=3), iso=200),
+            make_slot(b, b + timedelta(hours=1), iso=100),
+        ])
+        assert [slot["iso"] for slot in scheduler.schedule_data] == [100, 200]
+
+    def test_active_slot(self):
+        b = self.base
+        scheduler = self.load([
+            make_slot(b, b + timedelta(minutes=10)),
+            make_slot(b + timedelta(hours=1), b + timedelta(hours=1, minutes=10)),
+        ])
+        assert scheduler.should_start(b - timedelta(seconds=1)) == -1
+        assert scheduler.should_start(b) == 0
+        assert scheduler.should_start(b + timedelta(minutes=10)) == 0
+        assert scheduler.should_start(b + timedelta(minutes=30)) == -1
+        assert scheduler.should_start(b + timedelta(hours=1, minutes=5)) == 1
+        assert scheduler.should_start(b + timedelta(hours=2)) == -1
+
+    def test_active_slot_inside_long_overlapping_slot(self):
+        b = self.base
+        scheduler = self.load([
+            make_slot(b, b + timedelta(hours=5), iso=100),
+            make_slot(b + timedelta(hours=1), b + timedelta(hours=2), iso=200),
+        ])
+        index = scheduler.should_start(b + timedelta(hours=3))
+        assert scheduler.get_slot(index)["iso"] == 100
+        index = scheduler.should_start(b + timedelta(hours=1, minutes=30))
+        assert scheduler.get_slot(index)["iso"] == 200
+
+    def test_next_future_timeslot(self):
+        b = self.base
+        scheduler = self.load([
+            make_slot(b + timedelta(hours=1), b + timedelta(hours=2), iso=200),
+            make_slot(b, b + timedelta(minutes=10), iso=100),
+        ])
+        assert scheduler.next_future_timeslot(b - timedelta(minutes=1))["iso"] == 100
+        assert scheduler.next_future_timeslot(b + timedelta(minutes=1))["iso"] == 200
+        assert scheduler.next_future_timeslot(b + timedelta(hours=3)) is None
+        assert scheduler.time_to_nearest_schedule(b + timedelta(minutes=50)) == 600
+        assert scheduler.time_to_nearest_schedule(b + timedelta(hours=3)) == -1
+
+    def test_empty_schedule(self):
+        scheduler = self.load([])
+        assert scheduler.should_start(self.base) == -1
+        assert scheduler.next_future_timeslot(self.base) is None
+
+
+class TestRecurringSlots:
+    base = datetime(2021, 8, 1, 0, 0, 0)
+
+    def load(self):
+        # 10 minutes every 2 hours for a year, plus one explicit slot.
+        scheduler = Scheduler()
+        scheduler.load_scheduler_data([
+            make_slot(self.base, self.base + timedelta(days=365),
+                      repeat={"every": 120, "duration": 10}, iso=100),
+            make_slot(self.base + timedelta(hours=1), self.base + timedelta(hours=1, minutes=5), iso=200),
+        ])
+        return scheduler
+
+    def test_window_stays_small(self):
+        scheduler = self.load()
+        scheduler.should_start(self.base + timedelta(days=200, minutes=5))
+        assert len(scheduler.schedule_data) <= 3
+
+    def test_active_occurrence(self):
+        scheduler = self.load()
+        now = self.base + timedelta(days=100, hours=4, minutes=3)
+        slot = scheduler.get_slot(scheduler.should_start(now))
+        assert slot["iso"] == 100
+        assert slot["start"] == self.base + timedelta(days=100, hours=4)
+        assert slot["stop"] == self.base + timedelta(days=100, hours=4, minutes=10)
+        assert scheduler.should_start(now + timedelta(minutes=20)) == -1
+
+    def test_next_occurrence(self):
+        scheduler = self.load()
+        now = self.base + timedelta(days=3, hours=2, minutes=3)
+        assert scheduler.next_future_timeslot(now)["start"] == self.base + timedelta(days=3, hours=4)
+        slot = scheduler.next_future_timeslot(self.base + timedelta(minutes=30))
+        assert slot["iso"] == 200
+
+    def test_no_occurrence_after_end(self):
+        scheduler = self.load()
+        now = self.base + timedelta(days=366)
+        assert scheduler.should_start(now) == -1
+        assert scheduler.next_future_timeslot(now) is None
+
+    def test_iter_slots(self):
+        scheduler = self.load()
+        slots = scheduler.iter_slots(self.base)
+        starts = [next(slots)["start"] for _ in range(4)]
+        assert starts == [
+            self.base,
+            self.base + timedelta(hours=1),
+            self.base + timedelta(hours=2),
+            self.base + timedelta(hours=4),
+        ]
+
+    def test_duration_longer_than_period_is_rejected(self):
+        with pytest.raises(ValueError):
+            Scheduler().load_scheduler_data([
+                make_slot(self.base, self.base + timedelta(days=1), repeat={"every": 10, "duration": 20}),
+            ])
+
+
+class TestWakeup:
+    base = datetime(2021, 8, 1, 12, 0, 0)
+
+    def test_next_boundary(self):
+        b = self.base
+        scheduler = Scheduler()
+        scheduler.load_scheduler_data([
+            make_slot(b, b + timedelta(minutes=10)),
+            make_slot(b + timedelta(hours=1), b + timedelta(hours=2)),
+        ])
+        assert scheduler.next_boundary(b - timedelta(minutes=5)) == b
+        assert scheduler.next_boundary(b + timedelta(minutes=5)) == b + timedelta(minutes=10)
+        assert scheduler.next_boundary(b + timedelta(minutes=15)) == b + timedelta(hours=1)
+        assert scheduler.next_boundary(b + timedelta(hours=3)) is None
+
+    def test_wake_ends_wait_early(self):
+        import threading
+        scheduler = Scheduler()
+        threading.Timer(0.05, scheduler.wake).start()
+        assert scheduler.wait_until(datetime.now() + timedelta(seconds=30)) is True
+
+    def test_wait_until_past_deadline_returns_immediately(self):
+        scheduler = Scheduler()
+        assert scheduler.wait_until(datetime.now() - timedelta(seconds=1)) is False
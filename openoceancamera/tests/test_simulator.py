@@ -0,0 +1,174 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+
+def slot(start, stop, **kwargs):
+    entry = {"start": start, "stop": stop}
+    entry.update(kwargs)
+    return entry
+
+
+class TestSimulator:
+    # The simulator replaces hardware modules in sys.modules, so it is run
+    # in its own process.
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def run(self, tmp_path, schedule, *args):
+        path = tmp_path / "schedule.json"
+        path.write_text(json.dumps(schedule))
+        result = subprocess.run(
+            [sys.executable, "-m", "simulator", str(path), *args],
+            cwd=self.root, stdout=subprocess.PIPE, check=True,
+        )
+        return json.loads(result.stdout)
+
+    def test_recurring_timelapse(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-03-00:00:00",
+                 repeat={"every": 120, "duration": 10}, frequency=60),
+        ])
+        assert summary["boots"] == 24
+        assert summary["slots_run"] == 24
+        # Frames every 60 s from when the camera is ready, 2 s into each
+        # 10 minute slot: 10 per slot, on time.
+        assert summary["files_by_type"] == {"jpg": 24 * 10, "preview": 24 * 10, "json": 24}
+        assert summary["missed_deadlines"] == 0
+
+    def test_sub_second_timelapse(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:01:00", frequency=0.5),
+        ])
+        # Every 0.5 s from 3.6 s (camera ready at 2 s, then auto exposure
+        # settles for 1.6 s) to 60 s inclusive
+        assert summary["files_by_type"] == {"jpg": 113, "preview": 113, "json": 1}
+        assert summary["missed_deadlines"] == 0
+
+    def test_stage_timings(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:01:00", frequency=5, wiper=True),
+        ])
+        stages = summary["stage_mean_ms"]
+        assert stages["capture.jpeg"] == 100.0
+        assert stages["wiper"] == 9000.0
+        assert stages["camera.configure"] == 2000.0
+        assert {"annotate", "exposure.settle", "pwm.switch_on", "pwm.switch_off", "quality", "writer.queue"} <= set(stages)
+        # The simulated scene is evenly lit and detailed
+        assert summary["unusable_frames"] == 0
+
+    def test_exposure_presets(self, tmp_path):
+        schedule = [
+            slot("2021-08-01-00:00:00", "2021-08-01-06:00:00",
+                 repeat={"every": 120, "duration": 10}, frequency=60),
+        ]
+        # The first slot waits for auto exposure, the other two start from its preset
+        summary = self.run(tmp_path, schedule)
+        assert summary["picamera"] == "1.13"
+        settle = summary["time_to_first_frame_ms"]
+        assert set(settle) == {"auto", "preset"}
+        assert settle["auto"] >= 1000
+        # The pinned picamera cannot set the gains: auto exposure is aimed
+        # at them through the ISO and frozen after a short wait
+        assert settle["preset"] < 500
+
+        summary = self.run(tmp_path, schedule, "--picamera", "1.14")
+        settle = summary["time_to_first_frame_ms"]
+        assert settle["auto"] >= 1000
+        assert settle["preset"] < 100
+
+    def test_raw_timelapse(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:01:00", frequency=5, raw=True),
+        ])
+        # Every 5 s from 3.6 s to 60 s, from the still port, each with 10 MB of raw data
+        assert summary["files_by_type"] == {"jpg": 12, "preview": 12, "json": 1}
+        assert summary["missed_deadlines"] == 0
+        assert summary["bytes_written"] > 12 * 10270208
+        assert summary["stage_mean_ms"]["capture.raw"] == 600.0
+
+    def test_bracketed_timelapse(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:01:00", frequency=10, bracket={"compensation": [-6, 0, 6]}),
+        ])
+        # Every 10 s from 3.6 s, three frames and a manifest each
+        assert summary["files_by_type"] == {"jpg": 6 * 3, "preview": 6, "json": 6 + 1}
+        assert summary["missed_deadlines"] == 0
+        # The first frame, then two more a frame apart at 30 fps
+        assert summary["stage_mean_ms"]["capture.bracket"] == 166.7
+
+    def test_burst(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:10:00", burst={"fps": 10, "duration": 5, "interval": 60}),
+        ])
+        # A burst a minute, 50 frames each, the first when the camera is ready
+        assert summary["files_by_type"] == {"jpg": 10 * 50, "json": 1}
+        assert summary["dropped_frames"] == 0
+        assert summary["missed_deadlines"] == 0
+
+    def test_segmented_video(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-01:00:00", video=True, framerate=30, segment_seconds=300),
+        ])
+        assert summary["files_by_type"] == {"h264": 12, "preview": 360, "json": 1}
+        assert summary["video_segments"] == 12
+
+    def test_quiet_triggered_slot_writes_nothing(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-01:00:00", video=True, framerate=30,
+                 trigger={"motion": 0.05, "depth_change": 0.5}),
+        ])
+        assert summary["trigger_events"] == 0
+        # Nothing but the stage timings
+        assert summary["files_by_type"] == {"json": 1}
+        assert summary["errors"] == []
+
+    def test_static_scene_is_suppressed(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-01:00:00", frequency=10,
+                 suppress={"threshold": 0.02, "max_skipped": 59}),
+        ])
+        # The simulated scene never changes: after the first two frames
+        # (the first has nothing to compare with), one full frame a minute.
+        # Only full frames get previews.
+        assert summary["files_by_type"] == {"jpg": 360, "preview": 7, "json": 1}
+        assert summary["suppressed_frames"] == 353
+        assert summary["bytes_written"] < 360 * 1920 * 1080 * 0.35 / 10
+
+    def test_close_slots_do_not_reboot(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:05:00", video=True, framerate=30),
+            slot("2021-08-01-00:10:00", "2021-08-01-00:15:00", upload=True),
+        ])
+        assert summary["boots"] == 1
+        assert summary["files_by_type"] == {"h264": 1, "preview": 30, "json": 1}
+        assert summary["upload_windows"] == [
+            {"start": "2021-08-01 00:10:00", "stop": "2021-08-01 00:15:00"},
+        ]
+
+    def test_back_to_back_slots_share_the_camera(self, tmp_path):
+        summary = self.run(tmp_path, [
+            slot("2021-08-01-00:00:00", "2021-08-01-00:04:59", frequency=30),
+            slot("2021-08-01-00:05:00", "2021-08-01-00:09:59", video=True, framerate=30),
+            slot("2021-08-01-00:10:00", "2021-08-01-00:15:00", frequency=30, resolution={"x": 1280, "y": 720}),
+        ])
+        assert summary["boots"] == 1
+        assert summary["camera_opens"] == 1
+        assert summary["errors"] == []
+
+
+class TestInstall:
+    def test_restore_takes_the_fakes_out(self):
+        from simulator import backends
+
+        before = dict(sys.modules)
+        with backends.install():
+            import picamera
+            session = importlib.import_module("camera.session")
+            assert session.PiCamera is backends.FakePiCamera
+            assert picamera.PiCamera is backends.FakePiCamera
+        # The fakes and the modules imported against them are gone
+        assert "picamera" not in sys.modules or sys.modules["picamera"] is before["picamera"]
+        assert "camera.session" not in sys.modules
+        assert {name: module for name, module in sys.modules.items() if name in before} == before
@@ -0,0 +1,84 @@
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from triggers import MotionDetector, SensorTrigger, changed_fraction, yuv_frame_size
+
+Sample = namedtuple("Sample", ["timestamp", "monotonic", "data"])
+
+
+@pytest.fixture
+def virtual_clock():
+    virtual_clock = VirtualClock(datetime(2021, 8, 1))
+    previous = clock.get_clock()
+    clock.set_clock(virtual_clock)
+    yield virtual_clock
+    clock.set_clock(previous)
+
+
+def frame(resolution, luma_value, changed=0):
+    luma, size = yuv_frame_size(resolution)
+    y = bytes([luma_value + 100]) * changed + bytes([luma_value]) * (luma - changed)
+    return y + bytes([128]) * (size - luma)
+
+
+class TestMotion:
+    def test_frame_size(self):
+        assert yuv_frame_size((64, 48)) == (3072, 4608)
+        # Padded to 32 x 16
+        assert yuv_frame_size((100, 50)) == (128 * 64, 128 * 64 * 3 // 2)
+
+    def test_changed_fraction(self):
+        assert changed_fraction(bytes(100), bytes(100)) == 0.0
+        assert changed_fraction(bytes(100), bytes([10]) * 100) == 0.0
+        assert changed_fraction(bytes(100), bytes([200]) * 25 + bytes(75)) == 0.25
+
+    def test_detector_fires_on_change(self, virtual_clock):
+        detector = MotionDetector(0.1, resolution=(64, 48), rate=5)
+        detector.write(frame((64, 48), 50))
+        virtual_clock.advance(0.2)
+        detector.write(frame((64, 48), 50, changed=100))
+        assert not detector.fired()
+        virtual_clock.advance(0.2)
+        detector.write(frame((64, 48), 50, changed=1000))
+        assert detector.fired()
+        # Cleared once read
+        assert not detector.fired()
+
+    def test_detector_handles_split_writes_and_rate(self, virtual_clock):
+        detector = MotionDetector(0.1, resolution=(64, 48), rate=5)
+        data = frame((64, 48), 50)
+        detector.write(data[:1000])
+        detector.write(data[1000:])
+        # Too soon after the last analysed frame, skipped
+        virtual_clock.advance(0.05)
+        detector.write(frame((64, 48), 50, changed=3000))
+        assert not detector.fired()
+        virtual_clock.advance(0.2)
+        detector.write(frame((64, 48), 50, changed=3000))
+        assert detector.fired()
+
+
+class TestSensorTrigger:
+    def test_fires_on_jumps(self):
+        trigger = SensorTrigger(luminosity_change=50, depth_change=0.5)
+        assert trigger.check(Sample(None, 0, {"luminosity": 10, "depth": 10.0})) is None
+        assert trigger.check(Sample(None, 5, {"luminosity": 40, "depth": 10.2})) is None
+        assert trigger.check(Sample(None, 10, {"luminosity": 200, "depth": 10.2})) == "luminosity"
+        assert trigger.check(Sample(None, 15, {"luminosity": 200, "depth": 9.0})) == "depth"
+
+    def test_same_sample_is_checked_once(self):
+        trigger = SensorTrigger(depth_change=0.5)
+        trigger.check(Sample(None, 0, {"depth": 10.0}))
+        jump = Sample(None, 5, {"depth": 12.0})
+        assert trigger.check(jump) == "depth"
+        assert trigger.check(jump) is None
+
+    def test_ignores_missing_readings(self):
+        trigger = SensorTrigger(depth_change=0.5)
+        trigger.check(Sample(None, 0, {"depth": -1}))
+        assert trigger.check(Sample(None, 5, {"depth": 10.0})) is None
+        assert trigger.check(None) is None
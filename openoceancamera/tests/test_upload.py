@@ -0,0 +1,98 @@
+import importlib
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+import clock
+from clock import VirtualClock
+from simulator import backends
+
+
+class Uploader(object):
+    """Keeps the names in each zip it is given, and takes `seconds` per upload."""
+
+    seconds = 0
+
+    def __init__(self):
+        self.zips = []
+
+    def upload_file(self, filename):
+        with zipfile.ZipFile(filename) as zipfh:
+            self.zips.append([name.split("/", 1)[1] for name in zipfh.namelist()])
+        clock.sleep(self.seconds)
+
+
+@pytest.fixture
+def drive(tmp_path):
+    drive = tmp_path / "OOCAM"
+    drive.mkdir()
+    entries = []
+    for name, score in (("a.jpg", 0.2), ("b.jpg", 0.9), ("c.jpg", 0.5), ("dark.jpg", 0.0)):
+        (drive / name).write_bytes(b"x" * 1000)
+        entries.append({"file": name, "score": score, "usable": name != "dark.jpg"})
+    (drive / "slot.quality.jsonl").write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+    return drive
+
+
+@pytest.fixture
+def uploader():
+    return Uploader()
+
+
+@pytest.fixture
+def upload(drive, uploader, monkeypatch):
+    previous = clock.get_clock()
+    clock.set_clock(VirtualClock(datetime(2021, 8, 1)))
+    with backends.install():
+        module = importlib.import_module("camera.upload")
+        monkeypatch.setattr(module, "EXTERNAL_DRIVE", str(drive))
+        monkeypatch.setattr(module, "PREVIEW_DIR", str(drive / "previews"))
+        monkeypatch.setattr(module, "S3Uploader", lambda: uploader)
+        monkeypatch.setattr(module, "UPLOAD_BATCH_BYTES", 1000)
+        yield module
+    clock.set_clock(previous)
+
+
+def slot(minutes):
+    return {"start": clock.now(), "stop": clock.now() + timedelta(minutes=minutes), "upload": True}
+
+
+class TestUpload:
+    def test_batches_best_first(self, upload, uploader, drive):
+        upload.start_upload(slot(10))
+        # The unusable photo stays on the drive; the zips are removed
+        assert uploader.zips == [["b.jpg"], ["c.jpg"], ["a.jpg"]]
+        assert sorted(path.name for path in drive.iterdir()) == [
+            "a.jpg", "b.jpg", "c.jpg", "dark.jpg", "slot.quality.jsonl", "uploads.txt",
+        ]
+
+    def test_batches_fill_up(self, upload, uploader, monkeypatch):
+        monkeypatch.setattr(upload, "UPLOAD_BATCH_BYTES", 2000)
+        upload.start_upload(slot(10))
+        assert uploader.zips == [["b.jpg", "c.jpg"], ["a.jpg"]]
+
+    def test_stops_at_the_end_of_the_slot(self, upload, uploader):
+        uploader.seconds = 60
+        upload.start_upload(slot(2))
+        # The best two made it before the slot ended
+        assert uploader.zips == [["b.jpg"], ["c.jpg"]]
+
+    def test_next_slot_carries_on(self, upload, uploader, drive):
+        uploader.seconds = 60
+        upload.start_upload(slot(2))
+        assert (drive / "uploads.txt").read_text().splitlines() == ["b.jpg", "c.jpg"]
+        # The next slot sends what the first did not reach, and nothing twice
+        upload.start_upload(slot(2))
+        assert uploader.zips == [["b.jpg"], ["c.jpg"], ["a.jpg"]]
+        upload.start_upload(slot(2))
+        assert len(uploader.zips) == 3
+
+    def test_failed_upload_is_not_recorded(self, upload, uploader, drive):
+        def upload_file(filename):
+            raise OSError("no network")
+
+        uploader.upload_file = upload_file
+        upload.start_upload(slot(10))
+        assert upload.read_manifest(str(drive)) == set()
@@ -0,0 +1 @@
+"""Offline tools for processing what the camera captured, run on a workstation rather than the Pi."""
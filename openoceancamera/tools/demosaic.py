@@ -0,0 +1,131 @@
+"""Develops the raw Bayer data of raw slot captures, in parallel.
+
+Run from the openoceancamera directory on a workstation with numpy:
+    python3 -m tools.demosaic /media/drive/*_raw*.jpg --out developed/
+    python3 -m tools.demosaic --bench 16           # throughput on synthetic V2 frames
+
+Each file is decoded, demosaiced and colour corrected (see tools/bayer.py)
+in a pool of worker processes, and written as a 16-bit PPM or as a numpy
+array. At the end the throughput is printed in frames per second.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy
+
+from tools import bayer
+
+# The V2 module's full sensor resolution, used for the synthetic frames
+BENCH_RESOLUTION = (3280, 2464)
+
+
+def develop(path: str, out_dir: str, options: Dict[str, Any]) -> str:
+    """Develops one capture and returns the path it was written to."""
+    with open(path, "rb") as f:
+        raw = bayer.decode(f.read())
+    rgb = bayer.demosaic(raw.mosaic, raw.bayer_order, options["method"])
+    rgb = bayer.colour_correct(rgb, black_level=raw.black_level, gains=options["gains"], matrix=options["matrix"])
+    image = bayer.to_uint16(rgb, options["gamma"])
+    name = os.path.splitext(os.path.basename(path))[0]
+    if options["format"] == "npy":
+        out_path = os.path.join(out_dir, f"{name}.npy")
+        numpy.save(out_path, image)
+    else:
+        out_path = os.path.join(out_dir, f"{name}.ppm")
+        bayer.write_ppm(out_path, image)
+    return out_path
+
+
+def _develop_task(task) -> Optional[str]:
+    path, out_dir, options = task
+    try:
+        return develop(path, out_dir, options)
+    except (OSError, ValueError) as err:
+        print(f"{path}: {err}", file=sys.stderr)
+        return None
+
+
+def develop_all(paths: Sequence[str], out_dir: str, options: Dict[str, Any], workers: Optional[int] = None) -> Dict[str, Any]:
+    """Develops `paths` in a pool of `workers` processes (one per CPU by default).
+
+    Returns:
+        The number of frames developed and failed, the time taken and the frames per second.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(path, out_dir, options) for path in paths]
+    started = time.perf_counter()
+    if workers == 1:
+        results = [_develop_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_develop_task, tasks))
+    seconds = time.perf_counter() - started
+    developed = sum(1 for result in results if result is not None)
+    return {
+        "frames": developed,
+        "failed": len(results) - developed,
+        "seconds": round(seconds, 3),
+        "fps": round(developed / seconds, 2) if seconds else 0.0,
+    }
+
+
+def write_synthetic_frames(directory: str, count: int, resolution=BENCH_RESOLUTION) -> List[str]:
+    """Writes `count` fake JPEG+raw captures of random noise, for benchmarking."""
+    width, height = resolution
+    rng = numpy.random.default_rng(0)
+    paths = []
+    for n in range(count):
+        mosaic = rng.integers(bayer.BLACK_LEVEL, bayer.WHITE_LEVEL + 1, size=(height, width), dtype=numpy.uint16)
+        path = os.path.join(directory, f"bench_raw{n:04d}.jpg")
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xd9")
+            f.write(bayer.make_raw_block(mosaic))
+        paths.append(path)
+    return paths
+
+
+def _floats(text: str, count: int) -> List[float]:
+    values = [float(value) for value in text.split(",")]
+    if len(values) != count:
+        raise argparse.ArgumentTypeError(f"expected {count} comma separated numbers")
+    return values
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="*", help="JPEG+raw captures of a raw slot")
+    parser.add_argument("--out", default="developed", help="directory to write the developed images to")
+    parser.add_argument("--format", choices=("ppm", "npy"), default="ppm")
+    parser.add_argument("--method", choices=("bilinear", "superpixel"), default="bilinear")
+    parser.add_argument("--gains", type=lambda text: _floats(text, 2), help="red,blue white balance gains (default: grey world)")
+    parser.add_argument("--matrix", type=lambda text: _floats(text, 9), help="3x3 colour correction matrix, row by row")
+    parser.add_argument("--linear", action="store_true", help="do not gamma encode")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--bench", type=int, metavar="N", help="develop N synthetic V2 frames and report the throughput")
+    args = parser.parse_args(argv)
+    options = {
+        "method": args.method,
+        "format": args.format,
+        "gains": args.gains,
+        "matrix": args.matrix,
+        "gamma": None if args.linear else 2.2,
+    }
+    if args.bench:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_synthetic_frames(directory, args.bench)
+            result = develop_all(paths, os.path.join(directory, "developed"), options, args.workers)
+    elif args.paths:
+        result = develop_all(args.paths, args.out, options, args.workers)
+    else:
+        parser.error("give the captures to develop, or --bench")
+    print(f"{result['frames']} frames ({result['failed']} failed) in {result['seconds']} s: {result['fps']} frames/s "
+          f"with {args.workers or os.cpu_count()} workers, {args.method}")
+
+
+if __name__ == "__main__":
+    main()
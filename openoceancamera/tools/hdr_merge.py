@@ -0,0 +1,238 @@
+"""Merges the exposure brackets of bracketed slots into single images, in parallel.
+
+Run from the openoceancamera directory on a workstation with numpy and Pillow:
+    python3 -m tools.hdr_merge /media/drive/*.bracket.json --out merged/
+    python3 -m tools.hdr_merge --bench 16          # throughput on synthetic brackets
+
+Each bracket (see save_bracket in camera/capture.py) is fused with exposure
+fusion (Mertens, Kautz and Van Reeth): every frame is weighted per pixel
+by how contrasty, saturated and well exposed it is there, and the frames
+are blended with those weights in a Laplacian pyramid, which hides the
+seams between them. Unlike merging to a radiance map and tone mapping it
+needs no exposure times or camera response, so brackets by compensation
+and by shutter speed are treated alike. The work is vectorised over all
+frames of a bracket at once with numpy; brackets are spread over a pool
+of worker processes.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from tools import bayer
+
+# The resolution of the synthetic brackets
+BENCH_RESOLUTION = (1920, 1080)
+# Spread of the well-exposedness weight around mid grey
+EXPOSEDNESS_SIGMA = 0.2
+# The pyramid stops when its top level would be smaller than this
+MIN_LEVEL_SIZE = 8
+
+_KERNEL = numpy.array([1, 4, 6, 4, 1], dtype=numpy.float32) / 16
+
+
+def _down(stack: numpy.ndarray) -> numpy.ndarray:
+    """Halves images of shape (frames, height, width, channels) after a separable 5-tap binomial blur.
+
+    The blur is only computed at the rows and columns that are kept.
+    """
+    height, width = stack.shape[1:3]
+    padded = numpy.pad(stack, ((0, 0), (2, 2), (0, 0), (0, 0)), mode="reflect")
+    rows = sum(weight * padded[:, i:i + height:2] for i, weight in enumerate(_KERNEL))
+    padded = numpy.pad(rows, ((0, 0), (0, 0), (2, 2), (0, 0)), mode="reflect")
+    return sum(weight * padded[:, :, i:i + width:2] for i, weight in enumerate(_KERNEL))
+
+
+def _up_axis(stack: numpy.ndarray, axis: int, size: int) -> numpy.ndarray:
+    """Doubles `stack` along `axis` to `size`, as zero-stuffing and blurring would away from the edges.
+
+    Only every other sample of a zero-stuffed signal is non-zero, so the even
+    outputs are (1 6 1) / 8 of the inputs around them and the odd ones the
+    mean of their two neighbours, which saves blurring all the zeros.
+    """
+    moved = numpy.moveaxis(stack, axis, 0)
+    padded = numpy.concatenate([moved[1:2], moved, moved[-2:-1]]) if len(moved) > 1 else numpy.concatenate([moved] * 3)
+    up = numpy.empty((size,) + moved.shape[1:], dtype=numpy.float32)
+    up[0::2] = (padded[:-2] + 6 * padded[1:-1] + padded[2:])[:(size + 1) // 2] / 8
+    up[1::2] = ((padded[1:-1] + padded[2:]) / 2)[:size // 2]
+    return numpy.moveaxis(up, 0, axis)
+
+
+def _up(stack: numpy.ndarray, shape) -> numpy.ndarray:
+    """Doubles the size of `stack` to the height and width of `shape`."""
+    return _up_axis(_up_axis(stack, 1, shape[1]), 2, shape[2])
+
+
+def fusion_weights(stack: numpy.ndarray, sigma: float = EXPOSEDNESS_SIGMA) -> numpy.ndarray:
+    """Weights each frame's pixels by contrast, saturation and well-exposedness.
+
+    Args:
+        stack: The frames of a bracket, (frames, height, width, 3), 0-1.
+
+    Returns:
+        The weights, (frames, height, width, 1), summing to 1 over the frames.
+    """
+    grey = stack.mean(axis=3, keepdims=True)
+    padded = numpy.pad(grey[..., 0], ((0, 0), (1, 1), (1, 1)), mode="edge")
+    contrast = numpy.abs(padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1] + padded[:, 1:-1, :-2]
+                         + padded[:, 1:-1, 2:] - 4 * padded[:, 1:-1, 1:-1])
+    saturation = numpy.sqrt(((stack - grey) ** 2).mean(axis=3))
+    # The product of a Gaussian per channel, as one exponential
+    exposedness = numpy.exp(((stack - 0.5) ** 2).sum(axis=3) * (-1 / (2 * sigma ** 2)))
+    weights = contrast * saturation * exposedness + 1e-12
+    weights /= weights.sum(axis=0)
+    return weights[..., None]
+
+
+def fuse(stack: numpy.ndarray, levels: Optional[int] = None) -> numpy.ndarray:
+    """Fuses the frames of a bracket into one image.
+
+    Args:
+        stack: The frames, (frames, height, width, 3), float32 0-1.
+        levels: Pyramid levels; by default as many as the size allows.
+
+    Returns:
+        The fused image, (height, width, 3), clipped to 0-1.
+    """
+    weights = fusion_weights(stack)
+    if levels is None:
+        levels = max(int(numpy.log2(min(stack.shape[1:3]) / MIN_LEVEL_SIZE)), 1)
+    fused = []
+    for level in range(levels):
+        if level == levels - 1:
+            laplacian = stack
+        else:
+            smaller = _down(stack)
+            laplacian = stack - _up(smaller, stack.shape)
+        fused.append((weights * laplacian).sum(axis=0, keepdims=True))
+        if level < levels - 1:
+            stack = smaller
+            weights = _down(weights)
+    image = fused.pop()
+    while fused:
+        detail = fused.pop()
+        image = _up(image, detail.shape) + detail
+    return numpy.clip(image[0], 0, 1)
+
+
+def read_bracket(manifest_path: str) -> numpy.ndarray:
+    """Reads the frames of a bracket that were written, as (frames, height, width, 3) float32 0-1."""
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    frames = []
+    for frame in manifest["frames"]:
+        if frame.get("dropped"):
+            continue
+        with Image.open(os.path.join(directory, frame["file"])) as image:
+            frames.append(numpy.asarray(image.convert("RGB"), dtype=numpy.float32) / 255)
+    if not frames:
+        raise ValueError("No frames in the bracket")
+    return numpy.stack(frames)
+
+
+def merge(manifest_path: str, out_dir: str, options: Dict[str, Any]) -> str:
+    """Merges one bracket and returns the path it was written to."""
+    image = fuse(read_bracket(manifest_path))
+    name = os.path.basename(manifest_path)[:-len(".bracket.json")]
+    if options["format"] == "ppm":
+        out_path = os.path.join(out_dir, f"{name}.ppm")
+        bayer.write_ppm(out_path, bayer.to_uint16(image))
+    else:
+        out_path = os.path.join(out_dir, f"{name}.jpg")
+        Image.fromarray((image * 255 + 0.5).astype(numpy.uint8)).save(out_path, quality=options["quality"])
+    return out_path
+
+
+def _merge_task(task) -> Optional[str]:
+    path, out_dir, options = task
+    try:
+        return merge(path, out_dir, options)
+    except (OSError, ValueError, KeyError) as err:
+        print(f"{path}: {err}", file=sys.stderr)
+        return None
+
+
+def merge_all(paths: Sequence[str], out_dir: str, options: Dict[str, Any], workers: Optional[int] = None) -> Dict[str, Any]:
+    """Merges the brackets of the manifests `paths` in a pool of `workers` processes (one per CPU by default).
+
+    Returns:
+        The number of brackets merged and failed, the time taken and the brackets per second.
+    """
+    if Image is None:
+        raise RuntimeError("Merging brackets needs Pillow to read the JPEGs: pip install Pillow")
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(path, out_dir, options) for path in paths]
+    started = time.perf_counter()
+    if workers == 1:
+        results = [_merge_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_merge_task, tasks))
+    seconds = time.perf_counter() - started
+    merged = sum(1 for result in results if result is not None)
+    return {
+        "brackets": merged,
+        "failed": len(results) - merged,
+        "seconds": round(seconds, 3),
+        "fps": round(merged / seconds, 2) if seconds else 0.0,
+    }
+
+
+def write_synthetic_brackets(directory: str, count: int, frames: int = 3, resolution=BENCH_RESOLUTION) -> List[str]:
+    """Writes `count` brackets of a random scene at `frames` exposures a stop apart, for benchmarking."""
+    width, height = resolution
+    rng = numpy.random.default_rng(0)
+    paths = []
+    for n in range(count):
+        scene = rng.random((height, width, 3), dtype=numpy.float32) ** 3
+        base = os.path.join(directory, f"bench_hdr{n:04d}")
+        manifest = {"frames": []}
+        for i in range(frames):
+            exposed = numpy.clip(scene * 2 ** i, 0, 1) ** (1 / 2.2)
+            path = f"{base}_{i}.jpg"
+            Image.fromarray((exposed * 255).astype(numpy.uint8)).save(path, quality=90)
+            manifest["frames"].append({"file": os.path.basename(path), "compensation": 6 * i, "dropped": False})
+        with open(f"{base}.bracket.json", "w") as f:
+            json.dump(manifest, f)
+        paths.append(f"{base}.bracket.json")
+    return paths
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="*", help=".bracket.json manifests of a bracketed slot")
+    parser.add_argument("--out", default="merged", help="directory to write the merged images to")
+    parser.add_argument("--format", choices=("jpg", "ppm"), default="jpg")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--bench", type=int, metavar="N", help="merge N synthetic brackets and report the throughput")
+    args = parser.parse_args(argv)
+    if Image is None:
+        parser.error("merging brackets needs Pillow to read the JPEGs: pip install Pillow")
+    options = {"format": args.format, "quality": args.quality}
+    if args.bench:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_synthetic_brackets(directory, args.bench)
+            result = merge_all(paths, os.path.join(directory, "merged"), options, args.workers)
+    elif args.paths:
+        result = merge_all(args.paths, args.out, options, args.workers)
+    else:
+        parser.error("give the bracket manifests to merge, or --bench")
+    print(f"{result['brackets']} brackets ({result['failed']} failed) in {result['seconds']} s: {result['fps']} brackets/s "
+          f"with {args.workers or os.cpu_count()} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Frame monitoring and event detectors.
+
+Triggered slots keep the last few seconds of video in memory and only
+write to the drive when something happens. Two kinds of event are
+detected here:
+
+- MotionDetector compares consecutive low resolution YUV frames, recorded
+  from a spare splitter port, and fires when enough of the picture changes.
+- SensorTrigger watches the readings of the background sensor sampler and
+  fires on a sudden change in luminosity or depth.
+
+numpy, which is in requirements.txt, computes the frame differences. The
+pure Python fallback is only for machines without it, e.g. to run the
+tests, and is tens of times slower.
+
+LumaMonitor, the YUV output the motion detector is built on, is also used
+by timelapse slots to spot redundant frames (see frame_filter.py).
+"""
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import clock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Resolution of the frames the motion detector looks at
+DETECTOR_RESOLUTION = (64, 48)
+# Bits per second of a triggered slot's H.264 video. The circular buffer
+# holds its last pre_seconds in memory, about 0.5 MB a second at this
+# rate; at picamera's default of 17 Mbps it would be over 2 MB a second.
+TRIGGER_BITRATE = 4000000
+# How much a pixel's brightness (0-255) must change to count as changed
+PIXEL_THRESHOLD = 25
+# Frames analysed per second at most; the others are skipped
+ANALYSIS_RATE = 5
+
+
+def yuv_frame_size(resolution: Tuple[int, int]) -> Tuple[int, int]:
+    """Returns the sizes of the Y plane and of a whole YUV420 frame as picamera writes them.
+
+    picamera pads the width to a multiple of 32 and the height to a multiple of 16.
+    """
+    width = (resolution[0] + 31) // 32 * 32
+    height = (resolution[1] + 15) // 16 * 16
+    luma = width * height
+    return luma, luma + 2 * (luma // 4)
+
+
+def changed_fraction(previous: bytes, current: bytes, threshold: int = PIXEL_THRESHOLD) -> float:
+    """Returns the fraction of pixels whose value changed by more than `threshold`."""
+    if not current:
+        return 0.0
+    if numpy is not None:
+        a = numpy.frombuffer(previous, dtype=numpy.uint8).astype(numpy.int16)
+        b = numpy.frombuffer(current, dtype=numpy.uint8).astype(numpy.int16)
+        return float(numpy.count_nonzero(numpy.abs(a - b) > threshold)) / len(current)
+    changed = sum(1 for a, b in zip(previous, current) if abs(a - b) > threshold)
+    return changed / len(current)
+
+
+class LumaMonitor(object):
+    """A picamera output that keeps the brightness (Y) plane of the newest YUV frame written to it.
+
+    Record to it from a splitter port that is not used for the main capture:
+
+        camera.start_recording(monitor, format="yuv", resize=DETECTOR_RESOLUTION, splitter_port=2)
+    """
+
+    def __init__(self, resolution: Tuple[int, int] = DETECTOR_RESOLUTION):
+        self._luma_size, self._frame_size = yuv_frame_size(resolution)
+        self._buffer = bytearray()
+        self._latest = None
+        self._frames = 0
+        self._new_frame = threading.Condition()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._frame_size:
+            luma = bytes(self._buffer[:self._luma_size])
+            del self._buffer[:self._frame_size]
+            with self._new_frame:
+                self._latest = luma
+                self._frames += 1
+                self._new_frame.notify_all()
+            self._on_frame(luma)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def _on_frame(self, luma: bytes) -> None:
+        pass
+
+    def latest(self) -> Optional[bytes]:
+        """Returns the Y plane of the newest frame, or None if there is none yet."""
+        with self._new_frame:
+            return self._latest
+
+    def next_frame(self, timeout: float) -> Optional[bytes]:
+        """Waits for a frame newer than the current one, for at most `timeout` seconds.
+
+        Returns:
+            The Y plane of the new frame, or of the newest one if none arrived in time.
+        """
+        with self._new_frame:
+            frames = self._frames
+            self._new_frame.wait_for(lambda: self._frames != frames, timeout)
+            return self._latest
+
+
+class MotionDetector(LumaMonitor):
+    """A LumaMonitor that looks for motion in the frames written to it."""
+
+    def __init__(self,
+                 fraction: float,
+                 resolution: Tuple[int, int] = DETECTOR_RESOLUTION,
+                 threshold: int = PIXEL_THRESHOLD,
+                 rate: float = ANALYSIS_RATE):
+        """
+        Args:
+            fraction: Fire when more than this fraction of the picture changes.
+            resolution: The resolution the frames are recorded at.
+            threshold: How much a pixel must change to count as changed.
+            rate: Frames analysed per second at most.
+        """
+        super().__init__(resolution)
+        self.fraction = fraction
+        self.threshold = threshold
+        self.interval = 1 / rate
+        self._previous = None
+        self._last_analysed = None
+        self._fired = threading.Event()
+        self.last_fraction = 0.0
+
+    def _on_frame(self, luma: bytes) -> None:
+        now = clock.monotonic()
+        if self._last_analysed is not None and now - self._last_analysed < self.interval:
+            return
+        self._last_analysed = now
+        if self._previous is not None:
+            self.last_fraction = changed_fraction(self._previous, luma, self.threshold)
+            if self.last_fraction > self.fraction:
+                self._fired.set()
+        self._previous = luma
+
+    def fired(self) -> bool:
+        """Returns whether motion was seen since the last call."""
+        if self._fired.is_set():
+            self._fired.clear()
+            return True
+        return False
+
+
+class SensorTrigger(object):
+    """Fires when consecutive sensor readings differ by more than a threshold."""
+
+    def __init__(self, luminosity_change: Optional[float] = None, depth_change: Optional[float] = None):
+        """
+        Args:
+            luminosity_change: Fire when luminosity changes by more than this, in lux.
+            depth_change: Fire when depth changes by more than this, in metres.
+        """
+        self.thresholds = {}
+        if luminosity_change:
+            self.thresholds["luminosity"] = luminosity_change
+        if depth_change:
+            self.thresholds["depth"] = depth_change
+        self._previous = None
+        self._last_seen = None
+
+    def check(self, sample) -> Optional[str]:
+        """Looks at the newest SensorSample.
+
+        Returns:
+            The name of the reading that changed, or None.
+        """
+        if not self.thresholds or sample is None or sample.monotonic == self._last_seen:
+            return None
+        self._last_seen = sample.monotonic
+        previous, self._previous = self._previous, sample.data
+        if previous is None:
+            return None
+        for key, threshold in self.thresholds.items():
+            before, after = previous.get(key, -1), sample.data.get(key, -1)
+            if before == -1 or after == -1:
+                continue
+            if abs(after - before) > threshold:
+                return key
+        return None
+
+
+def parse_trigger(trigger: Dict[str, Any]) -> Tuple[Optional[MotionDetector], SensorTrigger]:
+    """Builds the detectors for the "trigger" settings of a slot."""
+    detector = MotionDetector(trigger["motion"]) if trigger.get("motion") else None
+    return detector, SensorTrigger(trigger.get("luminosity_change"), trigger.get("depth_change"))